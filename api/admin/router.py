@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends, Query
+from api.auth import audit, cache, policy, revocation, throttle
+import pool_metrics
+import scheduler
+import slow_query_log
+
+router = APIRouter(
+    prefix="/api/v1/admin/metrics",
+    tags=["Admin"]
+)
+
+
+@router.get("/pool")
+async def get_pool_metrics(
+    claims: policy.Claims = Depends(policy.require("metrics:read"))
+):
+    """Connection pool occupancy and checkout wait times per engine (admin only)"""
+    return {"pools": pool_metrics.snapshot_all()}
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    claims: policy.Claims = Depends(policy.require("metrics:read"))
+):
+    """Slowest statement shapes ranked by total time, with sampled plans (admin only)"""
+    return {
+        "threshold_ms": slow_query_log.SLOW_QUERY_MS,
+        "statements": slow_query_log.top_offenders(limit),
+    }
+
+
+@router.get("/user-cache")
+async def get_user_cache_metrics(
+    claims: policy.Claims = Depends(policy.require("metrics:read"))
+):
+    """Hit/miss counters of the authenticated-user cache in this process (admin only)"""
+    return cache.principal_cache.stats()
+
+
+@router.get("/revocation")
+async def get_revocation_metrics(
+    claims: policy.Claims = Depends(policy.require("metrics:read"))
+):
+    """Revoked-token Bloom filter fill and lookup counters in this process (admin only)"""
+    return {
+        "filter": revocation.revocation_filter.stats(),
+        "jobs": scheduler.snapshot(),
+    }
+
+
+@router.get("/login-throttle")
+async def get_login_throttle_metrics(
+    claims: policy.Claims = Depends(policy.require("metrics:read"))
+):
+    """Login throttle state and audit writer counters in this process (admin only)"""
+    return {**throttle.stats(), "audit": audit.writer.stats()}
+
+
+@router.get("/token-cache")
+async def get_token_cache_metrics(
+    claims: policy.Claims = Depends(policy.require("metrics:read"))
+):
+    """Hit/miss counters of the verified access-token cache in this process (admin only)"""
+    return cache.token_cache.stats()
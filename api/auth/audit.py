@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, insert, select
+
+import scheduler
+from api.auth import model
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+LOGIN_AUDIT_BATCH_SIZE = int(os.getenv("LOGIN_AUDIT_BATCH_SIZE", "200"))
+LOGIN_AUDIT_FLUSH_MS = float(os.getenv("LOGIN_AUDIT_FLUSH_MS", "250"))
+# When this many attempts are waiting, record() blocks until the writer catches up
+LOGIN_AUDIT_MAX_QUEUE = int(os.getenv("LOGIN_AUDIT_MAX_QUEUE", "10000"))
+LOGIN_ATTEMPT_RETENTION_DAYS = int(os.getenv("LOGIN_ATTEMPT_RETENTION_DAYS", "90"))
+LOGIN_ATTEMPT_RETENTION_SECONDS = float(os.getenv("LOGIN_ATTEMPT_RETENTION_SECONDS", "3600"))
+# Rows deleted per statement, so retention never holds long locks
+RETENTION_DELETE_BATCH = 5000
+
+
+class LoginAuditWriter:
+    """
+    Buffers login_attempts rows in a bounded queue and writes them as
+    multi-row INSERTs, every LOGIN_AUDIT_BATCH_SIZE rows or
+    LOGIN_AUDIT_FLUSH_MS milliseconds, whichever comes first.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    async def record(
+        self,
+        username: str,
+        success: bool,
+        ip_address: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        failure_reason: Optional[str] = None,
+    ):
+        row = {
+            "username": username,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            # Stamped now, not when the batch is written
+            "attempt_time": model.utc_now(),
+            "success": success,
+            "failure_reason": failure_reason,
+        }
+        if self._task is None:
+            # Writer not running (scripts, startup failure): write straight through
+            await self._write([row])
+            return
+        self.queued += 1
+        await self._queue.put(row)
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=LOGIN_AUDIT_MAX_QUEUE)
+        self._task = asyncio.create_task(self._run(), name="login-audit")
+
+    async def stop(self):
+        """Flush everything queued, then stop"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _next_batch(self) -> tuple:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + LOGIN_AUDIT_FLUSH_MS / 1000
+        while batch[-1] is not None and len(batch) < LOGIN_AUDIT_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        stopping = batch[-1] is None
+        return [row for row in batch if row is not None], stopping
+
+    async def _run(self):
+        while True:
+            rows, stopping = await self._next_batch()
+            if rows:
+                await self._write(rows)
+            if stopping:
+                return
+
+    async def _write(self, rows: List[dict]):
+        for attempt in range(2):
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(model.LoginAttempt).values(rows))
+                    await db.commit()
+                self.written += len(rows)
+                self.batches += 1
+                return
+            except Exception as e:
+                if attempt:
+                    self.dropped += len(rows)
+                    logger.error(f"Dropped {len(rows)} login audit rows: {e}")
+                else:
+                    logger.warning(f"Login audit batch failed, retrying: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "queue_size": self._queue.qsize() if self._queue else 0,
+            "max_queue": LOGIN_AUDIT_MAX_QUEUE,
+            "queued": self.queued,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+
+writer = LoginAuditWriter()
+
+
+async def record_login_attempt(**kwargs):
+    await writer.record(**kwargs)
+
+
+def start_writer():
+    writer.start()
+
+
+async def stop_writer():
+    await writer.stop()
+
+
+async def prune_login_attempts(db, retention_days: int = LOGIN_ATTEMPT_RETENTION_DAYS) -> int:
+    """Delete attempts older than the retention period, a bounded batch per statement"""
+    cutoff = model.utc_now() - timedelta(days=retention_days)
+    total = 0
+    while True:
+        expired = (
+            select(model.LoginAttempt.id)
+            .where(model.LoginAttempt.attempt_time < cutoff)
+            .limit(RETENTION_DELETE_BATCH)
+        )
+        result = await db.execute(delete(model.LoginAttempt).where(model.LoginAttempt.id.in_(expired)))
+        await db.commit()
+        total += result.rowcount
+        if result.rowcount < RETENTION_DELETE_BATCH:
+            return total
+
+
+@scheduler.every(LOGIN_ATTEMPT_RETENTION_SECONDS, name="login-attempt-retention")
+async def _retention_job():
+    if LOGIN_ATTEMPT_RETENTION_DAYS <= 0:
+        return
+    async with AsyncSessionLocal() as db:
+        pruned = await prune_login_attempts(db)
+        if pruned:
+            logger.info(f"Pruned {pruned} login attempts older than {LOGIN_ATTEMPT_RETENTION_DAYS} days")
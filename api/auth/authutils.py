@@ -5,14 +5,13 @@ import uuid
 from datetime import datetime, timedelta, UTC
 
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status, Request
 from jwt import ExpiredSignatureError
 from dotenv import load_dotenv
-from . import crud, model
-from database import get_db
-from sqlalchemy.orm import Session
+from . import audit, cache, crud, hashing, model, throttle
+from database import get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional
 import logging
@@ -28,7 +27,8 @@ security = HTTPBearer()
 # security settings
 SECRET_KEY = os.getenv("SECRET_KEY", "")
 ALGORITHM = os.getenv("ALGORITHM", "")
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Kept short: role, status and location are trusted from the token until it expires
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
 REFRESH_TOKEN_EXPIRES_DAYS = 7
 
 # security = HTTPBearer()
@@ -37,7 +37,7 @@ REFRESH_TOKEN_EXPIRES_DAYS = 7
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = hashing.pwd_context
 
 
 oauth2_scheme = OAuth2PasswordBearer("/token")
@@ -61,6 +61,7 @@ class InvalidTokenError(Exception):
 
 
 # util functions
+# Blocking; async handlers await hashing.verify_password / hashing.hash_password
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -78,7 +79,7 @@ def create_access_token(data: dict):
     
     # Add role if not present
     if 'role' not in to_encode:
-        to_encode['role'] = 'feeder'  # Default role
+        to_encode['role'] = to_encode.get('roles', 'feeder')  # Default role
     
     # Set expiration
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -88,13 +89,22 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
+def decode_access_token(token: str) -> dict:
+    """jwt.decode with signature verification, memoized per token until it expires"""
+    payload = cache.token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        cache.token_cache.put(token, payload)
+    return payload
+
+
 def get_user_token(token: str = Depends(oauth2_scheme)):
     return token
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db=Depends(get_db)
-) -> model.DBUser:
+    db=Depends(get_async_db)
+) -> cache.UserPrincipal:
     """
     Dependency to get current authenticated user from access token
     """
@@ -106,18 +116,26 @@ async def get_current_user(
     
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = crud.find_user_by_username(username=username, db=db)
-    if user is None:
+    # Cache hits never touch the session, so no connection is checked out
+    principal = cache.principal_cache.get(username)
+    if principal is not None:
+        return principal
+
+    try:
+        user = await crud.find_user_by_username(username=username, db=db)
+    except crud.NotFoundError:
         raise credentials_exception
-    
-    return user
+
+    principal = cache.UserPrincipal(user)
+    cache.principal_cache.put(principal)
+    return principal
 
 async def get_current_active_user(
     current_user: model.DBUser = Depends(get_current_user)
@@ -131,15 +149,20 @@ async def get_current_active_user(
 
 def require_role(required_role: str):
     """
-    Dependency factory to require specific user role
+    Dependency factory to require specific user role, checked against the
+    token's claims (see policy.require for per-action rules)
     """
-    def role_checker(current_user: model.DBUser = Depends(get_current_active_user)):
-        if current_user.role != required_role:
+    from api.auth import policy  # policy imports this module
+
+    def role_checker(claims=Depends(policy.get_claims)):
+        if claims.status != "active":
+            raise HTTPException(status_code=400, detail="Inactive user")
+        if claims.role != required_role:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not enough permissions"
             )
-        return current_user
+        return claims
     return role_checker
 
 
@@ -169,15 +192,15 @@ def create_refresh_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
-def authenticate_user(username: str, password: str, db):
-    user = crud.find_user_by_username(username=username, db=db)
+async def authenticate_user(username: str, password: str, db):
+    user = await crud.find_user_by_username(username=username, db=db)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User does not exist"
         )
 
-    if not verify_password(password, user.password):
+    if not await hashing.verify_password(password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Password or email not found"
@@ -210,7 +233,7 @@ async def validate_refresh_token(db, refresh_token) -> str:
         if jti is None:
             raise credentials_exception
 
-        if crud.is_jti_blacklisted(jti, db):
+        if await crud.is_jti_blacklisted(jti, db):
             raise credentials_exception
 
         username = payload.get("sub")
@@ -230,12 +253,14 @@ async def validate_refresh_token(db, refresh_token) -> str:
         raise HTTPException(401, err)
 
 
-def blacklist_token(token: str, db=Depends(get_db)):
+async def blacklist_token(token: str, db=Depends(get_async_db)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM)
         jti = payload.get("jti", "")
-        db_jti = model.DBBlacklistedToken(jti)
-        crud.revoke_jti(db_jti=db_jti, db=db)
+        # Keep the token's expiry so the row can be pruned once it is useless
+        expires_at = datetime.fromtimestamp(payload["exp"], UTC).replace(tzinfo=None) if "exp" in payload else None
+        db_jti = model.DBBlacklistedToken(jti, expires_at=expires_at)
+        await crud.revoke_jti(db_jti=db_jti, db=db)
     except JWTError:
         raise credentials_exception
 
@@ -250,33 +275,44 @@ class LoginSecurityManager:
         self.max_attempts = max_attempts
         self.lockout_duration_minutes = lockout_duration_minutes
         self.attempt_window_minutes = attempt_window_minutes
+        # Lockout decisions come from in-memory sliding windows; attempts are
+        # batched by the audit writer and lockout rows are written behind
+        self.throttle = throttle.LoginThrottle(
+            max_attempts=max_attempts,
+            lockout_duration_minutes=lockout_duration_minutes,
+            attempt_window_minutes=attempt_window_minutes,
+        )
+
+    @staticmethod
+    def _client(request: Optional[Request]) -> tuple:
+        if request is None:
+            return None, None
+        ip_address = request.client.host if request.client else None
+        return ip_address, request.headers.get("user-agent")
     
-    def check_account_status(self, db: Session, username: str) -> dict:
+    async def check_account_status(self, db: AsyncSession, username: str) -> dict:
         """
         Check if account can attempt login
         Returns dict with status info
         """
-        # Clean up expired lockouts first
-        crud.LoginAttemptsCRUD.cleanup_expired_lockouts(db)
-        
+        await self.throttle.ensure_loaded()
         # Check if account is currently locked
-        is_locked, lockout = crud.LoginAttemptsCRUD.is_account_locked(db, username)
+        lockout = self.throttle.lockout(username)
         
-        if is_locked and lockout:
-            remaining_time = lockout.unlock_at - datetime.utcnow()
-            remaining_minutes = int(remaining_time.total_seconds() / 60)
+        if lockout:
+            unlock_at, failed_attempts = lockout
+            remaining_minutes = int((unlock_at - time.time()) / 60)
             
             return {
                 "can_attempt": False,
                 "is_locked": True,
-                "unlock_at": lockout.unlock_at,
+                "unlock_at": throttle.as_datetime(unlock_at),
                 "remaining_minutes": max(0, remaining_minutes),
-                "failed_attempts": lockout.failed_attempts
+                "failed_attempts": failed_attempts
             }
         
         # Check recent failed attempts
-        since = datetime.utcnow() - timedelta(minutes=self.attempt_window_minutes)
-        failed_count = crud.LoginAttemptsCRUD.get_failed_attempts_count(db, username, since)
+        failed_count = self.throttle.by_username.count(username)
         
         return {
             "can_attempt": failed_count < self.max_attempts,
@@ -285,24 +321,20 @@ class LoginSecurityManager:
             "attempts_remaining": max(0, self.max_attempts - failed_count)
         }
     
-    def record_failed_attempt(
+    async def record_failed_attempt(
         self,
-        db: Session,
+        db: AsyncSession,
         username: str,
         request: Optional[Request] = None,
         failure_reason: str = "Invalid credentials"
     ):
         """Record a failed login attempt and lock account if necessary"""
-        ip_address = None
-        user_agent = None
-        
-        if request:
-            ip_address = request.client.host if request.client else None
-            user_agent = request.headers.get("user-agent")
+        await self.throttle.ensure_loaded()
+        ip_address, user_agent = self._client(request)
         
         # Record the attempt
-        crud.LoginAttemptsCRUD.record_login_attempt(
-            db=db,
+        failed_count = self.throttle.record_failure(username, ip_address)
+        await audit.record_login_attempt(
             username=username,
             success=False,
             ip_address=ip_address,
@@ -311,12 +343,10 @@ class LoginSecurityManager:
         )
         
         # Check if we need to lock the account
-        since = datetime.utcnow() - timedelta(minutes=self.attempt_window_minutes)
-        failed_count = crud.LoginAttemptsCRUD.get_failed_attempts_count(db, username, since)
-        
         if failed_count >= self.max_attempts:
-            crud.LoginAttemptsCRUD.lock_account(
-                db=db,
+            self.throttle.lock(username, failed_count)
+            await throttle.write_behind(
+                crud.LoginAttemptsCRUD.lock_account,
                 username=username,
                 lockout_duration_minutes=self.lockout_duration_minutes,
                 failed_attempts=failed_count
@@ -337,44 +367,55 @@ class LoginSecurityManager:
             "attempts_remaining": self.max_attempts - failed_count
         }
     
-    def record_successful_attempt(
+    async def record_successful_attempt(
         self,
-        db: Session,
+        db: AsyncSession,
         username: str,
         request: Optional[Request] = None
     ):
         """Record a successful login attempt and reset failed attempts"""
-        ip_address = None
-        user_agent = None
-        
-        if request:
-            ip_address = request.client.host if request.client else None
-            user_agent = request.headers.get("user-agent")
+        await self.throttle.ensure_loaded()
+        ip_address, user_agent = self._client(request)
         
         # Record successful attempt
-        crud.LoginAttemptsCRUD.record_login_attempt(
-            db=db,
+        await audit.record_login_attempt(
             username=username,
             success=True,
             ip_address=ip_address,
             user_agent=user_agent
         )
         
-        # Reset failed attempts
-        crud.LoginAttemptsCRUD.reset_failed_attempts(db, username)
+        # Reset failed attempts; only a lockout row needs clearing in the table
+        had_lockout = self.throttle.lockout(username) is not None
+        self.throttle.unlock(username)
+        if had_lockout:
+            await throttle.write_behind(crud.LoginAttemptsCRUD.reset_failed_attempts, username=username)
+
+    async def unlock(self, db: AsyncSession, username: str) -> bool:
+        """Manually unlock an account (admin)"""
+        self.throttle.unlock(username)
+        return await crud.LoginAttemptsCRUD.unlock_account(db, username)
     
-    def validate_can_attempt_login(self, db: Session, username: str):
+    async def validate_can_attempt_login(self, db: AsyncSession, username: str, request: Optional[Request] = None):
         """Validate if user can attempt login, raise exception if not"""
-        status = self.check_account_status(db, username)
+        await self.throttle.ensure_loaded()
+        ip_address, _ = self._client(request)
+        if self.throttle.ip_blocked(ip_address):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many failed attempts from this address. Try again later."
+            )
+
+        account_status = await self.check_account_status(db, username)
         
-        if not status["can_attempt"]:
-            if status["is_locked"]:
+        if not account_status["can_attempt"]:
+            if account_status["is_locked"]:
                 raise HTTPException(
                     status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail=f"Account is locked. Try again in {status['remaining_minutes']} minutes."
+                    detail=f"Account is locked. Try again in {account_status['remaining_minutes']} minutes."
                 )
             else:
-                remaining = status.get("attempts_remaining", 0)
+                remaining = account_status.get("attempts_remaining", 0)
                 raise HTTPException(
                     status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                     detail=f"Too many failed attempts. {remaining} attempts remaining."
@@ -0,0 +1,230 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from api.auth import model
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "1000"))
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+
+PRINCIPAL_FIELDS = (
+    "id", "username", "email", "password", "role", "status", "provider",
+    "hashed_otp", "location_id", "created_at", "updated_at",
+)
+
+
+class UserPrincipal:
+    """
+    Detached, read-only copy of the DBUser fields routes read from
+    `current_user`. Safe to share between requests, unlike an ORM instance.
+    """
+
+    __slots__ = PRINCIPAL_FIELDS + ("location_name",)
+
+    def __init__(self, user: model.DBUser):
+        for field in PRINCIPAL_FIELDS:
+            object.__setattr__(self, field, getattr(user, field))
+        object.__setattr__(self, "location_name", user.location_name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UserPrincipal is read-only")
+
+    def __repr__(self) -> str:
+        return f"UserPrincipal(id={self.id}, username={self.username!r}, role={self.role!r})"
+
+
+class PrincipalCache:
+    """
+    Bounded TTL + LRU cache of user principals keyed by username.
+
+    Invalidation is per process: writes made here evict immediately, while
+    other workers pick up the change once the TTL runs out.
+    """
+
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._usernames_by_id = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, username: str) -> Optional[UserPrincipal]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(username)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return principal
+
+    def put(self, principal: UserPrincipal):
+        if self.ttl_seconds <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[principal.username] = (principal, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(principal.username)
+            self._usernames_by_id[principal.id] = principal.username
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, username: Optional[str] = None, user_id: Optional[int] = None):
+        with self._lock:
+            if user_id is not None and username is None:
+                username = self._usernames_by_id.get(user_id)
+            if username is not None and username in self._entries:
+                self._remove(username)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._usernames_by_id.clear()
+
+    def _remove(self, username: str):
+        principal, _ = self._entries.pop(username)
+        if self._usernames_by_id.get(principal.id) == username:
+            del self._usernames_by_id[principal.id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_SIZE)
+
+
+class VerifiedTokenCache:
+    """
+    LRU cache of access-token claims that already passed signature
+    verification, keyed by a SHA-256 of the token and kept until the
+    token's own `exp`. Dashboards re-send the same token on every poll,
+    so most requests skip jwt.decode.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                # Fall through to jwt.decode, which reports the expiry
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: dict):
+        expires_at = payload.get("exp")
+        if self.max_size <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+token_cache = VerifiedTokenCache(TOKEN_CACHE_MAX_SIZE)
+
+
+def invalidate_user(username: Optional[str] = None, user_id: Optional[int] = None):
+    """Hook for writes that bypass the ORM unit of work (raw SQL, bulk UPDATE)"""
+    principal_cache.invalidate(username=username, user_id=user_id)
+
+
+# Users changed or deleted in a flush are evicted once the transaction
+# commits, so a concurrent request cannot re-cache the pre-commit row.
+# Renaming a location changes every member's location_name, so it clears all.
+@event.listens_for(Session, "after_flush")
+def _collect_user_changes(session, flush_context):
+    usernames = session.info.setdefault("stale_principals", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, model.DBUser):
+            usernames.add(obj.username)
+            # A renamed user is still cached under the old username
+            usernames.update(name for name in inspect(obj).attrs.username.history.deleted or () if name)
+        elif isinstance(obj, model.DBLocation):
+            session.info["stale_all_principals"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    usernames = session.info.pop("stale_principals", set())
+    if session.info.pop("stale_all_principals", False):
+        principal_cache.clear()
+        return
+    for username in usernames:
+        principal_cache.invalidate(username=username)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_user_changes(session, previous_transaction):
+    session.info.pop("stale_principals", None)
+    session.info.pop("stale_all_principals", None)
@@ -1,6 +1,8 @@
+from sqlalchemy import select, func, update
 from sqlalchemy.orm import joinedload
-from api.auth import model, schema
-from sqlalchemy.orm import Session
+from api.auth import model, revocation, schema
+from api.pagination import PageParams, build_page, keyset
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta
 import logging
@@ -14,245 +16,259 @@ class NotFoundError(Exception):
     pass
 
 
-def read_users(db):
-    """Get all users with their location information"""
-    return db.query(model.DBUser).options(joinedload(model.DBUser.location)).all()
+async def read_users(
+    db: AsyncSession,
+    page: PageParams,
+    location_id: Optional[int] = None,
+    location_name: Optional[str] = None,
+    role: Optional[str] = None,
+):
+    """Get one page of users with their location information, optionally filtered"""
+    statement = select(model.DBUser).options(joinedload(model.DBUser.location))
+    if location_id:
+        statement = statement.filter(model.DBUser.location_id == location_id)
+    elif location_name:
+        statement = statement.join(
+            model.DBLocation, model.DBUser.location_id == model.DBLocation.id
+        ).filter(model.DBLocation.name == location_name)
+    if role:
+        statement = statement.filter(model.DBUser.role == role)
 
+    result = await db.execute(keyset(statement, model.DBUser, page))
+    return build_page(result.scalars().all(), page)
 
-def read_all_admin(db):
-    """Get all admin users with their location information"""
-    return (db.query(model.DBUser)
-            .options(joinedload(model.DBUser.location))
-            .filter(model.DBUser.role == 'admin')
-            .all())
+
+async def read_all_admin(db: AsyncSession, page: PageParams):
+    """Get one page of admin users with their location information"""
+    return await read_users(db, page, role='admin')
 
 
-def read_feeder_role(db):
+async def read_feeder_role(db: AsyncSession):
     """Get first feeder user with location information"""
-    feeder = (db.query(model.DBUser)
-              .options(joinedload(model.DBUser.location))
-              .filter(model.DBUser.role == 'feeder')
-              .first())
-    print(f'feeder found: {feeder}')
+    result = await db.execute(
+        select(model.DBUser)
+        .options(joinedload(model.DBUser.location))
+        .filter(model.DBUser.role == 'feeder')
+    )
+    feeder = result.scalars().first()
     if feeder is None:
         return None
     return feeder
 
 
-def find_by_username(username: str, db):
+async def find_by_username(username: str, db: AsyncSession):
     """Find user by username with location information"""
-    user = (db.query(model.DBUser)
-            .options(joinedload(model.DBUser.location))
-            .filter(model.DBUser.username == username)
-            .first())
+    result = await db.execute(
+        select(model.DBUser)
+        .options(joinedload(model.DBUser.location))
+        .filter(model.DBUser.username == username)
+    )
+    user = result.scalars().first()
     if user is None:
         raise NotFoundError("user not found")
     
     return user
 
 
-def find_user_by_email(email: str, db):
+async def find_user_by_email(email: str, db: AsyncSession):
     """Find user by email with location information"""
-    user = (db.query(model.DBUser)
-            .options(joinedload(model.DBUser.location))
-            .filter(model.DBUser.email == email)
-            .first())
+    result = await db.execute(
+        select(model.DBUser)
+        .options(joinedload(model.DBUser.location))
+        .filter(model.DBUser.email == email)
+    )
+    user = result.scalars().first()
     if user is None:
         raise NotFoundError("email does not exist")
 
     return user
 
 
-def find_user_by_id(user_id: int, db) -> model.DBUser:
+async def find_user_by_id(user_id: int, db: AsyncSession) -> model.DBUser:
     """Find user by ID with location information"""
-    user = (db.query(model.DBUser)
-            .options(joinedload(model.DBUser.location))
-            .filter(model.DBUser.id == user_id)
-            .first())
+    result = await db.execute(
+        select(model.DBUser)
+        .options(joinedload(model.DBUser.location))
+        .filter(model.DBUser.id == user_id)
+    )
+    user = result.scalars().first()
     if not user:
         raise NotFoundError("User not found")
 
     return user
 
 
-def find_user_by_username(username: str, db):
+async def find_user_by_username(username: str, db: AsyncSession):
     """Find user by username (alternative method)"""
-    user = (db.query(model.DBUser)
-            .options(joinedload(model.DBUser.location))
-            .filter(model.DBUser.username == username)
-            .first())
+    result = await db.execute(
+        select(model.DBUser)
+        .options(joinedload(model.DBUser.location))
+        .filter(model.DBUser.username == username)
+    )
+    user = result.scalars().first()
     if user is None:
         raise NotFoundError(f"{username} not found")
     return user
 
 
-def get_user_by_email(email: str, db, provider: str = 'custom'):
+async def get_user_by_email(email: str, db: AsyncSession, provider: str = 'custom'):
     """Get user by email and provider with location information"""
-    return (db.query(model.DBUser)
-            .options(joinedload(model.DBUser.location))
-            .filter(
-                model.DBUser.email == email, 
-                model.DBUser.provider == provider
-            )
-            .first())
+    result = await db.execute(
+        select(model.DBUser)
+        .options(joinedload(model.DBUser.location))
+        .filter(
+            model.DBUser.email == email, 
+            model.DBUser.provider == provider
+        )
+    )
+    return result.scalars().first()
 
 
-def get_users_by_location(location_id: int, db):
-    try:
-        # First check if location exists
-        location = db.query(model.DBLocation).filter(model.DBLocation.id == location_id).first()
-        print(f"Location {location_id} exists: {location is not None}")
-        
-        users = (db.query(model.DBUser)
-                .options(joinedload(model.DBUser.location))
-                .filter(model.DBUser.location_id == location_id)
-                .all())
-        
-        print(f"Found {len(users)} users for location_id {location_id}")
-        return users
-        
-    except Exception as e:
-        print(f"Error in get_users_by_location: {str(e)}")
-        import traceback
-        traceback.print_exc()  # This will show the full stack trace
-        raise
+async def get_users_by_location(location_id: int, db: AsyncSession):
+    result = await db.execute(
+        select(model.DBUser)
+        .options(joinedload(model.DBUser.location))
+        .filter(model.DBUser.location_id == location_id)
+    )
+    return result.scalars().all()
 
 
-def get_users_by_location_name(location_name: str, db):
+async def get_users_by_location_name(location_name: str, db: AsyncSession):
     """Get all users for a specific location by location name"""
     try:
         # Method 1: Using explicit join condition
-        users = (db.query(model.DBUser)
-                .join(model.DBLocation, model.DBUser.location_id == model.DBLocation.id)
-                .options(joinedload(model.DBUser.location))
-                .filter(model.DBLocation.name == location_name)
-                .all())
-        
-        print(f"Found {len(users)} users for location '{location_name}'")
-        return users
+        result = await db.execute(
+            select(model.DBUser)
+            .join(model.DBLocation, model.DBUser.location_id == model.DBLocation.id)
+            .options(joinedload(model.DBUser.location))
+            .filter(model.DBLocation.name == location_name)
+        )
+        return result.scalars().all()
         
     except Exception as e:
-        print(f"Error in get_users_by_location_name: {str(e)}")
+        logger.warning(f"Error in get_users_by_location_name, retrying by location id: {e}")
         # Fallback method using subquery
         try:
-            location = db.query(model.DBLocation).filter(model.DBLocation.name == location_name).first()
+            result = await db.execute(select(model.DBLocation).filter(model.DBLocation.name == location_name))
+            location = result.scalars().first()
             if not location:
-                print(f"No location found with name: {location_name}")
                 return []
             
-            users = (db.query(model.DBUser)
-                    .options(joinedload(model.DBUser.location))
-                    .filter(model.DBUser.location_id == location.id)
-                    .all())
-            
-            print(f"Fallback method found {len(users)} users for location '{location_name}'")
-            return users
+            result = await db.execute(
+                select(model.DBUser)
+                .options(joinedload(model.DBUser.location))
+                .filter(model.DBUser.location_id == location.id)
+            )
+            return result.scalars().all()
             
         except Exception as fallback_error:
-            print(f"Fallback method also failed: {str(fallback_error)}")
+            logger.error(f"Fallback method also failed: {fallback_error}")
             raise e
 
 
-def create_reset_code(email: str, reset_code: str, db: Session):
+async def create_reset_code(email: str, reset_code: str, db: AsyncSession):
     new_code = model.DBReset(email=email, reset_code=reset_code)
     db.add(new_code)
-    db.commit()
-    db.refresh(new_code)
+    await db.commit()
+    await db.refresh(new_code)
     return new_code
 
 
-def save_user(db: Session, db_user: schema.UserCreate):  
+async def _load_user_with_location(user_id: int, db: AsyncSession):
+    """Re-select a user with its location eagerly loaded, overwriting stale state"""
+    result = await db.execute(
+        select(model.DBUser)
+        .options(joinedload(model.DBUser.location))
+        .filter(model.DBUser.id == user_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+
+async def save_user(db: AsyncSession, db_user: schema.UserCreate):  
     user_data = db_user.dict() if hasattr(db_user, "dict") else db_user
     db_user = model.DBUser(**user_data)  # Map Pydantic model to SQLAlchemy model
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     # Load the location relationship after creation
-    db.refresh(db_user)
-    user_with_location = (db.query(model.DBUser)
-                         .options(joinedload(model.DBUser.location))
-                         .filter(model.DBUser.id == db_user.id)
-                         .first())
-    return user_with_location
+    return await _load_user_with_location(db_user.id, db)
 
 
-def create_user(db_user: model.DBUser, db: Session):
+async def create_user(db_user: model.DBUser, db: AsyncSession):
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     # Load the location relationship after creation
-    user_with_location = (db.query(model.DBUser)
-                         .options(joinedload(model.DBUser.location))
-                         .filter(model.DBUser.id == db_user.id)
-                         .first())
+    user_with_location = await _load_user_with_location(db_user.id, db)
     return schema.User(**user_with_location.__dict__)
 
 
-def update_user(user_id: int, updated_data: dict, db: Session):
+async def update_user(user_id: int, updated_data: dict, db: AsyncSession):
     """Update user with location information included in response"""
-    user = (db.query(model.DBUser)
-            .options(joinedload(model.DBUser.location))
-            .filter(model.DBUser.id == user_id)
-            .first())
+    result = await db.execute(
+        select(model.DBUser)
+        .options(joinedload(model.DBUser.location))
+        .filter(model.DBUser.id == user_id)
+    )
+    user = result.scalars().first()
 
     if not user:
         return None
     
-    print('received updated data', updated_data)
     for key, value in updated_data.items():
         if value is not None and value != 'string':
-            print(f'updating {key} to {value}')
             setattr(user, key, value)
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
     # Reload with location information after update
-    updated_user = (db.query(model.DBUser)
-                   .options(joinedload(model.DBUser.location))
-                   .filter(model.DBUser.id == user_id)
-                   .first())
+    updated_user = await _load_user_with_location(user_id, db)
     return updated_user
 
-def delete_user(user_id: int, db):
-    user = db.query(model.DBUser).filter(model.DBUser.id == user_id).first()
+async def delete_user(user_id: int, db: AsyncSession):
+    result = await db.execute(select(model.DBUser).filter(model.DBUser.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise NotFoundError("User not found")
     
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
     return {"message": f"user: {user_id} has been successfully deleted"}
 
 
-def revoke_jti(db_jti: model.DBBlacklistedToken, db: Session):
+async def revoke_jti(db_jti: model.DBBlacklistedToken, db: AsyncSession):
     db.add(db_jti)
-    db.commit()
-    db.refresh(db_jti)
+    await db.commit()
+    await db.refresh(db_jti)
+    revocation.add(db_jti.jti)
+
 
+async def is_jti_blacklisted(jti: str, db: AsyncSession) -> bool:
+    # Most refresh tokens were never revoked; the Bloom filter rules those out
+    # without a query and only possible hits are confirmed in the database
+    if not revocation.might_be_revoked(jti):
+        return False
 
-def is_jti_blacklisted(jti: str, db: Session) -> bool:
-    blacklisted_token = (
-        db.query(model.DBBlacklistedToken)
+    result = await db.execute(
+        select(model.DBBlacklistedToken)
         .filter(model.DBBlacklistedToken.jti == jti)  # type: ignore
-        .first()
     )
+    blacklisted_token = result.scalars().first()
 
     return str(blacklisted_token) == jti
 
 
-def check_reset_password_token(reset_password_token: str, db: Session):
+async def check_reset_password_token(reset_password_token: str, db: AsyncSession):
     # ten_minutes_ago = datetime.utcnow() - timedelta(minutes=10)
 
-    token = db.query(model.DBReset).filter(
+    result = await db.execute(select(model.DBReset).filter(
         # model.DBReset.status == '',
         model.DBReset.reset_code == reset_password_token,
         # model.DBReset.expired >= ten_minutes_ago
-    ).first()
+    ))
+    token = result.scalars().first()
     
     if token is None:
         raise NotFoundError('no token was found')
 
-    print(token, 'this is token <<<<<<<<')
-    print(token.reset_code, 'this is reset code <<<<<<<')
     return token
 
 
@@ -261,8 +277,8 @@ logger = logging.getLogger(__name__)
 class LoginAttemptsCRUD:
     
     @staticmethod
-    def record_login_attempt(
-        db: Session,
+    async def record_login_attempt(
+        db: AsyncSession,
         username: str,
         success: bool,
         ip_address: Optional[str] = None,
@@ -278,39 +294,44 @@ class LoginAttemptsCRUD:
             failure_reason=failure_reason
         )
         db.add(attempt)
-        db.commit()
-        db.refresh(attempt)
+        await db.commit()
         return attempt
     
     @staticmethod
-    def get_failed_attempts_count(
-        db: Session,
+    async def get_failed_attempts_count(
+        db: AsyncSession,
         username: str,
         since: datetime
     ) -> int:
         """Get count of failed login attempts since a specific time"""
-        return db.query(model.LoginAttempt).filter(
-            model.LoginAttempt.username == username,
-            not model.LoginAttempt.success,
-            model.LoginAttempt.attempt_time >= since
-        ).count()
+        result = await db.execute(
+            select(func.count(model.LoginAttempt.id)).filter(
+                model.LoginAttempt.username == username,
+                model.LoginAttempt.success.is_(False),
+                model.LoginAttempt.attempt_time >= since
+            )
+        )
+        return result.scalar() or 0
     
     @staticmethod
-    def get_recent_attempts(
-        db: Session,
+    async def get_recent_attempts(
+        db: AsyncSession,
         username: str,
         hours: int = 1
     ) -> List[model.LoginAttempt]:
         """Get recent login attempts for a user"""
         since = datetime.utcnow() - timedelta(hours=hours)
-        return db.query(model.LoginAttempt).filter(
-            model.LoginAttempt.username == username,
-            model.LoginAttempt.attempt_time >= since
-        ).order_by(model.LoginAttempt.attempt_time.desc()).all()
+        result = await db.execute(
+            select(model.LoginAttempt).filter(
+                model.LoginAttempt.username == username,
+                model.LoginAttempt.attempt_time >= since
+            ).order_by(model.LoginAttempt.attempt_time.desc())
+        )
+        return result.scalars().all()
     
     @staticmethod
-    def lock_account(
-        db: Session,
+    async def lock_account(
+        db: AsyncSession,
         username: str,
         lockout_duration_minutes: int = 15,
         failed_attempts: int = 0
@@ -318,14 +339,18 @@ class LoginAttemptsCRUD:
         """Lock an account for a specified duration"""
         unlock_at = datetime.utcnow() + timedelta(minutes=lockout_duration_minutes)
         
-        # Check if lockout already exists
-        existing_lockout = db.query(model.AccountLockout).filter(
-            model.AccountLockout.username == username,
-            model.AccountLockout.is_active
-        ).first()
+        # Check if lockout already exists; username is unique, so an
+        # expired or unlocked row is reactivated rather than duplicated
+        result = await db.execute(
+            select(model.AccountLockout).filter(
+                model.AccountLockout.username == username
+            )
+        )
+        existing_lockout = result.scalars().first()
         
         if existing_lockout:
             # Update existing lockout
+            existing_lockout.is_active = True
             existing_lockout.locked_at = datetime.utcnow()
             existing_lockout.unlock_at = unlock_at
             existing_lockout.failed_attempts = failed_attempts
@@ -339,29 +364,35 @@ class LoginAttemptsCRUD:
             )
             db.add(lockout)
         
-        db.commit()
-        db.refresh(lockout)
+        await db.commit()
+        await db.refresh(lockout)
         logger.warning(f"Account locked: {username} until {unlock_at}")
         return lockout
     
     @staticmethod
-    def is_account_locked(db: Session, username: str) -> tuple[bool, Optional[model.AccountLockout]]:
+    async def is_account_locked(db: AsyncSession, username: str) -> tuple[bool, Optional[model.AccountLockout]]:
         """Check if an account is currently locked"""
-        lockout = db.query(model.AccountLockout).filter(
-            model.AccountLockout.username == username,
-            model.AccountLockout.is_active,
-            model.AccountLockout.unlock_at > datetime.utcnow()
-        ).first()
+        result = await db.execute(
+            select(model.AccountLockout).filter(
+                model.AccountLockout.username == username,
+                model.AccountLockout.is_active,
+                model.AccountLockout.unlock_at > datetime.utcnow()
+            )
+        )
+        lockout = result.scalars().first()
         
         return (lockout is not None, lockout)
     
     @staticmethod
-    def unlock_account(db: Session, username: str) -> bool:
+    async def unlock_account(db: AsyncSession, username: str) -> bool:
         """Manually unlock an account or clean up expired lockouts"""
-        lockouts = db.query(model.AccountLockout).filter(
-            model.AccountLockout.username == username,
-            model.AccountLockout.is_active
-        ).all()
+        result = await db.execute(
+            select(model.AccountLockout).filter(
+                model.AccountLockout.username == username,
+                model.AccountLockout.is_active
+            )
+        )
+        lockouts = result.scalars().all()
         
         unlocked = False
         for lockout in lockouts:
@@ -369,30 +400,31 @@ class LoginAttemptsCRUD:
             unlocked = True
         
         if unlocked:
-            db.commit()
+            await db.commit()
             logger.info(f"Account unlocked: {username}")
         
         return unlocked
     
     @staticmethod
-    def cleanup_expired_lockouts(db: Session) -> int:
-        """Clean up expired lockouts"""
-        expired_lockouts = db.query(model.AccountLockout).filter(
-            model.AccountLockout.is_active,
-            model.AccountLockout.unlock_at <= datetime.utcnow()
-        ).all()
-        
-        count = len(expired_lockouts)
-        for lockout in expired_lockouts:
-            lockout.is_active = False
+    async def cleanup_expired_lockouts(db: AsyncSession) -> int:
+        """Clean up expired lockouts (scheduled, not per login)"""
+        result = await db.execute(
+            update(model.AccountLockout)
+            .where(
+                model.AccountLockout.is_active,
+                model.AccountLockout.unlock_at <= datetime.utcnow()
+            )
+            .values(is_active=False)
+        )
+        await db.commit()
         
+        count = result.rowcount
         if count > 0:
-            db.commit()
             logger.info(f"Cleaned up {count} expired lockouts")
         
         return count
     
     @staticmethod
-    def reset_failed_attempts(db: Session, username: str):
+    async def reset_failed_attempts(db: AsyncSession, username: str):
         """Reset failed attempts counter after successful login"""
-        LoginAttemptsCRUD.unlock_account(db, username)
\ No newline at end of file
+        await LoginAttemptsCRUD.unlock_account(db, username)
\ No newline at end of file
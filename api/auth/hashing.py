@@ -0,0 +1,74 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from passlib.context import CryptContext
+
+# bcrypt costs ~100-300 ms of CPU per call; run it in worker processes so it
+# neither blocks the event loop nor contends for the GIL.
+# HASH_WORKERS=0 falls back to threads (bcrypt releases the GIL).
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Calls queued beyond this wait in the event loop instead of piling up in the pool
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(max(1, HASH_WORKERS) * 4)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending: Optional[asyncio.Semaphore] = None
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    try:
+        return pwd_context.verify(password, hashed_password)
+    except (ValueError, TypeError):
+        # Malformed or empty stored hash
+        return False
+
+
+def start():
+    """Create the worker pool; called from the app lifespan"""
+    global _executor, _pending
+    if HASH_WORKERS > 0 and _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    _pending = asyncio.Semaphore(HASH_MAX_PENDING)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def _run(function, *args):
+    global _executor
+    if _pending is None:
+        start()
+    async with _pending:
+        if _executor is None:
+            return await asyncio.to_thread(function, *args)
+        loop = asyncio.get_running_loop()
+        executor = _executor
+        try:
+            return await loop.run_in_executor(executor, function, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM killed); replace the pool and retry once.
+            # Concurrent calls on the same pool fail together; only the first replaces it.
+            if _executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+            return await loop.run_in_executor(_executor, function, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run(_verify, password, hashed_password)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Float, Boolean
+from sqlalchemy import Column, String, Integer, Date, DateTime, ForeignKey, Float, Boolean, CheckConstraint, Index, DDL, event, false, true
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.hybrid import hybrid_property
 from base import Base
@@ -6,10 +6,18 @@ from datetime import datetime, timezone
 from pydantic import validator
 
 status_option = ['active', 'inactive', 'suspended']
-role_option = ['admin', 'feeder', 'manager']
+role_option = ['admin', 'feeder', 'manager', 'counter']
 status_of_delivery = ["pending", "delivered", "cancelled", "progress"]
 
 
+def utc_now() -> datetime:
+    """
+    Current UTC time without tzinfo. The DateTime columns are timestamp
+    without time zone, and asyncpg rejects aware datetimes for them.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class DBUser(Base):
     __tablename__ = 'users'
 
@@ -18,16 +26,26 @@ class DBUser(Base):
     password = Column(String)
     role = Column(String, default='feeder')
     username = Column(String)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utc_now)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
     status = Column(String, nullable=False)
     provider = Column(String, default='custom')
     hashed_otp = Column(String, default="")
     location_id = Column(Integer, ForeignKey("locations.id"), nullable=True)
+    # Embedded in access tokens as `ver`; bumping it invalidates tokens already issued
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Fixed relationship with explicit foreign_keys
     location = relationship("DBLocation", foreign_keys=[location_id], back_populates="users")
 
+    __table_args__ = (
+        # find_by_username / find_user_by_username run on every authenticated request
+        Index("ix_users_username", "username"),
+        Index("ix_users_location_id", "location_id"),
+        # Keyset pagination order, see api/pagination.py
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
+
     @hybrid_property
     def location_name(self):
         """"Get the location name from the related location"""
@@ -68,12 +86,27 @@ class LoginAttempt(Base):
     __tablename__ = "login_attempts"
     
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, index=True, nullable=False)
+    username = Column(String, nullable=False)
     ip_address = Column(String, nullable=True)
     user_agent = Column(String, nullable=True)
     attempt_time = Column(DateTime, default=datetime.utcnow)
     success = Column(Boolean, default=False)
     failure_reason = Column(String, nullable=True)
+
+    __table_args__ = (
+        # get_recent_attempts: username = ? AND attempt_time >= ? ORDER BY attempt_time DESC
+        Index("ix_login_attempts_username_attempt_time", "username", "attempt_time"),
+        # Failure counts (get_failed_attempts_count, LoginThrottle.load) only look at failures
+        Index(
+            "ix_login_attempts_failed_username_attempt_time",
+            "username",
+            "attempt_time",
+            postgresql_where=success == false(),
+            sqlite_where=success == false(),
+        ),
+        # Retention deletes by age alone
+        Index("ix_login_attempts_attempt_time", "attempt_time"),
+    )
     
 
 class AccountLockout(Base):
@@ -86,6 +119,66 @@ class AccountLockout(Base):
     failed_attempts = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
 
+    __table_args__ = (
+        # is_account_locked: username = ? AND is_active AND unlock_at > now
+        Index("ix_account_lockouts_username_active_unlock_at", "username", "is_active", "unlock_at"),
+        # cleanup_expired_lockouts / LoginThrottle.sync_lockouts: is_active and unlock_at range
+        Index(
+            "ix_account_lockouts_active_unlock_at",
+            "unlock_at",
+            postgresql_where=is_active == true(),
+            sqlite_where=is_active == true(),
+        ),
+    )
+
+
+class DBEmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    # May carry a live OTP or reset code; cleared once the row is sent or failed
+    body = Column(String, nullable=True)
+    # pending -> sending -> sent, or failed once attempts run out
+    status = Column(String, nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    # When the row may next be claimed; also the lease expiry while sending
+    next_attempt_at = Column(DateTime, nullable=False, default=utc_now)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=utc_now)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # The worker only ever scans rows that still need sending
+        Index(
+            "ix_email_outbox_due",
+            "next_attempt_at",
+            postgresql_where=status.in_(['pending', 'sending']),
+            sqlite_where=status.in_(['pending', 'sending']),
+        ),
+        # Retention deletes finished rows by age
+        Index(
+            "ix_email_outbox_finished_created_at",
+            "created_at",
+            postgresql_where=status.in_(['sent', 'failed']),
+            sqlite_where=status.in_(['sent', 'failed']),
+        ),
+    )
+
+    def __init__(
+        self,
+        recipient: str | None = None,
+        subject: str | None = None,
+        body: str | None = None,
+    ):
+        self.recipient = recipient
+        self.subject = subject
+        self.body = body
+        self.status = 'pending'
+        self.attempts = 0
+        self.next_attempt_at = utc_now()
+
 
 class DBLocation(Base):
     __tablename__ = "locations"
@@ -96,8 +189,8 @@ class DBLocation(Base):
     region = Column(String)
     manager_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     status = Column(String, default='active')
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utc_now)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
     
     # Fixed relationships with explicit foreign_keys
     coops = relationship("DBCoops", back_populates="location")
@@ -106,14 +199,25 @@ class DBLocation(Base):
     buyers = relationship("DBBuyer", back_populates="location")
     expenditures = relationship("DBExpenditure", back_populates="location")
 
+    __table_args__ = (
+        Index("ix_locations_created_at_id", "created_at", "id"),
+    )
+
 
 class DBBlacklistedToken(Base):
     __tablename__ = "blacklisted_tokens"
     id = Column(Integer, primary_key=True, index=True)
     jti = Column(String, unique=True, nullable=False)
+    # The token's own `exp`; rows past it can be pruned since the JWT no longer validates
+    expires_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_blacklisted_tokens_expires_at", "expires_at"),
+    )
 
-    def __init__(self, jti: str):
+    def __init__(self, jti: str, expires_at: datetime = None):
         self.jti = jti
+        self.expires_at = expires_at
 
     def __repr__(self) -> str:
         return str(self.jti)
@@ -131,6 +235,10 @@ class DBReset(Base):
     expired = Column(DateTime)
     hashed_otp = Column(String, default="")
 
+    __table_args__ = (
+        Index("ix_reset_password_reset_code", "reset_code"),
+    )
+
     def __init__(
         self,
         id: int | None = None,
@@ -146,33 +254,97 @@ class DBReset(Base):
         self.hashed_otp = hashed_otp
 
 
+# Daily figures every whole coop version must have. A delta version may
+# leave them NULL, so the NOT NULL lives in a CHECK on is_delta instead.
+COOP_REQUIRED_FIGURES = (
+    "total_fowls", "total_dead_fowls", "total_feed", "collection_date",
+    "crates_collected", "remainder_eggs", "broken_eggs", "notes", "efficiency",
+)
+COOP_FIGURES_CHECK = "is_delta OR ({})".format(
+    " AND ".join(f"{name} IS NOT NULL" for name in COOP_REQUIRED_FIGURES)
+)
+
+
 class DBCoops(Base):
     __tablename__ = "coop"
 
     id = Column(Integer, primary_key=True, index=True)
     parent_id = Column(Integer, ForeignKey("coop.id"), nullable=True)
+    # First version of this coop, shared by every later version; NULL on the
+    # first version itself (see coop_key)
+    root_id = Column(Integer, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     status = Column(String, nullable=False)
-    total_fowls = Column(Integer, nullable=False, default=0)
-    total_dead_fowls = Column(Integer, nullable=False, default=0)
-    total_feed = Column(Integer, nullable=False, default=0)
-    coop_name = Column(String, index=True)
+    # The daily figures below are NULL on a delta version where they equal
+    # the next version's (see is_delta); ck_coop_whole_version_figures
+    # requires them on every other version
+    total_fowls = Column(Integer, default=0)
+    total_dead_fowls = Column(Integer, default=0)
+    total_feed = Column(Integer, default=0)
+    coop_name = Column(String)
     egg_count = Column(Integer, default=0)
-    collection_date = Column(String, nullable=False)
-    crates_collected = Column(Integer, nullable=False, default=0)
-    remainder_eggs = Column(Integer, nullable=False, default=0)
-    broken_eggs = Column(Integer, nullable=False, default=0)
-    notes = Column(String, nullable=False)
-    efficiency = Column(Float, nullable=False, default=0)
+    collection_date = Column(String)
+    crates_collected = Column(Integer, default=0)
+    remainder_eggs = Column(Integer, default=0)
+    broken_eggs = Column(Integer, default=0)
+    notes = Column(String)
+    efficiency = Column(Float, default=0)
     location_id = Column(Integer, ForeignKey("locations.id"), nullable=False)
+    # True only on the current version of each coop; cleared on the version a
+    # new one replaces, in the same transaction (crud.create_coop_version)
+    is_head = Column(Boolean, nullable=False, default=True, server_default=true())
+    # Delta history (COOP_HISTORY_MODE=delta): a superseded version keeps only
+    # the figures that differ from the version that replaced it
+    is_delta = Column(Boolean, nullable=False, default=False, server_default=false())
+    # Delta versions directly before this one; bounds reconstruction walks
+    delta_depth = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Fixed relationships
     location = relationship("DBLocation", back_populates="coops")
     user = relationship("DBUser", foreign_keys=[user_id])
     # buyers = relationship("DBBuyer", back_populates="coop")  # Added relationship for buyers
 
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utc_now)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+    __table_args__ = (
+        CheckConstraint(COOP_FIGURES_CHECK, name="ck_coop_whole_version_figures"),
+        Index("ix_coop_created_at_id", "created_at", "id"),
+        Index("ix_coop_location_id_created_at_id", "location_id", "created_at", "id"),
+        # read_coop_by_user_id (active only) and find_coop_by_user_id
+        Index("ix_coop_user_id_status", "user_id", "status"),
+        # read_coop_by_coop_name: latest version of a coop first
+        Index("ix_coop_coop_name_created_at", coop_name, created_at.desc()),
+        # Walking a coop's version chain by parent
+        Index("ix_coop_parent_id", "parent_id"),
+        # Current state of every coop: these cover only head rows, so reads
+        # scale with the number of coops rather than their history
+        Index(
+            "ix_coop_head_created_at_id",
+            "created_at",
+            "id",
+            postgresql_where=is_head == true(),
+            sqlite_where=is_head == true(),
+        ),
+        Index(
+            "ix_coop_head_location_id_created_at_id",
+            "location_id",
+            "created_at",
+            "id",
+            postgresql_where=is_head == true(),
+            sqlite_where=is_head == true(),
+        ),
+    )
+
+    @classmethod
+    def is_latest_version(cls):
+        """SQL condition: the row is the current version of its coop"""
+        return cls.is_head == true()
+
+    @property
+    def coop_key(self) -> int:
+        """Identifies the coop across all its versions"""
+        return self.root_id or self.id
 
     def __init__(
         self,
@@ -211,6 +383,47 @@ class DBCoops(Base):
         self.location_id = location_id
 
 
+class DBCoopDailyProduction(Base):
+    """
+    One row per coop per collection day, written alongside each coop
+    version. On PostgreSQL the table is range-partitioned by month on
+    collection_date (api.coop.production keeps the partitions ahead of
+    time), so date-range queries only read the months they cover.
+    """
+    __tablename__ = "coop_daily_production"
+
+    # DBCoops.coop_key: the coop's first version
+    coop_id = Column(Integer, ForeignKey("coop.id", ondelete="CASCADE"), primary_key=True)
+    collection_date = Column(Date, primary_key=True)
+    location_id = Column(Integer, ForeignKey("locations.id"), nullable=False)
+    egg_count = Column(Integer, nullable=False, default=0)
+    crates_collected = Column(Integer, nullable=False, default=0)
+    broken_eggs = Column(Integer, nullable=False, default=0)
+    total_feed = Column(Integer, nullable=False, default=0)
+    total_dead_fowls = Column(Integer, nullable=False, default=0)
+    total_fowls = Column(Integer, nullable=False, default=0)
+    recorded_at = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+    __table_args__ = (
+        Index("ix_coop_daily_production_location_id_collection_date", "location_id", "collection_date"),
+        {"postgresql_partition_by": "RANGE (collection_date)"},
+    )
+
+
+# Takes any date without a monthly partition, so a backdated or mistyped
+# collection_date never fails the write. create_all only builds the parent
+# table; api.coop.production splits default rows out as their month arrives.
+PRODUCTION_DEFAULT_PARTITION = "coop_daily_production_default"
+event.listen(
+    DBCoopDailyProduction.__table__,
+    "after_create",
+    DDL(
+        f"CREATE TABLE IF NOT EXISTS {PRODUCTION_DEFAULT_PARTITION} "
+        "PARTITION OF coop_daily_production DEFAULT"
+    ).execute_if(dialect="postgresql"),
+)
+
+
 class DBBuyer(Base):
     __tablename__ = "buyer"
 
@@ -227,10 +440,16 @@ class DBBuyer(Base):
     # coop = relationship("DBCoops", back_populates="buyers")
     location = relationship("DBLocation", back_populates="buyers")
 
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utc_now)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
     by = Column(String, nullable=False)
 
+    __table_args__ = (
+        Index("ix_buyer_created_at_id", "created_at", "id"),
+        Index("ix_buyer_location_id_created_at_id", "location_id", "created_at", "id"),
+        Index("ix_buyer_name", "name"),
+    )
+
     def __init__(
         self,
         id: int | None = None,
@@ -266,13 +485,22 @@ class DBExpenditure(Base):
     approved_by = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     location_id = Column(Integer, ForeignKey("locations.id"), nullable=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utc_now)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
 
     # Added relationship
     user = relationship("DBUser", foreign_keys=[user_id])
     location = relationship("DBLocation", back_populates="expenditures")
 
+    __table_args__ = (
+        Index("ix_expenditure_location_category_status", "location_id", "category", "status"),
+        Index("ix_expenditure_created_at_id", "created_at", "id"),
+        Index("ix_expenditure_location_id_created_at_id", "location_id", "created_at", "id"),
+        Index("ix_expenditure_category_created_at_id", "category", "created_at", "id"),
+        Index("ix_expenditure_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_expenditure_reference", "reference"),
+    )
+
     def __init__(
         self,
         id: int | None = None,
@@ -1,16 +1,13 @@
+import hashlib
+import hmac
 import os
-import smtplib
-
-import ssl
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 from pyotp import TOTP
 # from api.auth.email_config import SMTP_EMAIL,SMTP_PASSWORD, SMTP_SERVER, SMTP_PORT
 # from email.message import EmailMessage
-from api.auth import authutils, model
+from api.auth import authutils, hashing, model
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 
 
@@ -32,82 +29,48 @@ class EmailError(Exception):
 OTP_SECRET_KEY = os.getenv("OTP_SECRET_KEY", "")
 totp = TOTP(OTP_SECRET_KEY, interval=1800)
 
+# OTPs are short-lived and attempt-limited, so a keyed HMAC protects the
+# stored value without paying bcrypt's cost on every login
+OTP_HMAC_KEY = (os.getenv("OTP_HMAC_KEY") or authutils.SECRET_KEY).encode()
+if not OTP_HMAC_KEY:
+    # An empty key would make every stored digest computable from the code alone
+    raise RuntimeError("Set OTP_HMAC_KEY (or SECRET_KEY) to key the stored OTP digests")
+OTP_HMAC_PREFIX = "hmac-sha256$"
+
+
+def otp_digest(code: str, user_id: int) -> str:
+    # Binding the user id means a stored digest is useless for any other account
+    mac = hmac.new(OTP_HMAC_KEY, f"{user_id}:{code}".encode(), hashlib.sha256)
+    return OTP_HMAC_PREFIX + mac.hexdigest()
+
 
-def generate_and_store_otp(user: model.DBUser, db: Session) -> str:
+async def otp_matches(entered_otp: str, stored_otp: str, user_id: int) -> bool:
+    if stored_otp.startswith(OTP_HMAC_PREFIX):
+        return hmac.compare_digest(otp_digest(entered_otp, user_id), stored_otp)
+    # bcrypt hashes issued before the switch to HMAC
+    return await hashing.verify_password(entered_otp, stored_otp)
+
+
+async def generate_and_store_otp(user: model.DBUser, db: AsyncSession) -> str:
     code = totp.now()
-    hashed_code = authutils.pwd_context.hash(code)
-    user.hashed_otp = hashed_code
-    db.commit()
-    db.refresh(user)
+    user.hashed_otp = otp_digest(code, user.id)
+    await db.commit()
     return code
 
 
-def verify_otp(entered_otp: str, user: model.DBUser, db: Session):
+async def verify_otp(entered_otp: str, user: model.DBUser, db: AsyncSession):
     stored_otp = user.hashed_otp
 
-    if stored_otp is None:
+    if not stored_otp:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="no otp entered"
         )
 
-    if authutils.verify_password(entered_otp, stored_otp) is not True:
+    if await otp_matches(entered_otp, stored_otp, user.id) is not True:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="wrong otp pls try again"
         )
 
     return totp.verify(entered_otp)
-
-
-async def send_otp_to_user(subject: str, body: str, recipient_email: str):
-    try:
-        # Create message using MIMEMultipart for better compatibility
-        message = MIMEMultipart()
-        message["Subject"] = subject
-        message["From"] = SMTP_EMAIL
-        message["To"] = recipient_email
-        
-        # Add body to email
-        message.attach(MIMEText(body, "plain"))
-        
-        print(f"SMTP Config - Server: {SMTP_SERVER}, Port: {SMTP_PORT}")
-        print(f"From: {SMTP_EMAIL}, To: {recipient_email}")
-        
-        # Create secure SSL context
-        context = ssl.create_default_context()
-        
-        # Use SMTP_SSL for port 465 or SMTP with starttls for port 587
-        if int(SMTP_PORT) == 465:
-            # Gmail SMTP SSL
-            with smtplib.SMTP_SSL(SMTP_SERVER, int(SMTP_PORT), context=context) as server:
-                print("SSL connection established")
-                server.login(SMTP_EMAIL, SMTP_PASSWORD)
-                print("Authentication successful")
-                server.sendmail(SMTP_EMAIL, recipient_email, message.as_string())
-                print("Authentication successful")
-        else:
-            # Gmail SMTP with STARTTLS (port 587)
-            with smtplib.SMTP(SMTP_SERVER, int(SMTP_PORT)) as server:
-                server.starttls(context=context)
-                server.login(SMTP_EMAIL, SMTP_PASSWORD)
-                server.sendmail(SMTP_EMAIL, recipient_email, message.as_string())
-        
-        return "Message delivered successfully"
-        
-    except smtplib.SMTPAuthenticationError as e:
-        print(f"SMTP Authentication failed: {e}")
-        print("Please check your email and app password")
-        raise EmailError("Authentication failed - check email credentials")
-    except smtplib.SMTPRecipientsRefused as e:
-        print(f"Recipients refused: {e}")
-        raise EmailError("Invalid recipient email address")
-    except smtplib.SMTPServerDisconnected as e:
-        print(f"SMTP server disconnected: {e}")
-        raise EmailError("Email server connection lost")
-    except smtplib.SMTPException as e:
-        print(f"SMTP error: {e}")
-        raise EmailError(f"Email sending failed: {str(e)}")
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        raise EmailError(f"Failed to send email: {str(e)}")
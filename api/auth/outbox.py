@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import random
+import smtplib
+import ssl
+import time
+from datetime import timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import scheduler
+from api.auth import model, otp
+from database import AsyncSessionLocal, env_flag
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_WORKER = env_flag("EMAIL_OUTBOX_WORKER", True)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+# Idle poll; enqueues in this process wake the worker immediately
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "10"))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", "900"))
+# A claimed row is re-claimable after this, in case its worker died mid-send
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+# Idle connections are NOOP-checked before reuse after this long
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", "30"))
+SMTP_STARTTLS = env_flag("SMTP_STARTTLS", True)
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Sent and failed rows (already scrubbed of their body) are deleted after this
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+OUTBOX_RETENTION_SECONDS = float(os.getenv("OUTBOX_RETENTION_SECONDS", "3600"))
+# Rows deleted per statement, so retention never holds long locks
+RETENTION_DELETE_BATCH = 5000
+
+
+async def enqueue_email(db: AsyncSession, subject: str, body: str, recipient_email: str) -> model.DBEmailOutbox:
+    """Persist an email for the background sender; returns once it is committed"""
+    message = model.DBEmailOutbox(recipient=recipient_email, subject=subject, body=body)
+    db.add(message)
+    await db.commit()
+    worker.wake()
+    return message
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with jitter: 10s, 20s, 40s, ... capped"""
+    delay = min(OUTBOX_MAX_BACKOFF_SECONDS, OUTBOX_BACKOFF_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class SMTPConnection:
+    """
+    One SMTP session kept open between batches. Only the outbox worker uses
+    it, always from a worker thread, so the event loop never blocks on SMTP.
+    """
+
+    def __init__(self):
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        port = int(otp.SMTP_PORT)
+        context = ssl.create_default_context()
+        if port == 465:
+            server = smtplib.SMTP_SSL(otp.SMTP_SERVER, port, context=context, timeout=SMTP_TIMEOUT)
+        else:
+            server = smtplib.SMTP(otp.SMTP_SERVER, port, timeout=SMTP_TIMEOUT)
+            if SMTP_STARTTLS:
+                server.starttls(context=context)
+        if otp.SMTP_PASSWORD:
+            server.login(otp.SMTP_EMAIL, otp.SMTP_PASSWORD)
+        return server
+
+    def _ensure(self) -> smtplib.SMTP:
+        if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_CHECK_SECONDS:
+            try:
+                if self._server.noop()[0] != 250:
+                    self.close()
+            except smtplib.SMTPException:
+                self.close()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def send(self, message: model.DBEmailOutbox):
+        mime = MIMEMultipart()
+        mime["Subject"] = message.subject
+        mime["From"] = otp.SMTP_EMAIL
+        mime["To"] = message.recipient
+        mime.attach(MIMEText(message.body, "plain"))
+
+        try:
+            self._ensure().sendmail(otp.SMTP_EMAIL, message.recipient, mime.as_string())
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server dropped the idle session; reconnect once
+            self.close()
+            self._ensure().sendmail(otp.SMTP_EMAIL, message.recipient, mime.as_string())
+        self._last_used = time.monotonic()
+
+    def send_batch(self, messages: List[model.DBEmailOutbox]) -> List[Optional[str]]:
+        """Send on the shared session; returns an error string (or None) per message"""
+        results = []
+        for message in messages:
+            try:
+                self.send(message)
+                results.append(None)
+            except Exception as e:
+                # A rejected message leaves the session usable; anything else may not
+                if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                    self.close()
+                results.append(f"{type(e).__name__}: {e}")
+        return results
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+
+class EmailOutboxWorker:
+    """Drains email_outbox in batches on a warm SMTP connection"""
+
+    def __init__(self):
+        self.connection = SMTPConnection()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="email-outbox")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        self.wake()
+        await self._task
+        self._task = None
+        await asyncio.to_thread(self.connection.close)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                sent = await self.process_batch()
+            except Exception as e:
+                logger.error(f"Email outbox batch failed: {e}")
+                sent = 0
+            # A full batch means more may be due; otherwise sleep until woken
+            if sent < OUTBOX_BATCH_SIZE and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _claim(self, db: AsyncSession) -> List[model.DBEmailOutbox]:
+        now = model.utc_now()
+        result = await db.execute(
+            select(model.DBEmailOutbox)
+            .filter(
+                model.DBEmailOutbox.status.in_(['pending', 'sending']),
+                model.DBEmailOutbox.next_attempt_at <= now,
+            )
+            .order_by(model.DBEmailOutbox.next_attempt_at)
+            .limit(OUTBOX_BATCH_SIZE)
+            # Several app workers may run a sender; each claims different rows
+            .with_for_update(skip_locked=True)
+        )
+        messages = result.scalars().all()
+        if messages:
+            await db.execute(
+                update(model.DBEmailOutbox)
+                .where(model.DBEmailOutbox.id.in_([message.id for message in messages]))
+                .values(status='sending', next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+            )
+        await db.commit()
+        return messages
+
+    async def process_batch(self) -> int:
+        """Claim, send and record one batch; returns how many rows were claimed"""
+        async with AsyncSessionLocal() as db:
+            messages = await self._claim(db)
+            if not messages:
+                return 0
+
+            errors = await asyncio.to_thread(self.connection.send_batch, messages)
+
+            now = model.utc_now()
+            for message, error in zip(messages, errors):
+                message.attempts += 1
+                if error is None:
+                    message.status = 'sent'
+                    message.sent_at = now
+                    message.last_error = None
+                    # Bodies carry OTPs and reset codes; keep them only while they may be sent
+                    message.body = None
+                elif message.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    message.status = 'failed'
+                    message.last_error = error
+                    message.body = None
+                    logger.error(f"Giving up on email {message.id} to {message.recipient}: {error}")
+                else:
+                    message.status = 'pending'
+                    message.last_error = error
+                    message.next_attempt_at = now + timedelta(seconds=backoff_seconds(message.attempts))
+                    logger.warning(f"Email {message.id} failed (attempt {message.attempts}), will retry: {error}")
+            await db.commit()
+            return len(messages)
+
+
+worker = EmailOutboxWorker()
+
+
+async def prune_outbox(db: AsyncSession, retention_days: int = OUTBOX_RETENTION_DAYS) -> int:
+    """Delete sent and failed rows older than the retention period, a bounded batch per statement"""
+    cutoff = model.utc_now() - timedelta(days=retention_days)
+    total = 0
+    while True:
+        expired = (
+            select(model.DBEmailOutbox.id)
+            .where(
+                model.DBEmailOutbox.status.in_(['sent', 'failed']),
+                model.DBEmailOutbox.created_at < cutoff,
+            )
+            .limit(RETENTION_DELETE_BATCH)
+        )
+        result = await db.execute(delete(model.DBEmailOutbox).where(model.DBEmailOutbox.id.in_(expired)))
+        await db.commit()
+        total += result.rowcount
+        if result.rowcount < RETENTION_DELETE_BATCH:
+            return total
+
+
+@scheduler.every(OUTBOX_RETENTION_SECONDS, name="email-outbox-retention")
+async def _retention_job():
+    if OUTBOX_RETENTION_DAYS <= 0:
+        return
+    async with AsyncSessionLocal() as db:
+        pruned = await prune_outbox(db)
+        if pruned:
+            logger.info(f"Pruned {pruned} sent or failed emails older than {OUTBOX_RETENTION_DAYS} days")
+
+
+def start_worker():
+    if EMAIL_OUTBOX_WORKER:
+        worker.start()
+
+
+async def stop_worker():
+    await worker.stop()
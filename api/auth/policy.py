@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import JWTError
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import scheduler
+from api.auth import authutils, cache, crud, model
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+TOKEN_VERSION_SYNC_SECONDS = float(os.getenv("TOKEN_VERSION_SYNC_SECONDS", "30"))
+
+ADMIN = "admin"
+FEEDER = "feeder"
+EGG_COUNTER = "counter"
+
+# Who may do what, from the rules in `todo`. Admins may do everything.
+POLICIES = {
+    # 1. only admins create or delete coops and change their status
+    "coop:create": {ADMIN},
+    "coop:delete": {ADMIN},
+    "coop:update_status": {ADMIN},
+    "coop:rollback": {ADMIN},
+    # 2. feeders create and update buyers and update coops, but delete nothing
+    "coop:update": {ADMIN, FEEDER, EGG_COUNTER},
+    "buyer:create": {ADMIN, FEEDER},
+    "buyer:update": {ADMIN, FEEDER},
+    "buyer:delete": {ADMIN},
+    # 3. egg counters record egg counts
+    "coop:count_eggs": {ADMIN, EGG_COUNTER},
+    # 9. revenue is admin only: buyer sales and expenditure reads
+    "revenue:read": {ADMIN},
+    "accounts:manage": {ADMIN},
+    "metrics:read": {ADMIN},
+    # Bulk NDJSON/CSV exports of whole tables
+    "data:export": {ADMIN},
+}
+
+# Changing any of these makes claims in tokens already issued stale
+TOKEN_CLAIM_FIELDS = ("role", "status", "location_id", "password")
+
+credentials_exception = authutils.credentials_exception
+
+
+class Claims:
+    """Identity and scope carried in a verified access token"""
+
+    __slots__ = ("user_id", "username", "role", "status", "location_id", "token_version")
+
+    def __init__(self, user_id, username, role, status, location_id, token_version):
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+        self.status = status
+        self.location_id = location_id
+        self.token_version = token_version
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> Optional["Claims"]:
+        if "uid" not in payload or "ver" not in payload:
+            return None
+        return cls(
+            user_id=payload["uid"],
+            username=payload.get("sub"),
+            role=payload.get("roles"),
+            status=payload.get("status"),
+            location_id=payload.get("loc"),
+            token_version=payload["ver"],
+        )
+
+    def allows(self, action: str) -> bool:
+        return self.role == ADMIN or self.role in POLICIES[action]
+
+    def can_access_location(self, location_id: Optional[int]) -> bool:
+        return self.role == ADMIN or location_id is None or location_id == self.location_id
+
+
+def token_claims(user) -> dict:
+    """Access-token claims for `user`; authorization reads these instead of the users table"""
+    return {
+        "sub": user.username,
+        "roles": user.role,
+        "uid": user.id,
+        "status": user.status,
+        "loc": user.location_id,
+        "ver": user.token_version or 0,
+    }
+
+
+class TokenVersions:
+    """
+    Current token_version per user, held in memory so checking a token
+    costs no query. Bumps committed here apply at once; other workers'
+    bumps arrive with the next sync.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+
+    def current(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: int, version: int):
+        self._versions[user_id] = max(version, self._versions.get(user_id, 0))
+
+    async def load(self, db):
+        result = await db.execute(
+            select(model.DBUser.id, model.DBUser.token_version).where(model.DBUser.token_version > 0)
+        )
+        versions = dict(result.all())
+        # Keep deleted users (bumped locally, no longer in the table) revoked
+        for user_id, version in self._versions.items():
+            if version > versions.get(user_id, 0):
+                versions[user_id] = version
+        self._versions = versions
+        self.loaded = True
+
+    async def ensure_loaded(self):
+        """Load on the first token check rather than at startup; the sync job keeps it current"""
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if self.loaded:
+                return
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.load(db)
+            except (SQLAlchemyError, OSError) as e:
+                logger.error(f"Could not load token versions: {e}")
+
+
+token_versions = TokenVersions()
+
+# Deleted users have no row to compare against; any token they hold is stale
+DELETED_USER_VERSION = 2 ** 31 - 1
+
+
+async def get_claims(
+    credentials: HTTPAuthorizationCredentials = Depends(authutils.security),
+) -> Claims:
+    """Verify the bearer token and return its claims without touching the database"""
+    try:
+        payload = authutils.decode_access_token(credentials.credentials)
+    except JWTError:
+        raise credentials_exception
+
+    claims = Claims.from_payload(payload)
+    if claims is None:
+        # Issued before claims were embedded; look the user up once and
+        # let the client pick up a full token at its next refresh
+        claims = await _claims_from_database(payload.get("sub"))
+    else:
+        await token_versions.ensure_loaded()
+        if claims.token_version < token_versions.current(claims.user_id):
+            raise credentials_exception
+    return claims
+
+
+async def _claims_from_database(username: Optional[str]) -> Claims:
+    if username is None:
+        raise credentials_exception
+    principal = cache.principal_cache.get(username)
+    if principal is None:
+        async with AsyncSessionLocal() as db:
+            try:
+                user = await crud.find_user_by_username(username=username, db=db)
+            except crud.NotFoundError:
+                raise credentials_exception
+            principal = cache.UserPrincipal(user)
+        cache.principal_cache.put(principal)
+    return Claims(principal.id, principal.username, principal.role, principal.status, principal.location_id, 0)
+
+
+def require(action: str):
+    """Dependency factory: the caller must be active and allowed `action` by POLICIES"""
+    if action not in POLICIES:
+        raise KeyError(f"No policy for {action}")
+
+    def checker(claims: Claims = Depends(get_claims)) -> Claims:
+        if claims.status != "active":
+            raise HTTPException(status_code=400, detail="Inactive user")
+        if not claims.allows(action):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions"
+            )
+        return claims
+    return checker
+
+
+def check_location(claims: Claims, location_id: Optional[int]):
+    """Non-admins may only act on their own location"""
+    if not claims.can_access_location(location_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed for this location"
+        )
+
+
+@scheduler.every(TOKEN_VERSION_SYNC_SECONDS, name="token-version-sync")
+async def _sync_job():
+    async with AsyncSessionLocal() as db:
+        await token_versions.load(db)
+
+
+# A user's role, status, location or password changing bumps token_version
+# in the same flush, so tokens carrying the old claims stop validating.
+@event.listens_for(Session, "before_flush")
+def _bump_token_versions(session, flush_context, instances):
+    for obj in session.dirty:
+        if isinstance(obj, model.DBUser):
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in TOKEN_CLAIM_FIELDS):
+                obj.token_version = (obj.token_version or 0) + 1
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_token_versions(session, flush_context):
+    bumped = session.info.setdefault("bumped_token_versions", {})
+    for obj in session.dirty:
+        if isinstance(obj, model.DBUser) and inspect(obj).attrs.token_version.history.has_changes():
+            bumped[obj.id] = obj.token_version
+    for obj in session.deleted:
+        if isinstance(obj, model.DBUser):
+            bumped[obj.id] = DELETED_USER_VERSION
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_token_versions(session):
+    for user_id, version in session.info.pop("bumped_token_versions", {}).items():
+        token_versions.bump(user_id, version)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_token_versions(session, previous_transaction):
+    session.info.pop("bumped_token_versions", None)
+
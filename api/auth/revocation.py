@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+from typing import List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import scheduler
+from api.auth import model
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Sizing floor; the filter is rebuilt larger when revocations outgrow it
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+# Revocations made by other workers reach this process's filter within this window
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+REVOCATION_PRUNE_SECONDS = float(os.getenv("REVOCATION_PRUNE_SECONDS", "3600"))
+# Ids are allocated before commit, so a lower id can become visible after a
+# higher one; each sync re-reads this many ids back to catch those
+REVOCATION_SYNC_OVERLAP = 1000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings: no false negatives, tunable false positives"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self._bits[position >> 3] & mask:
+                self._bits[position >> 3] |= mask
+                added = True
+        # Re-adding a present item leaves the estimate unchanged
+        if added:
+            self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    """
+    Per-process Bloom filter of revoked refresh-token JTIs.
+
+    A miss means the token is certainly not revoked, so /refresh skips the
+    database; a hit is confirmed against blacklisted_tokens. Until the first
+    rebuild succeeds every lookup is treated as a possible hit.
+    """
+
+    def __init__(self):
+        self._bloom: Optional[BloomFilter] = None
+        self._last_id = 0
+        self._rebuilding = False
+        self._added_during_rebuild: List[str] = []
+        self._lock = asyncio.Lock()
+        self.lookups = 0
+        self.negatives = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._bloom is not None
+
+    def add(self, jti: str):
+        if self._bloom is not None:
+            self._bloom.add(jti)
+        if self._rebuilding:
+            self._added_during_rebuild.append(jti)
+
+    def might_be_revoked(self, jti: str) -> bool:
+        self.lookups += 1
+        if self._bloom is None or jti in self._bloom:
+            return True
+        self.negatives += 1
+        return False
+
+    async def rebuild(self, db: AsyncSession):
+        """Load every unexpired JTI into a freshly sized filter"""
+        async with self._lock:
+            await self._rebuild(db)
+
+    async def _rebuild(self, db: AsyncSession):
+        self._rebuilding = True
+        self._added_during_rebuild = []
+        try:
+            now = model.utc_now()
+            live = model.DBBlacklistedToken.expires_at.is_(None) | (model.DBBlacklistedToken.expires_at > now)
+            count, last_id = (await db.execute(
+                select(func.count(), func.max(model.DBBlacklistedToken.id)).where(live)
+            )).one()
+
+            bloom = BloomFilter(max(REVOCATION_BLOOM_CAPACITY, 2 * count), REVOCATION_BLOOM_ERROR_RATE)
+            result = await db.stream_scalars(
+                select(model.DBBlacklistedToken.jti).where(live).execution_options(yield_per=5000)
+            )
+            async for jti in result:
+                bloom.add(jti)
+
+            # Revocations committed in this process while loading
+            for jti in self._added_during_rebuild:
+                bloom.add(jti)
+            self._bloom = bloom
+            self._last_id = max(self._last_id, last_id or 0)
+        finally:
+            self._rebuilding = False
+            self._added_during_rebuild = []
+
+    async def sync(self, db: AsyncSession):
+        """Pick up JTIs revoked by other processes since the last load"""
+        async with self._lock:
+            if self._bloom is None or self._bloom.count > self._bloom.capacity:
+                await self._rebuild(db)
+                return
+            result = await db.execute(
+                select(model.DBBlacklistedToken.id, model.DBBlacklistedToken.jti)
+                .where(model.DBBlacklistedToken.id > self._last_id - REVOCATION_SYNC_OVERLAP)
+                .order_by(model.DBBlacklistedToken.id)
+            )
+            for row_id, jti in result:
+                self._bloom.add(jti)
+                self._last_id = max(self._last_id, row_id)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "entries": self._bloom.count if self._bloom else 0,
+            "capacity": self._bloom.capacity if self._bloom else 0,
+            "bits": self._bloom.size if self._bloom else 0,
+            "hash_count": self._bloom.hash_count if self._bloom else 0,
+            "lookups": self.lookups,
+            "negatives": self.negatives,
+        }
+
+
+revocation_filter = RevocationFilter()
+
+
+def add(jti: str):
+    revocation_filter.add(jti)
+
+
+def might_be_revoked(jti: str) -> bool:
+    return revocation_filter.might_be_revoked(jti)
+
+
+async def prune_expired(db: AsyncSession) -> int:
+    """Delete revocations whose token has expired; they can no longer be presented"""
+    result = await db.execute(
+        delete(model.DBBlacklistedToken)
+        .where(model.DBBlacklistedToken.expires_at < model.utc_now())
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def start():
+    """Build the filter at startup; on failure lookups fall back to the database"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await revocation_filter.rebuild(db)
+    except Exception as e:
+        logger.error(f"Could not load revoked tokens, checking the database on every refresh: {e}")
+
+
+@scheduler.every(REVOCATION_SYNC_SECONDS, name="revocation-sync")
+async def _sync_job():
+    async with AsyncSessionLocal() as db:
+        await revocation_filter.sync(db)
+
+
+@scheduler.every(REVOCATION_PRUNE_SECONDS, name="revocation-prune")
+async def _prune_job():
+    async with AsyncSessionLocal() as db:
+        pruned = await prune_expired(db)
+        if pruned:
+            logger.info(f"Pruned {pruned} expired revoked tokens")
+            # Bloom filters cannot delete, so reclaim the bits with a rebuild
+            await revocation_filter.rebuild(db)
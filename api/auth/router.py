@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Cookie, Request
 from fastapi.responses import JSONResponse
-from api.auth import authutils, schema, crud, otp, model
-from database import get_db
+from api.auth import authutils, schema, crud, otp, model, hashing, outbox, policy
+from database import get_async_db
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,17 +31,17 @@ async def get_current_user(current_user: model.DBUser = Depends(authutils.get_cu
 
 
 @router.post("/auth/register")
-def register(user: schema.UserList, db=Depends(get_db)
+async def register(user: schema.UserList, db=Depends(get_async_db)
 ) -> schema.User:
     try:
         #  check if user exists
-        result =  crud.get_user_by_email(email=user.email, db=db)
+        result =  await crud.get_user_by_email(email=user.email, db=db)
         if result:
             raise HTTPException(status_code=400, detail="Email already exists")
 
         # create new user
         # print(user.password, " this is password<<<<<<<")
-        hashed_password = authutils.get_password_hash(user.password)
+        hashed_password = await hashing.hash_password(user.password)
         # print(hashed_password, " this is hashed password<<<<<<<")
 
         # user.hashed_password = hashed_password
@@ -55,7 +55,7 @@ def register(user: schema.UserList, db=Depends(get_db)
             role='feeder'
         )
 
-        added_user = crud.create_user(db=db, db_user=db_user)
+        added_user = await crud.create_user(db=db, db_user=db_user)
 
         return added_user
 
@@ -67,7 +67,7 @@ def register(user: schema.UserList, db=Depends(get_db)
 async def login_for_otp(
     form_data: schema.UserLogin, 
     request: Request,
-    db=Depends(get_db)
+    db=Depends(get_async_db)
 ):
     """Initiate login process with OTP verification and attempt tracking"""
     try:
@@ -79,13 +79,13 @@ async def login_for_otp(
             )
         
         # Check if account can attempt login
-        login_security.validate_can_attempt_login(db, form_data.username)
+        await login_security.validate_can_attempt_login(db, form_data.username, request)
         
         try:
-            user = crud.find_by_username(username=form_data.username, db=db)
+            user = await crud.find_by_username(username=form_data.username, db=db)
         except crud.NotFoundError:
             # Record failed attempt for non-existent user
-            login_security.record_failed_attempt(
+            await login_security.record_failed_attempt(
                 db=db,
                 username=form_data.username,
                 request=request,
@@ -99,7 +99,7 @@ async def login_for_otp(
         
         # Check if account is active
         if user.status != 'active':
-            login_security.record_failed_attempt(
+            await login_security.record_failed_attempt(
                 db=db,
                 username=form_data.username,
                 request=request,
@@ -111,12 +111,10 @@ async def login_for_otp(
             )
         
         # Generate and send OTP
-        one_time_pass = otp.generate_and_store_otp(user=user, db=db)
-
-        print(one_time_pass, 'otp herre')
+        one_time_pass = await otp.generate_and_store_otp(user=user, db=db)
         
         if not user.email:
-            login_security.record_failed_attempt(
+            await login_security.record_failed_attempt(
                 db=db,
                 username=form_data.username,
                 request=request,
@@ -127,22 +125,17 @@ async def login_for_otp(
                 detail="No email address associated with this account"
             )
         
-        try:
-            await otp.send_otp_to_user(
-                subject="Poultry Farm - Login Verification",
-                body=f"Your login verification code is: {one_time_pass}\n\n"
-                     f"This code will expire in 10 minutes.\n"
-                     f"Do not share this code with anyone.\n\n"
-                     f"If you didn't request this code, please ignore this email.",
-                recipient_email=user.email,
-            )
-            logger.info(f"OTP sent successfully to user: {form_data.username}")
-        except otp.EmailError as email_err:
-            logger.error(f"Email sending failed for user {form_data.username}: {email_err}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Unable to send verification email. Please try again or contact support."
-            )
+        # Queued for the background sender so SMTP latency stays out of the request
+        await outbox.enqueue_email(
+            db=db,
+            subject="Poultry Farm - Login Verification",
+            body=f"Your login verification code is: {one_time_pass}\n\n"
+                 f"This code will expire in 10 minutes.\n"
+                 f"Do not share this code with anyone.\n\n"
+                 f"If you didn't request this code, please ignore this email.",
+            recipient_email=user.email,
+        )
+        logger.info(f"OTP queued for user: {form_data.username}")
         
         email = authutils.abfuscate_email(user.email)
         return {
@@ -166,7 +159,7 @@ async def login_for_otp(
 async def verify_account_via_email(
     verification_details: schema.VerificationDetails,
     request: Request,
-    db=Depends(get_db)
+    db=Depends(get_async_db)
 ):
     """Verify OTP and complete login process with attempt tracking"""
     try:
@@ -178,12 +171,12 @@ async def verify_account_via_email(
             )
         
         # Check if account can attempt verification
-        login_security.validate_can_attempt_login(db, verification_details.username)
+        await login_security.validate_can_attempt_login(db, verification_details.username, request)
         
         try:
-            user = crud.find_by_username(username=verification_details.username, db=db)
+            user = await crud.find_by_username(username=verification_details.username, db=db)
         except crud.NotFoundError:
-            login_security.record_failed_attempt(
+            await login_security.record_failed_attempt(
                 db=db,
                 username=verification_details.username,
                 request=request,
@@ -196,7 +189,7 @@ async def verify_account_via_email(
         
         # Check if account is still active
         if user.status != 'active':
-            login_security.record_failed_attempt(
+            await login_security.record_failed_attempt(
                 db=db,
                 username=verification_details.username,
                 request=request,
@@ -208,12 +201,12 @@ async def verify_account_via_email(
             )
         
         # Verify OTP
-        user_is_verified = otp.verify_otp(
+        user_is_verified = await otp.verify_otp(
             entered_otp=verification_details.otp, user=user, db=db
         )
         
         if not user_is_verified:
-            login_security.record_failed_attempt(
+            await login_security.record_failed_attempt(
                 db=db,
                 username=verification_details.username,
                 request=request,
@@ -225,16 +218,14 @@ async def verify_account_via_email(
             )
         
         # Record successful login
-        login_security.record_successful_attempt(
+        await login_security.record_successful_attempt(
             db=db,
             username=verification_details.username,
             request=request
         )
         
         # Create tokens
-        access_token = authutils.create_access_token(
-            data={"sub": user.username, "roles": user.role}
-        )
+        access_token = authutils.create_access_token(data=policy.token_claims(user))
         new_refresh_token = authutils.create_refresh_token(
             data={"sub": user.username}
         )
@@ -274,7 +265,7 @@ async def verify_account_via_email(
         )
 @router.post("/refresh")
 async def refresh_access_token_endpoint(
-    refresh_token: str = Cookie(None, alias="refresh_token"), db=Depends(get_db)
+    refresh_token: str = Cookie(None, alias="refresh_token"), db=Depends(get_async_db)
 ):
 
     if not refresh_token:
@@ -288,7 +279,7 @@ async def refresh_access_token_endpoint(
             db=db, refresh_token=refresh_token
         )
 
-        user = crud.find_user_by_username(username=str(username), db=db)
+        user = await crud.find_user_by_username(username=str(username), db=db)
 
         if not user:
             raise HTTPException(
@@ -298,7 +289,7 @@ async def refresh_access_token_endpoint(
 
         role = user.role if user is not None else "feeder"
 
-        access_token = authutils.create_access_token({"sub": username, "roles": role})
+        access_token = authutils.create_access_token(policy.token_claims(user))
         # print("this is the username >>>>>>>>>>", username)
         # print("this is the refresh token >>>>>>>>>>", access_token)
 
@@ -319,10 +310,10 @@ async def refresh_access_token_endpoint(
 @router.post("/logout")
 async def log_user_out(
     refresh_token: str = Cookie(None, alias="refresh_token"), 
-    db=Depends(get_db)
+    db=Depends(get_async_db)
 ):
     if refresh_token:
-        authutils.blacklist_token(refresh_token, db=db)
+        await authutils.blacklist_token(refresh_token, db=db)
     
     response = JSONResponse(content={"message": "Successfully logged out"})
     
@@ -340,18 +331,12 @@ async def log_user_out(
 @router.get("/admin/account-status/{username}")
 async def get_account_status(
     username: str,
-    current_user: model.DBUser = Depends(authutils.get_current_user),
-    db=Depends(get_db)
+    claims: policy.Claims = Depends(policy.require("accounts:manage")),
+    db=Depends(get_async_db)
 ):
     """Get account lockout status (admin only)"""
-    if current_user.role != 'admin':
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Admin access required"
-        )
-    
-    status = login_security.check_account_status(db, username)
-    recent_attempts = authutils.LoginAttemptsCRUD.get_recent_attempts(db, username, hours=24)
+    status = await login_security.check_account_status(db, username)
+    recent_attempts = await crud.LoginAttemptsCRUD.get_recent_attempts(db, username, hours=24)
     
     return {
         "username": username,
@@ -364,20 +349,36 @@ async def get_account_status(
 @router.post("/admin/unlock-account/{username}")
 async def unlock_account(
     username: str,
-    current_user: model.DBUser = Depends(authutils.get_current_user),
-    db=Depends(get_db)
+    claims: policy.Claims = Depends(policy.require("accounts:manage")),
+    db=Depends(get_async_db)
 ):
     """Manually unlock an account (admin only)"""
-    if current_user.role != 'admin':
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Admin access required"
-        )
-    
-    unlocked = authutils.LoginAttemptsCRUD.unlock_account(db, username)
+    unlocked = await login_security.unlock(db, username)
     
     if unlocked:
-        logger.info(f"Account manually unlocked by admin {current_user.username}: {username}")
+        logger.info(f"Account manually unlocked by admin {claims.username}: {username}")
         return {"message": f"Account {username} has been unlocked"}
     else:
-        return {"message": f"Account {username} was not locked"}
\ No newline at end of file
+        return {"message": f"Account {username} was not locked"}
+
+# Admin endpoint to invalidate every access token issued to a user
+@router.post("/admin/revoke-tokens/{username}")
+async def revoke_user_tokens(
+    username: str,
+    claims: policy.Claims = Depends(policy.require("accounts:manage")),
+    db=Depends(get_async_db)
+):
+    """Bump the user's token version so access tokens already issued stop validating (admin only)"""
+    try:
+        user = await crud.find_by_username(username=username, db=db)
+    except crud.NotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    user.token_version = (user.token_version or 0) + 1
+    await db.commit()
+
+    logger.info(f"Access tokens revoked by admin {claims.username}: {username}")
+    return {"message": f"Access tokens for {username} have been revoked"}
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+import scheduler
+from api.auth import crud, model
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Failed logins allowed per client IP inside the attempt window
+LOGIN_MAX_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", "20"))
+# Bounds memory under a flood of distinct usernames / addresses
+THROTTLE_MAX_KEYS = int(os.getenv("THROTTLE_MAX_KEYS", "100000"))
+LOCKOUT_CLEANUP_SECONDS = float(os.getenv("LOCKOUT_CLEANUP_SECONDS", "60"))
+# Lockout writes in flight beyond this make the login request wait for its own write
+THROTTLE_MAX_PENDING_WRITES = int(os.getenv("THROTTLE_MAX_PENDING_WRITES", "500"))
+
+
+def _timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def as_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+class SlidingWindow:
+    """
+    Per-key sliding-window log of event times. Only the newest `limit`
+    events are kept, which is all a threshold decision needs, so each
+    hit and count is O(1) amortized and memory per key is bounded.
+    """
+
+    def __init__(self, window_seconds: float, limit: int, max_keys: int = THROTTLE_MAX_KEYS):
+        self.window_seconds = window_seconds
+        self.limit = limit
+        self.max_keys = max_keys
+        self._events: "OrderedDict[str, deque]" = OrderedDict()
+
+    def _trim(self, key: str, now: float) -> Optional[deque]:
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window_seconds:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def hit(self, key: str, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        events = self._trim(key, now)
+        if events is None:
+            events = self._events[key] = deque(maxlen=self.limit)
+        events.append(now)
+        self._events.move_to_end(key)
+        while len(self._events) > self.max_keys:
+            self._events.popitem(last=False)
+        return len(events)
+
+    def count(self, key: str, now: Optional[float] = None) -> int:
+        events = self._trim(key, time.time() if now is None else now)
+        return len(events) if events else 0
+
+    def reset(self, key: str):
+        self._events.pop(key, None)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        stale = [key for key, events in self._events.items() if events[-1] <= now - self.window_seconds]
+        for key in stale:
+            del self._events[key]
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+
+class LoginThrottle:
+    """
+    In-memory failed-login counters per username and per client IP, plus
+    active lockouts, so the login path makes its lockout decision without
+    touching the database.
+
+    State is per process. Lockouts are also written to account_lockouts and
+    every worker reloads them on the cleanup schedule, so a lockout taken in
+    one worker reaches the others within LOCKOUT_CLEANUP_SECONDS.
+    """
+
+    def __init__(self, max_attempts: int, lockout_duration_minutes: int, attempt_window_minutes: int):
+        self.max_attempts = max_attempts
+        self.lockout_seconds = lockout_duration_minutes * 60
+        self.window_seconds = attempt_window_minutes * 60
+        self.by_username = SlidingWindow(self.window_seconds, max_attempts)
+        self.by_ip = SlidingWindow(self.window_seconds, LOGIN_MAX_ATTEMPTS_PER_IP)
+        # username -> (unlock timestamp, failed attempts at lock time)
+        self._lockouts: Dict[str, tuple] = {}
+        # Taken here since the last sync; their rows may not be written yet
+        self._locked_since_sync = set()
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+        _throttles.append(self)
+
+    def lockout(self, username: str, now: Optional[float] = None) -> Optional[tuple]:
+        entry = self._lockouts.get(username)
+        if entry is not None and entry[0] <= (time.time() if now is None else now):
+            del self._lockouts[username]
+            return None
+        return entry
+
+    def lock(self, username: str, failed_attempts: int, unlock_at: Optional[float] = None) -> float:
+        unlock_at = time.time() + self.lockout_seconds if unlock_at is None else unlock_at
+        self._lockouts[username] = (unlock_at, failed_attempts)
+        self._locked_since_sync.add(username)
+        return unlock_at
+
+    def unlock(self, username: str):
+        self._lockouts.pop(username, None)
+        self._locked_since_sync.discard(username)
+        self.by_username.reset(username)
+
+    def record_failure(self, username: str, ip_address: Optional[str]) -> int:
+        now = time.time()
+        if ip_address:
+            self.by_ip.hit(ip_address, now)
+        return self.by_username.hit(username, now)
+
+    def ip_blocked(self, ip_address: Optional[str]) -> bool:
+        return bool(ip_address) and self.by_ip.count(ip_address) >= self.by_ip.limit
+
+    async def load(self, db):
+        """Seed counters and lockouts from the tables after a restart"""
+        now = model.utc_now()
+        result = await db.execute(
+            select(model.LoginAttempt.username, model.LoginAttempt.ip_address, model.LoginAttempt.attempt_time)
+            .filter(
+                model.LoginAttempt.success.is_(False),
+                model.LoginAttempt.attempt_time >= now - timedelta(seconds=self.window_seconds),
+            )
+            .order_by(model.LoginAttempt.attempt_time)
+        )
+        for username, ip_address, attempt_time in result:
+            self.by_username.hit(username, _timestamp(attempt_time))
+            if ip_address:
+                self.by_ip.hit(ip_address, _timestamp(attempt_time))
+        await self.sync_lockouts(db)
+        self.loaded = True
+
+    async def ensure_loaded(self):
+        """
+        Load on first use instead of at startup, so a worker serves its
+        first request without waiting on the database. Callers run this
+        before counting a failure, or load would count it a second time.
+        """
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if self.loaded:
+                return
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.load(db)
+            except (SQLAlchemyError, OSError) as e:
+                logger.error(f"Could not load login throttle state: {e}")
+
+    async def sync_lockouts(self, db):
+        """Replace lockouts with the table's, which reflects other workers' locks and admin unlocks"""
+        result = await db.execute(
+            select(model.AccountLockout.username, model.AccountLockout.unlock_at, model.AccountLockout.failed_attempts)
+            .filter(
+                model.AccountLockout.is_active,
+                model.AccountLockout.unlock_at > model.utc_now(),
+            )
+        )
+        # Read after the await so locks taken while it ran are kept
+        local = {name: self._lockouts[name] for name in self._locked_since_sync if name in self._lockouts}
+        self._locked_since_sync = set()
+        self._lockouts = {
+            username: (_timestamp(unlock_at), failed_attempts or 0)
+            for username, unlock_at, failed_attempts in result
+        }
+        self._lockouts.update(local)
+
+    def prune(self):
+        now = time.time()
+        for username in [name for name, (unlock_at, _) in self._lockouts.items() if unlock_at <= now]:
+            del self._lockouts[username]
+        self.by_username.prune(now)
+        self.by_ip.prune(now)
+
+    def stats(self) -> dict:
+        return {
+            "usernames": len(self.by_username),
+            "ip_addresses": len(self.by_ip),
+            "lockouts": len(self._lockouts),
+        }
+
+
+_throttles: List[LoginThrottle] = []
+_pending_writes = set()
+
+
+async def _write(func: Callable[..., Awaitable], kwargs: dict):
+    try:
+        async with AsyncSessionLocal() as db:
+            await func(db=db, **kwargs)
+    except Exception as e:
+        logger.error(f"Login throttle write {func.__name__} failed: {e}")
+
+
+async def write_behind(func: Callable[..., Awaitable], **kwargs):
+    """
+    Run a crud write in its own session after the response; when too many
+    are already in flight, run it inline so bursts slow down the caller
+    instead of growing without bound
+    """
+    if len(_pending_writes) >= THROTTLE_MAX_PENDING_WRITES:
+        await _write(func, kwargs)
+        return
+    task = asyncio.create_task(_write(func, kwargs))
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+
+
+async def drain():
+    """Wait for in-flight lockout writes; called on shutdown"""
+    if _pending_writes:
+        await asyncio.gather(*list(_pending_writes), return_exceptions=True)
+
+
+def stats() -> dict:
+    return {
+        "throttles": [throttle.stats() for throttle in _throttles],
+        "pending_writes": len(_pending_writes),
+    }
+
+
+@scheduler.every(LOCKOUT_CLEANUP_SECONDS, name="lockout-cleanup")
+async def _cleanup_job():
+    async with AsyncSessionLocal() as db:
+        await crud.LoginAttemptsCRUD.cleanup_expired_lockouts(db)
+        for throttle in _throttles:
+            throttle.prune()
+            await throttle.sync_lockouts(db)
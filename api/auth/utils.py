@@ -10,9 +10,9 @@ from api.user import (
 ) 
 
 
-def admin_status(user_id: model.DBUser, db):
+async def admin_status(user_id: model.DBUser, db):
     try:
-        is_admin = user_crud.read_role(user_id=user_id, db=db)
+        is_admin = await user_crud.read_role(user_id=user_id, db=db)
         if is_admin:
             if is_admin.status == 'inactive':
                 raise HTTPException('admin is inactive')
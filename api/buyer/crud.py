@@ -1,5 +1,7 @@
 from api.auth import model
-from sqlalchemy.orm import Session
+from api.pagination import PageParams, build_page, keyset
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class NotFoundError(Exception):
@@ -10,38 +12,44 @@ class CreationError(Exception):
     pass
 
 
-def read_buyers(db):
-    return db.query(model.DBBuyer).all() 
+async def read_buyers(db: AsyncSession, page: PageParams):
+    result = await db.execute(keyset(select(model.DBBuyer), model.DBBuyer, page))
+    return build_page(result.scalars().all(), page)
 
 
-def read_buyer_by_id(buyer_id: int, db: Session):
-    return db.query(model.DBBuyer).filter(model.DBBuyer.id == buyer_id).first()
+async def read_buyer_by_id(buyer_id: int, db: AsyncSession):
+    result = await db.execute(select(model.DBBuyer).filter(model.DBBuyer.id == buyer_id))
+    return result.scalars().first()
 
 
-def create_buyer(db_buyer: model.DBBuyer, db):
+async def create_buyer(db_buyer: model.DBBuyer, db: AsyncSession):
     try:
         db.add(db_buyer)
-        db.commit()
-        db.refresh(db_buyer)
+        await db.commit()
+        await db.refresh(db_buyer)
         return db_buyer
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise CreationError(f"Failed to create buyer: {str(e)}")
 
 
-def find_buyer_by_id(buyer_id: int, db):
+async def find_buyer_by_id(buyer_id: int, db: AsyncSession):
     # if db.query(model.DBBuyer).filter(model.DBBuyer.id == buyer_id) is None:
     #     raise NotFoundError('Buyer not found')
 
     # return db.query(model.DBBuyer).filter(model.DBBuyer.id == buyer_id)
-    buyer = db.query(model.DBBuyer).filter(model.DBBuyer.id == buyer_id).first()
+    result = await db.execute(select(model.DBBuyer).filter(model.DBBuyer.id == buyer_id))
+    buyer = result.scalars().first()
     if buyer is None:
         raise NotFoundError("Buyer not found")
     return buyer
 
 
-def read_buyer_by_location(location_id: int, db: Session):
-    return db.query(model.DBBuyer).filter(model.DBBuyer.location_id == location_id).all()
+async def read_buyer_by_location(location_id: int, db: AsyncSession, page: PageParams):
+    result = await db.execute(
+        keyset(select(model.DBBuyer).filter(model.DBBuyer.location_id == location_id), model.DBBuyer, page)
+    )
+    return build_page(result.scalars().all(), page)
 
 
 # def update_buyer(db: Session, buyer_id: int, updated_data: dict):
@@ -59,13 +67,13 @@ def read_buyer_by_location(location_id: int, db: Session):
 #     db.refresh(buyer)  # Ensure it's a model instance before refreshing
 #     return buyer
 
-def update_buyer(db_buyer: model.DBBuyer, db: Session):
+async def update_buyer(db_buyer: model.DBBuyer, db: AsyncSession):
     try:
-        db.commit()
-        db.refresh(db_buyer)
+        await db.commit()
+        await db.refresh(db_buyer)
         return db_buyer
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise Exception(f"Failed to update buyer: {str(e)}")
 
 
@@ -76,22 +84,23 @@ def update_buyer(db_buyer: model.DBBuyer, db: Session):
 #     db.commit()
 #     return {"message": "buyer has been successfully deleted"}
 
-def delete_buyer(buyer_id: int, db: Session):
-    db_buyer = read_buyer_by_id(buyer_id, db)
+async def delete_buyer(buyer_id: int, db: AsyncSession):
+    db_buyer = await read_buyer_by_id(buyer_id, db)
     if db_buyer is None:
         raise NotFoundError("Buyer not found")
     
     try:
-        db.delete(db_buyer)
-        db.commit()
+        await db.delete(db_buyer)
+        await db.commit()
         return {"message": "Buyer has been successfully deleted"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise Exception(f"Failed to delete buyer: {str(e)}")
 
 
-def read_buyer_by_name(buyer_name: str, db):
-    buyer = db.query(model.DBBuyer).filter(model.DBBuyer.name == buyer_name).all()
+async def read_buyer_by_name(buyer_name: str, db: AsyncSession):
+    result = await db.execute(select(model.DBBuyer).filter(model.DBBuyer.name == buyer_name))
+    buyer = result.scalars().all()
     if buyer is None:
         raise NotFoundError("buyer not found")
 
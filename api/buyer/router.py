@@ -1,8 +1,10 @@
-from api.auth import model
+from api.auth import model, policy
 from api.buyer import schema, crud
 from api.buyer.crud import NotFoundError, CreationError
-from database import get_db
-from fastapi import APIRouter, Depends, HTTPException
+from api.pagination import Page, PageParams
+from api.export import ExportParams, stream_export
+from database import get_async_db, get_async_read_db
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import List
 
 
@@ -13,14 +15,11 @@ router = APIRouter(prefix="/buyers", tags=["Buyers"])
 @router.post("/", response_model=schema.Buyer)
 async def create_new_buyer(
     buyer_detail: schema.BuyerCreate, 
-    db=Depends(get_db),
+    db=Depends(get_async_db),
+    claims: policy.Claims = Depends(policy.require("buyer:create")),
 ) -> schema.Buyer:
+    policy.check_location(claims, buyer_detail.location_id)
     try:
-         # CHECK TO SEE IF ROLE IS ROLE
-        # if role != "feeder":
-        #     raise HTTPException(status_code=404,
-        #     detail='you are not authorized to create a buyer')
-            
         new_buyer = model.DBBuyer(
             # id=buyer_detail.id,
             name=buyer_detail.name,
@@ -32,7 +31,7 @@ async def create_new_buyer(
             location_id=buyer_detail.location_id
         )
 
-        add_new_feed = crud.create_buyer(new_buyer, db)
+        add_new_feed = await crud.create_buyer(new_buyer, db)
 
         return{
             "id": add_new_feed.id,
@@ -50,17 +49,28 @@ async def create_new_buyer(
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 
-@router.get("/", response_model=List[schema.BuyerOutput])
-async def get_all_buyers(db=Depends(get_db)):
+@router.get("/export")
+async def export_buyers(
+    request: Request,
+    params: ExportParams = Depends(),
+    claims: policy.Claims = Depends(policy.require("data:export")),
+):
+    """Export buyer records as NDJSON or CSV, streamed from a server-side cursor"""
+    return stream_export(request, model.DBBuyer, params, filename="buyers")
+
+
+@router.get("/", response_model=Page[schema.BuyerOutput])
+async def get_all_buyers(
+    page: PageParams = Depends(),
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     # try:
     #     return crud.read_buyers(db)
     # except NotFoundError as e:
     #     raise HTTPException(e, "there are no buyers to display")
     try:
-        buyer = crud.read_buyers(db)
-        if not buyer:
-            return []
-        return buyer
+        return await crud.read_buyers(db, page)
     except NotFoundError as e:
         raise HTTPException(500, detail=f"Unexpected error: {str(e)}")
     except Exception as e:
@@ -68,13 +78,17 @@ async def get_all_buyers(db=Depends(get_db)):
 
 
 @router.get("/{id: int}", response_model=schema.BuyerOutput)
-async def get_buyer_by_id(id: int, db=Depends(get_db)):
+async def get_buyer_by_id(
+    id: int,
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     # try:
     #     return crud.read_buyer_by_id(id, db=db)
     # except NotFoundError as e:
     #     raise HTTPException(e, "buyer does not exist")
     try:
-        buyer = crud.read_buyer_by_id(id, db)
+        buyer = await crud.read_buyer_by_id(id, db)
         if buyer is None:
             raise HTTPException(status_code=404, detail="Buyer not found")
         return buyer
@@ -85,13 +99,17 @@ async def get_buyer_by_id(id: int, db=Depends(get_db)):
 
 
 @router.get("/{buyer_name: str}", response_model=List[schema.BuyerOutput])
-async def get_buyer_by_name(buyer_name: str, db=Depends(get_db)):
+async def get_buyer_by_name(
+    buyer_name: str,
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     # try:
     #     return crud.read_buyer_by_name(buyer_name, db=db)
     # except NotFoundError as e:
     #     raise HTTPException(e, "buyer does not exist")
     try:
-        buyers = crud.read_buyer_by_name(buyer_name, db)
+        buyers = await crud.read_buyer_by_name(buyer_name, db)
         if not buyers:
             raise HTTPException(status_code=404, detail="No buyers found with this status")
         return buyers
@@ -103,7 +121,11 @@ async def get_buyer_by_name(buyer_name: str, db=Depends(get_db)):
 
 
 @router.delete("/{id: int}")
-async def delete_buyer_by_id(buyer_id: int, db=Depends(get_db)):
+async def delete_buyer_by_id(
+    buyer_id: int,
+    db=Depends(get_async_db),
+    claims: policy.Claims = Depends(policy.require("buyer:delete")),
+):
     # try:
     #     buyer = crud.find_buyer_by_id(buyer_id=id, db=db)
     #     if buyer is None:
@@ -113,9 +135,9 @@ async def delete_buyer_by_id(buyer_id: int, db=Depends(get_db)):
     #     raise HTTPException(
     #         404, "buyer with this id does not exist")
     try:
-        buyer = crud.find_buyer_by_id(buyer_id, db)
+        buyer = await crud.find_buyer_by_id(buyer_id, db)
         if buyer:
-            return crud.delete_buyer(buyer_id, db)
+            return await crud.delete_buyer(buyer_id, db)
     except NotFoundError:
         raise HTTPException(status_code=404, detail="Buyer with this id does not exist")
     except Exception as e:
@@ -124,7 +146,10 @@ async def delete_buyer_by_id(buyer_id: int, db=Depends(get_db)):
 
 @router.patch("/{buyer_id: int}", response_model=schema.BuyerOutput)
 async def update_buyer_by_id(
-    buyer_id: int, update_buyer: schema.BuyerUpdate, db=Depends(get_db)
+    buyer_id: int,
+    update_buyer: schema.BuyerUpdate,
+    db=Depends(get_async_db),
+    claims: policy.Claims = Depends(policy.require("buyer:update")),
 ):
     # try:
     #     buyer = crud.find_buyer_by_id(id, db=db)
@@ -143,7 +168,8 @@ async def update_buyer_by_id(
 
     # return crud.update_buyer(buyer_id=id, updated_data=update_buyer.dict(exclude_unset=True), db=db)
     try:
-        buyer = crud.find_buyer_by_id(buyer_id, db)
+        buyer = await crud.find_buyer_by_id(buyer_id, db)
+        policy.check_location(claims, buyer.location_id)
         
         # Update fields only if they are provided in the request
         if update_buyer.crates_desired:
@@ -153,21 +179,28 @@ async def update_buyer_by_id(
         if update_buyer.status_of_delivery:
             buyer.status_of_delivery = update_buyer.status_of_delivery
 
-        return crud.update_buyer(db_buyer=buyer, db=db)
+        return await crud.update_buyer(db_buyer=buyer, db=db)
 
     except NotFoundError:
         raise HTTPException(
             status_code=404, detail="Expenditure with this id cannot be updated"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating buyer: {str(e)}")
 
 
-@router.get("/location/{location_id}", response_model=List[schema.BuyerOutput])
-async def get_buyer_by_location(location_id: int, db=Depends(get_db)):
+@router.get("/location/{location_id}", response_model=Page[schema.BuyerOutput])
+async def get_buyer_by_location(
+    location_id: int,
+    page: PageParams = Depends(),
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     try:
-        buyer = crud.read_buyer_by_location(location_id, db)
-        if not buyer:
+        buyer = await crud.read_buyer_by_location(location_id, db, page)
+        if not buyer["items"]:
             raise HTTPException(status_code=404, detail="No buyer found for this location")
         return buyer
     except NotFoundError:
@@ -1,6 +1,44 @@
 from api.auth import model
 from api.coop import schema
-from sqlalchemy.orm import Session
+from api.coop import production
+from api.export import ExportParams, export_filters
+from api.pagination import PageParams, build_page, keyset
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import case, func, insert, inspect, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+# "full" stores every version whole; "delta" strips a superseded version
+# down to the figures that differ from the version replacing it
+COOP_HISTORY_MODE = os.getenv("COOP_HISTORY_MODE", "full")
+# In delta mode every Nth version stays whole, so rebuilding any version
+# reads at most N rows
+COOP_SNAPSHOT_EVERY = int(os.getenv("COOP_SNAPSHOT_EVERY", "10"))
+# Figures a delta version may leave NULL
+DELTA_FIELDS = [
+    "total_fowls", "total_dead_fowls", "total_feed", "egg_count", "collection_date",
+    "crates_collected", "remainder_eggs", "broken_eggs", "notes", "efficiency",
+]
+# Storage bookkeeping, meaningless once a version is rebuilt
+STORAGE_FIELDS = ("is_head", "is_delta", "delta_depth")
+
+# Bounds a lineage walk, including over a (corrupt) parent_id cycle
+COOP_LINEAGE_MAX_DEPTH = 1000
+LINEAGE_FIELDS = [
+    column.name for column in model.DBCoops.__table__.columns if column.name not in STORAGE_FIELDS
+]
+# Exported versions are rebuilt, so the delta bookkeeping is left out
+EXPORT_FIELDS = [
+    column.name for column in model.DBCoops.__table__.columns
+    if column.name not in ("is_delta", "delta_depth")
+]
+# Copied from an ancestor when rolling back; the rest describe the new row
+ROLLBACK_FIELDS = [
+    name for name in LINEAGE_FIELDS
+    if name not in ("id", "parent_id", "created_at", "updated_at")
+]
 
 
 class NotFoundError(Exception):
@@ -11,69 +49,450 @@ class CreationError(Exception):
     pass
 
 
-def read_coops(db):
-    return db.query(model.DBCoops).all()
+class VersionConflictError(Exception):
+    pass
+
+
+async def read_coops(db: AsyncSession, page: PageParams):
+    """Current version of every coop"""
+    result = await db.execute(
+        keyset(select(model.DBCoops).filter(model.DBCoops.is_latest_version()), model.DBCoops, page)
+    )
+    return build_page(result.scalars().all(), page)
+
 
+async def read_coop_by_id(coop_id: int, db: AsyncSession):
+    result = await db.execute(select(model.DBCoops).filter(model.DBCoops.id == coop_id))
+    coop = result.scalars().first()
+    if coop is not None:
+        await fill_deltas([coop], db)
+    return coop
 
-def read_coop_by_id(coop_id: int, db: Session):
-    return db.query(model.DBCoops).filter(model.DBCoops.id == coop_id).first()
 
+async def read_coops_by_ids(coop_ids: List[int], db: AsyncSession) -> List[model.DBCoops]:
+    result = await db.execute(select(model.DBCoops).filter(model.DBCoops.id.in_(coop_ids)))
+    return await fill_deltas(result.scalars().all(), db)
 
-def read_coop_by_coop_name(coop_name: str, db):
-    coop = db.query(model.DBCoops).filter(model.DBCoops.coop_name == coop_name).order_by(model.DBCoops.created_at.desc()).all()
+
+async def read_coop_by_coop_name(coop_name: str, db: AsyncSession):
+    result = await db.execute(
+        select(model.DBCoops)
+        .filter(model.DBCoops.coop_name == coop_name)
+        .order_by(model.DBCoops.created_at.desc())
+    )
+    coop = result.scalars().all()
     if coop is None:
         raise NotFoundError("coops not found")
 
+    return await fill_deltas(coop, db)
+
+
+async def fill_deltas(coops: List[model.DBCoops], db: AsyncSession) -> List[model.DBCoops]:
+    """
+    Rebuild the figures of any delta versions among `coops` in place, with
+    one query walking each forward to the nearest whole version. Values are
+    set as loaded, so the session never writes them back.
+    """
+    deltas = {coop.id: coop for coop in coops if coop.is_delta}
+    if not deltas:
+        return coops
+
+    coop = model.DBCoops.__table__
+    child = coop.alias("child")
+    newer = select(
+        coop.c.id.label("origin"), coop.c.id, coop.c.is_delta, literal(0).label("hops")
+    ).where(coop.c.id.in_(deltas)).cte("newer", recursive=True)
+    newer = newer.union_all(
+        select(newer.c.origin, child.c.id, child.c.is_delta, newer.c.hops + 1).where(
+            child.c.parent_id == newer.c.id,
+            newer.c.is_delta,
+            newer.c.hops < COOP_LINEAGE_MAX_DEPTH,
+        )
+    )
+    result = await db.execute(
+        select(newer.c.origin, newer.c.is_delta, *[coop.c[name] for name in DELTA_FIELDS])
+        .join(coop, coop.c.id == newer.c.id)
+        .order_by(newer.c.origin, newer.c.hops.desc())
+    )
+
+    # Each origin's rows arrive whole version first, then back towards it
+    values: Dict[int, dict] = {}
+    for row in result:
+        current = values.setdefault(row.origin, {})
+        for name in DELTA_FIELDS:
+            value = getattr(row, name)
+            if not row.is_delta or value is not None:
+                current[name] = value
+    for coop_id, rebuilt in values.items():
+        for name, value in rebuilt.items():
+            set_committed_value(deltas[coop_id], name, value)
+    return coops
+
+
+def delta_against(previous: model.DBCoops, new: model.DBCoops) -> dict:
+    """
+    Column values that turn `previous` into a reverse delta of `new`, or {}
+    to keep it whole: outside delta mode, on a snapshot boundary, or when it
+    holds a real NULL that would read back as "unchanged".
+    """
+    if COOP_HISTORY_MODE != "delta" or previous.delta_depth + 1 >= COOP_SNAPSHOT_EVERY:
+        return {}
+    values = {"is_delta": True}
+    for name in DELTA_FIELDS:
+        old = getattr(previous, name)
+        if old is None:
+            return {}
+        if old == getattr(new, name):
+            values[name] = None
+    return values
+
+
+async def read_coop_by_version(coop_id: int, db: AsyncSession):
+    result = await db.execute(select(model.DBCoops).filter(model.DBCoops.id == coop_id))
+    coop = result.scalars().first()
+    if coop is not None:
+        await fill_deltas([coop], db)
     return coop
 
 
-def read_coop_by_version(coop_id: int, db):
-    return db.query(model.DBCoops).filter(model.DBCoops.id == coop_id).first()
+def coop_lineage(
+    coop_id: int,
+    fields: List[str],
+    depth: int = COOP_LINEAGE_MAX_DEPTH,
+    since: Optional[datetime] = None,
+):
+    """
+    WITH RECURSIVE walking parent_id from `coop_id` back through its
+    ancestors: depth 0 is the version itself, depth n its n-th ancestor.
+    Stops after `depth` hops, or at the first version created before `since`.
+    """
+    coop = model.DBCoops.__table__
+    parent = coop.alias("parent")
+    child = coop.alias("child")
+    fields = ["id", "parent_id"] + [name for name in fields if name not in ("id", "parent_id")]
+
+    # A delta version is rebuilt from the versions after it, so start at the
+    # nearest whole version at or after `coop_id`, at a negative depth
+    newer = select(coop.c.id, coop.c.is_delta, literal(0).label("hops")).where(
+        coop.c.id == coop_id
+    ).cte("newer", recursive=True)
+    newer = newer.union_all(
+        select(child.c.id, child.c.is_delta, newer.c.hops + 1).where(
+            child.c.parent_id == newer.c.id,
+            newer.c.is_delta,
+            newer.c.hops < COOP_LINEAGE_MAX_DEPTH,
+        )
+    )
+
+    anchor = (
+        select(*[coop.c[name] for name in fields], (-newer.c.hops).label("depth"))
+        .join(newer, newer.c.id == coop.c.id)
+        .where(~newer.c.is_delta)
+    )
+    if since is not None:
+        anchor = anchor.where(coop.c.created_at >= since)
+    lineage = anchor.cte("lineage", recursive=True)
+
+    # Walking back, a delta version's NULL figures carry over from the
+    # version after it, which the walk has just rebuilt
+    def rebuilt(name):
+        if name not in DELTA_FIELDS:
+            return parent.c[name]
+        return case(
+            (parent.c.is_delta, func.coalesce(parent.c[name], lineage.c[name])),
+            else_=parent.c[name],
+        ).label(name)
 
+    step = select(*[rebuilt(name) for name in fields], lineage.c.depth + 1).where(
+        parent.c.id == lineage.c.parent_id,
+        lineage.c.depth < depth,
+    )
+    if since is not None:
+        step = step.where(parent.c.created_at >= since)
+    return lineage.union_all(step)
+
+
+async def read_coop_lineage(
+    coop_id: int,
+    db: AsyncSession,
+    fields: Optional[List[str]] = None,
+    depth: int = COOP_LINEAGE_MAX_DEPTH,
+    since: Optional[datetime] = None,
+) -> List[dict]:
+    """A version and its ancestors, newest first, in one query"""
+    fields = fields or LINEAGE_FIELDS
+    lineage = coop_lineage(coop_id, fields, depth, since)
+    result = await db.execute(
+        select(lineage.c.depth, *[lineage.c[name] for name in fields if name != "depth"])
+        .where(lineage.c.depth >= 0)
+        .order_by(lineage.c.depth)
+    )
+    return [dict(row._mapping) for row in result]
 
-def read_coops_by_location(location_id: int, db: Session):
-    return db.query(model.DBCoops).filter(model.DBCoops.location_id == location_id).all()
 
+def export_statement(params: ExportParams):
+    """
+    Every coop version matching `params`, oldest first, with delta versions
+    rebuilt in the same query: a WITH RECURSIVE walk carries each one
+    forward to the nearest whole version, COALESCE-ing every NULL figure
+    with the newer version's, as fill_deltas does.
+    """
+    coop = model.DBCoops.__table__
+    child = coop.alias("child")
+    filters = export_filters(model.DBCoops, params)
 
-def create_coop(db_coop: model.DBCoops, db):
+    walk = select(
+        coop.c.id.label("origin"), coop.c.id, coop.c.is_delta, literal(0).label("hops"),
+        *[coop.c[name] for name in DELTA_FIELDS],
+    ).where(coop.c.is_delta, *filters).cte("rebuilt", recursive=True)
+    walk = walk.union_all(
+        select(
+            walk.c.origin, child.c.id, child.c.is_delta, walk.c.hops + 1,
+            *[func.coalesce(walk.c[name], child.c[name]).label(name) for name in DELTA_FIELDS],
+        ).where(
+            child.c.parent_id == walk.c.id,
+            walk.c.is_delta,
+            walk.c.hops < COOP_LINEAGE_MAX_DEPTH,
+        )
+    )
+    # One row per delta version: the walk's step that reached a whole version
+    rebuilt = select(walk).where(~walk.c.is_delta).subquery("rebuilt_delta")
+
+    def exported(name):
+        if name not in DELTA_FIELDS:
+            return coop.c[name]
+        # Whole versions have no rebuilt row; a delta's own values win over the walk's
+        return func.coalesce(rebuilt.c[name], coop.c[name]).label(name)
+
+    return (
+        select(*[exported(name) for name in EXPORT_FIELDS])
+        .select_from(coop.outerjoin(rebuilt, rebuilt.c.origin == coop.c.id))
+        .where(*filters)
+        .order_by(coop.c.created_at, coop.c.id)
+    )
+
+
+async def read_coops_by_location(location_id: int, db: AsyncSession, page: PageParams):
+    result = await db.execute(
+        keyset(
+            select(model.DBCoops).filter(
+                model.DBCoops.location_id == location_id,
+                model.DBCoops.is_latest_version(),
+            ),
+            model.DBCoops,
+            page,
+        )
+    )
+    return build_page(result.scalars().all(), page)
+
+
+async def create_coop(db_coop: model.DBCoops, db: AsyncSession):
     db.add(db_coop)
-    db.commit()
-    db.refresh(db_coop)
+    # A first version's id is its coop_key, so it must exist before the fact row
+    await db.flush()
+    await production.record_production([db_coop], db)
+    await db.commit()
+    await db.refresh(db_coop)
     return db_coop
 
 
-def update_coop(db_coop: model.DBCoops, db: Session):
-    db.commit()
-    db.refresh(db_coop)
+async def create_coop_version(db_coop: model.DBCoops, replaces: int, db: AsyncSession):
+    """
+    Insert a new version of a coop and retire `replaces` as its head in the
+    same transaction. Fails if `replaces` is no longer the head, so two
+    concurrent updates cannot both branch off the same version.
+
+    In delta mode the retired version keeps only what differs from `db_coop`.
+    """
+    values = {"is_head": False}
+    previous = await db.get(model.DBCoops, replaces)
+    if previous is not None:
+        db_coop.root_id = previous.coop_key
+        if COOP_HISTORY_MODE == "delta":
+            delta = delta_against(previous, db_coop)
+            values.update(delta)
+            db_coop.delta_depth = previous.delta_depth + 1 if delta else 0
+    result = await db.execute(
+        update(model.DBCoops)
+        .where(model.DBCoops.id == replaces, model.DBCoops.is_latest_version())
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        raise VersionConflictError("coop has a newer version")
+    return await create_coop(db_coop=db_coop, db=db)
+
+
+async def create_coop_versions(versions: List[model.DBCoops], db: AsyncSession):
+    """
+    Batch form of create_coop_version, in one transaction: the heads named
+    by each version's parent_id retire with one UPDATE ... RETURNING and the
+    versions whose head was still current go in with one multi-row
+    INSERT ... RETURNING. Returns (created versions, parent ids that had a
+    newer version already).
+    """
+    parent_ids = [version.parent_id for version in versions]
+    retired = set((await db.execute(
+        update(model.DBCoops)
+        .where(model.DBCoops.id.in_(parent_ids), model.DBCoops.is_latest_version())
+        .values(is_head=False)
+        .returning(model.DBCoops.id)
+        .execution_options(synchronize_session=False)
+    )).scalars().all())
+    conflicts = [parent_id for parent_id in parent_ids if parent_id not in retired]
+    versions = [version for version in versions if version.parent_id in retired]
+    if not versions:
+        await db.rollback()
+        return [], conflicts
+
+    now = model.utc_now()
+    columns = [column.name for column in model.DBCoops.__table__.columns if column.name != "id"]
+    rows = []
+    deltas = []
+    for version in versions:
+        # The caller loaded the heads, so this is an identity-map hit
+        previous = await db.get(model.DBCoops, version.parent_id)
+        row = {name: getattr(version, name) for name in columns}
+        row.update(
+            root_id=previous.coop_key,
+            is_head=True,
+            is_delta=False,
+            delta_depth=0,
+            created_at=now,
+            updated_at=now,
+        )
+        delta = delta_against(previous, version)
+        if delta:
+            deltas.append({"id": previous.id, **delta})
+            row["delta_depth"] = previous.delta_depth + 1
+        rows.append(row)
+
+    if deltas:
+        # Bulk UPDATE by primary key: one executemany per distinct set of columns
+        await db.execute(update(model.DBCoops), deltas)
+    created = (await db.execute(
+        insert(model.DBCoops).values(rows).returning(model.DBCoops)
+    )).scalars().all()
+    await production.record_production(created, db)
+    await db.commit()
+    return created, conflicts
+
+
+async def rollback_coop(coop_id: int, db: AsyncSession, to_version: Optional[int] = None):
+    """
+    Restore an ancestor of the head version `coop_id` (its parent by
+    default) as a new head. The ancestor is found and copied by one
+    INSERT ... SELECT over the lineage, so any distance back costs the same.
+    """
+    retired = await db.execute(
+        update(model.DBCoops)
+        .where(model.DBCoops.id == coop_id, model.DBCoops.is_latest_version())
+        .values(is_head=False)
+        .execution_options(synchronize_session=False)
+    )
+    if retired.rowcount != 1:
+        await db.rollback()
+        if await read_coop_by_id(coop_id, db) is None:
+            raise NotFoundError("Current version not found")
+        raise VersionConflictError("coop has a newer version")
+
+    lineage = coop_lineage(coop_id, ROLLBACK_FIELDS)
+    target = lineage.c.id == to_version if to_version is not None else lineage.c.depth == 1
+    copied = [
+        # Restoring the first version itself still leaves this a later version
+        func.coalesce(lineage.c.root_id, lineage.c.id) if name == "root_id" else lineage.c[name]
+        for name in ROLLBACK_FIELDS
+    ]
+    # The restored figures belong to the ancestor's collection day, which
+    # already has its fact row, so coop_daily_production is left alone
+    result = await db.execute(
+        insert(model.DBCoops)
+        .from_select(
+            ["parent_id", *ROLLBACK_FIELDS],
+            select(literal(coop_id), *copied)
+            .where(target, lineage.c.depth > 0),
+        )
+        .returning(model.DBCoops)
+    )
+    restored = result.scalars().first()
+    if restored is None:
+        await db.rollback()
+        raise NotFoundError("No such previous version")
+    await db.commit()
+    return restored
+
+
+async def materialize_parent(db_coop: model.DBCoops, db: AsyncSession, **values):
+    """
+    Make the version before `db_coop` whole if it is stored as a delta of
+    it, before `db_coop`'s figures change or it is deleted
+    """
+    if db_coop.parent_id is None:
+        return
+    parent = model.DBCoops
+    # Figures as last loaded, not as the caller has just set them
+    committed = inspect(db_coop).committed_state
+    rebuilt = {
+        name: case(
+            (parent.is_delta, func.coalesce(getattr(parent, name), committed.get(name, getattr(db_coop, name)))),
+            else_=getattr(parent, name),
+        )
+        for name in DELTA_FIELDS
+    }
+    await db.execute(
+        update(parent)
+        .where(parent.id == db_coop.parent_id)
+        .values(is_delta=False, **rebuilt, **values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def update_coop(db_coop: model.DBCoops, db: AsyncSession):
+    if any(inspect(db_coop).attrs[name].history.has_changes() for name in DELTA_FIELDS):
+        await materialize_parent(db_coop, db)
+    await production.record_production([db_coop], db)
+    await db.commit()
+    await db.refresh(db_coop)
     return db_coop
 
 
-def delete_coop(coop_id: int, db: Session):
-    db_coop = read_coop_by_id(coop_id, db)
-    db.delete(db_coop)
-    db.commit()
+async def delete_coop(coop_id: int, db: AsyncSession):
+    db_coop = await read_coop_by_id(coop_id, db)
+    if db_coop.is_head:
+        # The version before becomes current again
+        await materialize_parent(db_coop, db, is_head=True)
+    await db.delete(db_coop)
+    await db.commit()
     return {"message": "coop has been successfully deleted"}
 
 
-def read_coop_by_user_id(user_id: int, db):
-    return (
-        db.query(model.DBCoops)
+async def read_coop_by_user_id(user_id: int, db: AsyncSession):
+    result = await db.execute(
+        select(model.DBCoops)
         .filter(model.DBCoops.user_id == user_id, model.DBCoops.status == "active")
-        .first()
     )
+    coop = result.scalars().first()
+    if coop is not None:
+        await fill_deltas([coop], db)
+    return coop
 
 
-def find_coop_by_user_id(user_id: int, db):
-    coop = db.query(model.DBCoops).filter(model.DBCoops.user_id == user_id).first()
+async def find_coop_by_user_id(user_id: int, db: AsyncSession):
+    result = await db.execute(select(model.DBCoops).filter(model.DBCoops.user_id == user_id))
+    coop = result.scalars().first()
     if coop is None:
         raise NotFoundError("coop not found")
+    await fill_deltas([coop], db)
 
     return coop
 
 
-def find_coop_by_id(coop_id: int, db):
-    coop = db.query(model.DBCoops).filter(model.DBCoops.id == coop_id).first()
+async def find_coop_by_id(coop_id: int, db: AsyncSession):
+    result = await db.execute(select(model.DBCoops).filter(model.DBCoops.id == coop_id))
+    coop = result.scalars().first()
     if coop is None:
         raise NotFoundError("Coop not found")
+    await fill_deltas([coop], db)
     
     return coop
\ No newline at end of file
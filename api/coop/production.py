@@ -0,0 +1,153 @@
+import logging
+import os
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import scheduler
+from api.auth import model
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Months of partitions kept ready beyond the current one
+PRODUCTION_PARTITIONS_AHEAD = int(os.getenv("PRODUCTION_PARTITIONS_AHEAD", "3"))
+# ...and before it, so entering yesterday's figures on the 1st still lands
+# in a monthly partition. Older dates fall into the DEFAULT partition.
+PRODUCTION_PARTITIONS_BEHIND = int(os.getenv("PRODUCTION_PARTITIONS_BEHIND", "1"))
+PRODUCTION_PARTITION_SECONDS = float(os.getenv("PRODUCTION_PARTITION_SECONDS", "86400"))
+# pg_advisory_xact_lock key held while partitions are created
+PRODUCTION_PARTITION_LOCK = 7_260_300_001
+
+# Copied from a coop version into its day's fact row
+PRODUCTION_FIGURES = [
+    "egg_count", "crates_collected", "broken_eggs", "total_feed", "total_dead_fowls", "total_fowls",
+]
+
+
+def parse_collection_date(value: Optional[str]) -> Optional[date]:
+    """collection_date is free text; only ISO dates (optionally with a time) are recorded"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value.strip()[:10])
+    except ValueError:
+        return None
+
+
+def production_row(coop: model.DBCoops) -> Optional[dict]:
+    collection_date = parse_collection_date(coop.collection_date)
+    if collection_date is None:
+        logger.warning(f"Coop version {coop.id} has no ISO collection_date ({coop.collection_date!r}); not recorded")
+        return None
+    row = {name: getattr(coop, name) or 0 for name in PRODUCTION_FIGURES}
+    row.update(
+        coop_id=coop.coop_key,
+        collection_date=collection_date,
+        location_id=coop.location_id,
+        recorded_at=model.utc_now(),
+    )
+    return row
+
+
+async def record_production(coops: Iterable[model.DBCoops], db: AsyncSession):
+    """
+    Upsert each coop version's figures as its day's fact row, in the
+    caller's transaction. A later version for the same day replaces the
+    earlier one.
+    """
+    rows = {}
+    for coop in coops:
+        row = production_row(coop)
+        if row is not None:
+            # One statement may not touch the same row twice
+            rows[row["coop_id"], row["collection_date"]] = row
+    if not rows:
+        return
+
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(model.DBCoopDailyProduction).values(list(rows.values()))
+    statement = statement.on_conflict_do_update(
+        index_elements=["coop_id", "collection_date"],
+        set_={
+            name: statement.excluded[name]
+            for name in PRODUCTION_FIGURES + ["location_id", "recorded_at"]
+        },
+    )
+    await db.execute(statement)
+
+
+def partition_name(month: date) -> str:
+    return f"coop_daily_production_{month:%Y_%m}"
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def _create_partition(db: AsyncSession, month: date, following: date):
+    """
+    Create `month`'s partition, moving any of its rows out of the DEFAULT
+    partition first: PostgreSQL refuses a new partition whose range the
+    DEFAULT partition already holds rows for.
+    """
+    name = partition_name(month)
+    bounds = {"start": month, "end": following}
+    create = (
+        f"CREATE TABLE {name} PARTITION OF coop_daily_production "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+    )
+    default = model.PRODUCTION_DEFAULT_PARTITION
+    in_month = "collection_date >= :start AND collection_date < :end"
+
+    stranded = await db.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_month})"), bounds)
+    if not stranded:
+        await db.execute(text(create))
+        return
+
+    columns = ", ".join(column.name for column in model.DBCoopDailyProduction.__table__.columns)
+    await db.execute(text(f"ALTER TABLE coop_daily_production DETACH PARTITION {default}"))
+    await db.execute(text(create))
+    await db.execute(text(f"INSERT INTO {name} ({columns}) SELECT {columns} FROM {default} WHERE {in_month}"), bounds)
+    await db.execute(text(f"DELETE FROM {default} WHERE {in_month}"), bounds)
+    await db.execute(text(f"ALTER TABLE coop_daily_production ATTACH PARTITION {default} DEFAULT"))
+    logger.info(f"Moved {month:%Y-%m} production rows out of {default} into {name}")
+
+
+async def ensure_partitions(db: AsyncSession, start: date, months: int):
+    """Create the monthly partitions from `start`'s month onwards (PostgreSQL only)"""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    # Workers starting together would otherwise race on the same DDL
+    lock = text("SELECT pg_advisory_xact_lock(:key)").bindparams(key=PRODUCTION_PARTITION_LOCK)
+
+    # Schemas created before the model declared it have no DEFAULT partition
+    await db.execute(lock)
+    await db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {model.PRODUCTION_DEFAULT_PARTITION} "
+        "PARTITION OF coop_daily_production DEFAULT"
+    ))
+    await db.commit()
+
+    month = start.replace(day=1)
+    for _ in range(months):
+        following = add_months(month, 1)
+        await db.execute(lock)
+        exists = await db.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": partition_name(month)})
+        if not exists:
+            await _create_partition(db, month, following)
+        await db.commit()
+        month = following
+
+
+# Not run at startup: until the first run, rows for a month without a
+# partition land in DEFAULT, and ensure_partitions moves them out
+@scheduler.every(PRODUCTION_PARTITION_SECONDS, name="production-partitions")
+async def _partition_job():
+    async with AsyncSessionLocal() as db:
+        start = add_months(model.utc_now().date().replace(day=1), -PRODUCTION_PARTITIONS_BEHIND)
+        await ensure_partitions(db, start, PRODUCTION_PARTITIONS_BEHIND + PRODUCTION_PARTITIONS_AHEAD + 1)
@@ -1,24 +1,56 @@
-from api.auth import model
+from api.auth import model, policy
 from api.coop import schema, crud
 from api.buyer.crud import NotFoundError, CreationError
-from database import get_db
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from api.pagination import Page, PageParams
+from api.export import ExportParams, stream_export
+from database import get_async_db, get_async_read_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+from typing import List, Optional
 
 
 
 router = APIRouter(prefix="/coops", tags=["Coops"])
 
 
+def check_coop_update(claims: policy.Claims, coop: model.DBCoops, egg_count: int, status: str = None):
+    """Field-level rules on top of coop:update: egg counts and status have their own policies"""
+    policy.check_location(claims, coop.location_id)
+    if egg_count != coop.egg_count and not claims.allows("coop:count_eggs"):
+        raise HTTPException(status_code=403, detail="Not allowed to change the egg count")
+    if status is not None and status != coop.status and not claims.allows("coop:update_status"):
+        raise HTTPException(status_code=403, detail="Not allowed to change the coop status")
+
+
+def new_coop_version(existing_coop: model.DBCoops, coop_update: schema.DailyCoopUpdate) -> model.DBCoops:
+    """A new instance with the updated values, linking to the previous version"""
+    return model.DBCoops(
+        parent_id=existing_coop.id,  # Link to previous version
+        user_id=existing_coop.user_id,
+        status=coop_update.status,
+        total_fowls=coop_update.total_fowls,
+        total_dead_fowls=coop_update.total_dead_fowls,
+        total_feed=coop_update.total_feed,
+        coop_name=existing_coop.coop_name,  # Keep coop_name the same
+        egg_count=coop_update.egg_count,
+        collection_date=coop_update.collection_date,
+        crates_collected=coop_update.crates_collected,
+        remainder_eggs=coop_update.remainder_eggs,
+        broken_eggs=coop_update.broken_eggs,
+        notes=coop_update.notes,
+        efficiency=coop_update.efficiency,
+        location_id=coop_update.location_id,
+    )
+
+
 @router.post("/", response_model=schema.Coop)
 async def create_new_coop(
-    coop_detail: schema.CoopCreate, db=Depends(get_db)
+    coop_detail: schema.CoopCreate,
+    db=Depends(get_async_db),
+    claims: policy.Claims = Depends(policy.require("coop:create")),
 ) -> schema.CoopCreate:
     try:
-        # check if user is admin
-        # is_admin = utils.admin_status(user_id=coop_detail.user_id, db=db)
-        
         new_coop = model.DBCoops(
             # id=coop_detail.id,
             user_id=coop_detail.user_id,
@@ -29,14 +61,16 @@ async def create_new_coop(
             total_fowls=coop_detail.total_fowls,
             coop_name=coop_detail.coop_name,
             collection_date=coop_detail.collection_date,
+            crates_collected=coop_detail.crates_collected,
             remainder_eggs=coop_detail.remainder_eggs,
+            broken_eggs=coop_detail.broken_eggs,
             notes=coop_detail.notes,
             efficiency=coop_detail.efficiency,
             egg_count=coop_detail.egg_count,
             location_id=coop_detail.location_id,
         )
         
-        add_new_coop = crud.create_coop(db_coop=new_coop, db=db)
+        add_new_coop = await crud.create_coop(db_coop=new_coop, db=db)
         # return add_new_coop
         # print(add_new_coop.user_id, '<<<this is the user id')
         # print(add_new_coop.id, '<<<this is the id')
@@ -64,10 +98,27 @@ async def create_new_coop(
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 
-@router.get("/",)
-async def get_all_coops(db=Depends(get_db)) -> list[schema.CoopOutput]:
+@router.get("/export")
+async def export_coops(
+    request: Request,
+    params: ExportParams = Depends(),
+    claims: policy.Claims = Depends(policy.require("data:export")),
+):
+    """Export coop records, including every version as NDJSON or CSV, streamed from a server-side cursor"""
+    return stream_export(
+        request,
+        model.DBCoops,
+        params,
+        filename="coops",
+        columns=crud.EXPORT_FIELDS,
+        statement=crud.export_statement(params),
+    )
+
+
+@router.get("/", response_model=Page[schema.CoopOutput])
+async def get_all_coops(page: PageParams = Depends(), db=Depends(get_async_read_db)):
     try:
-        return crud.read_coops(db)
+        return await crud.read_coops(db, page)
     except NotFoundError as e:
         raise HTTPException(e, "there are no coops to display")
     except Exception as e:
@@ -76,13 +127,13 @@ async def get_all_coops(db=Depends(get_db)) -> list[schema.CoopOutput]:
 
 
 @router.get("/{coop_id: int}", response_model=schema.CoopOutput)
-async def get_coop_by_id(coop_id: int, db=Depends(get_db)):
+async def get_coop_by_id(coop_id: int, db=Depends(get_async_read_db)):
     # try:
     #     return crud.read_coop_by_id(id, db=db)
     # except NotFoundError as e:
     #     raise HTTPException(e, "coop does not exist")
     try:
-        coop = crud.read_coop_by_id(coop_id, db)
+        coop = await crud.read_coop_by_id(coop_id, db)
         if coop is None:
             raise HTTPException(status_code=404, detail="coop not found")
         return coop
@@ -92,10 +143,34 @@ async def get_coop_by_id(coop_id: int, db=Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error retrieving coop: {str(e)}")
 
 
+@router.get("/{coop_id}/lineage", response_model=list[dict])
+async def get_coop_lineage(
+    coop_id: int,
+    depth: int = Query(crud.COOP_LINEAGE_MAX_DEPTH, ge=0, le=crud.COOP_LINEAGE_MAX_DEPTH, description="Ancestors to include"),
+    since: Optional[datetime] = Query(None, description="Stop at the first version created before this time"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return; all by default"),
+    db=Depends(get_async_read_db),
+):
+    """A coop version and its ancestors, newest first, following parent_id so renames do not break the chain"""
+    selected = None
+    if fields:
+        selected = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = sorted(set(selected) - set(crud.LINEAGE_FIELDS))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+    lineage = await crud.read_coop_lineage(coop_id, db, fields=selected, depth=depth, since=since)
+    if not lineage:
+        raise HTTPException(status_code=404, detail="coop not found")
+    return lineage
+
+
 @router.get("/{coop_name: str}/history", response_model=list[schema.CoopUpdate])
-async def get_coop_by_coop_name(coop_name: str, db=Depends(get_db)):
+async def get_coop_by_coop_name(coop_name: str, db=Depends(get_async_read_db)):
     try:
-        return crud.read_coop_by_coop_name(coop_name, db=db)
+        return await crud.read_coop_by_coop_name(coop_name, db=db)
     except NotFoundError as e:
         raise HTTPException(e, "coop does not exist")
     except Exception as e:
@@ -104,9 +179,13 @@ async def get_coop_by_coop_name(coop_name: str, db=Depends(get_db)):
 
 
 @router.delete("/{coop_id: int}")
-async def delete_coop_by_id(coop_id: int, db=Depends(get_db)):
+async def delete_coop_by_id(
+    coop_id: int,
+    db=Depends(get_async_db),
+    claims: policy.Claims = Depends(policy.require("coop:delete")),
+):
     try:
-        coop = crud.find_coop_by_id(coop_id, db=db)
+        coop = await crud.find_coop_by_id(coop_id, db=db)
     #     if coop is None:
     #         raise NotFoundError('coop you are trying to delete does not exist')
     #     return crud.delete_coop(coop_id=id, db=db)
@@ -114,7 +193,7 @@ async def delete_coop_by_id(coop_id: int, db=Depends(get_db)):
     #     raise HTTPException(
     #         404, "coop with this id does not exist"
         if coop:
-            return crud.delete_coop(coop_id, db)
+            return await crud.delete_coop(coop_id, db)
     except NotFoundError:
         raise HTTPException(status_code=404, detail="coop with this id does not exist")
     except Exception as e:
@@ -124,11 +203,21 @@ async def delete_coop_by_id(coop_id: int, db=Depends(get_db)):
 
 @router.patch("/{coop_id: int}", response_model=schema.CoopUpdate)
 async def daily_coop_update_by_id(
-    coop_id: int, update_coop: schema.CoopUpdate, db=Depends(get_db)
+    coop_id: int,
+    update_coop: schema.CoopUpdate,
+    db=Depends(get_async_db),
+    claims: policy.Claims = Depends(policy.require("coop:update")),
 ):
     try:
-        coop = crud.find_coop_by_id(coop_id, db=db)
-        print(coop, '<<<<this is the coop')
+        coop = await crud.find_coop_by_id(coop_id, db=db)
+        # Editing in place is only safe on the head; an older version (or a
+        # reverse delta) would change history under the versions after it
+        if not coop.is_head:
+            raise HTTPException(
+                status_code=409,
+                detail="Only the latest version of a coop can be updated"
+            )
+        check_coop_update(claims, coop, update_coop.egg_count or coop.egg_count)
         if update_coop.total_fowls:
             coop.total_fowls = update_coop.total_fowls
         if update_coop.total_dead_fowls:
@@ -150,21 +239,28 @@ async def daily_coop_update_by_id(
         if update_coop.efficiency:
             coop.efficiency = update_coop.efficiency
 
-        return crud.update_coop(db_coop=coop, db=db)
+        return await crud.update_coop(db_coop=coop, db=db)
 
     except NotFoundError:
         raise HTTPException(
             404, "coop with this id cannot be updated"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating coop: {str(e)}")
 
 
 @router.patch("/{coop_id}", response_model=schema.CoopUpdate)
-async def update_coop(coop_id: int, coop_update: schema.DailyCoopUpdate, db: Session = Depends(get_db)):
+async def update_coop(
+    coop_id: int,
+    coop_update: schema.DailyCoopUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    claims: policy.Claims = Depends(policy.require("coop:update")),
+):
     try:
         # fetch existing record
-        existing_coop = crud.read_coop_by_id(coop_id, db=db)
+        existing_coop = await crud.read_coop_by_id(coop_id, db=db)
 
         if not existing_coop:
             raise HTTPException(
@@ -172,94 +268,115 @@ async def update_coop(coop_id: int, coop_update: schema.DailyCoopUpdate, db: Ses
                 detail="Coop record not found"
             )
 
-        # Create a new instance with the updated values, linking to the previous version
-        new_coop = model.DBCoops(
-            parent_id=existing_coop.id,  # Link to previous version
-            user_id=existing_coop.user_id,
-            status=coop_update.status,
-            total_fowls=coop_update.total_fowls,
-            total_dead_fowls=coop_update.total_dead_fowls,
-            total_feed=coop_update.total_feed,
-            coop_name=existing_coop.coop_name,  # Keep coop_name the same
-            egg_count=coop_update.egg_count,
-            collection_date=coop_update.collection_date,
-            crates_collected=coop_update.crates_collected,
-            remainder_eggs=coop_update.remainder_eggs,
-            broken_eggs=coop_update.broken_eggs,
-            notes=coop_update.notes,
-            efficiency=coop_update.efficiency,
-            location_id=coop_update.location_id,
-        )
+        check_coop_update(claims, existing_coop, coop_update.egg_count, coop_update.status)
+        policy.check_location(claims, coop_update.location_id)
 
-        add_coop_update = crud.create_coop(db_coop=new_coop, db=db)
+        new_coop = new_coop_version(existing_coop, coop_update)
+
+        add_coop_update = await crud.create_coop_version(db_coop=new_coop, replaces=existing_coop.id, db=db)
 
         return add_coop_update
+    except crud.VersionConflictError:
+        raise HTTPException(
+            status_code=409,
+            detail="Only the latest version of a coop can be updated"
+        )
     except CreationError as err:
         raise HTTPException(500, err)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating coop: {str(e)}")
 
 
 
-@router.post("/{id}/rollback", response_model=schema.CoopUpdate)
-async def rollback_coop(id: int, db: Session = Depends(get_db)):
+@router.post("/daily-batch", response_model=schema.DailyCoopBatchResult)
+async def daily_coop_batch(
+    batch: schema.DailyCoopBatch,
+    db: AsyncSession = Depends(get_async_db),
+    claims: policy.Claims = Depends(policy.require("coop:update")),
+):
+    """
+    A day's updates for many coops at once. Each item is checked like
+    PATCH /coops/{coop_id}; the ones that pass become new versions together
+    in one transaction, and every item gets its own result.
+    """
     try:
-        current_version = crud.read_coop_by_id(coop_id=id, db=db)
-
-        if not current_version:
-            raise HTTPException(
-                status_code=404,
-                detail="Current version not found"
-            )
-        
-        if not current_version.parent_id:
-            raise HTTPException(
-                status_code=400,
-                detail="No previous version available for rollback"
-            )
-        
-        # find previous version
-        old_version = crud.read_coop_by_version(coop_id=current_version.parent_id, db=db)
-
-        if not old_version:
-            raise HTTPException(
-                status_code=404,
-                detail="Previous version not found"
-            )
-
-        # Create a new record with the old data (restoring it)
-        restored_coop = model.DBCoops(
-            parent_id=old_version.parent_id,  # Keep the link to the version before that
-            user_id=old_version.user_id,
-            status=old_version.status,
-            total_fowls=old_version.total_fowls,
-            total_dead_fowls=old_version.total_dead_fowls,
-            total_feed=old_version.total_feed,
-            coop_name=old_version.coop_name,
-            egg_count=old_version.egg_count,
-            collection_date=old_version.collection_date,
-            crates_collected=old_version.crates_collected,
-            remainder_eggs=old_version.remainder_eggs,
-            broken_eggs=old_version.broken_eggs,
-            notes=old_version.notes,
-            efficiency=old_version.efficiency,
+        heads = {coop.id: coop for coop in await crud.read_coops_by_ids([item.coop_id for item in batch.items], db)}
+
+        results = {}
+        versions = {}
+        for index, item in enumerate(batch.items):
+            existing_coop = heads.get(item.coop_id)
+            try:
+                if existing_coop is None:
+                    raise HTTPException(status_code=404, detail="Coop record not found")
+                if item.coop_id in versions:
+                    raise HTTPException(status_code=400, detail="Coop appears more than once in the batch")
+                if not existing_coop.is_head:
+                    raise HTTPException(status_code=409, detail="Only the latest version of a coop can be updated")
+                check_coop_update(claims, existing_coop, item.egg_count, item.status)
+                policy.check_location(claims, item.location_id)
+            except HTTPException as err:
+                results[index] = schema.DailyCoopBatchItemResult(
+                    coop_id=item.coop_id, status="failed", status_code=err.status_code, detail=err.detail
+                )
+                continue
+            versions[item.coop_id] = (index, new_coop_version(existing_coop, item))
+
+        created, _ = await crud.create_coop_versions([version for _, version in versions.values()], db)
+        created_by_parent = {coop.parent_id: coop for coop in created}
+        for coop_id, (index, _) in versions.items():
+            coop = created_by_parent.get(coop_id)
+            if coop is None:
+                results[index] = schema.DailyCoopBatchItemResult(
+                    coop_id=coop_id,
+                    status="failed",
+                    status_code=409,
+                    detail="Only the latest version of a coop can be updated",
+                )
+            else:
+                results[index] = schema.DailyCoopBatchItemResult(coop_id=coop_id, status="created", id=coop.id)
+
+        return schema.DailyCoopBatchResult(
+            results=[results[index] for index in range(len(batch.items))],
+            created=len(created),
+            failed=len(batch.items) - len(created),
         )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating coops: {str(e)}")
 
-        rolled_back = crud.create_coop(db_coop=restored_coop, db=db)
 
-        return rolled_back
+@router.post("/{id}/rollback", response_model=schema.CoopUpdate)
+async def rollback_coop(
+    id: int,
+    to: Optional[int] = Query(None, description="Id of the ancestor version to restore; defaults to the previous one"),
+    db: AsyncSession = Depends(get_async_db),
+    claims: policy.Claims = Depends(policy.require("coop:rollback")),
+):
+    try:
+        return await crud.rollback_coop(id, db=db, to_version=to)
 
+    except crud.NotFoundError as err:
+        raise HTTPException(status_code=404, detail=str(err))
+    except crud.VersionConflictError:
+        raise HTTPException(
+            status_code=409,
+            detail="Only the latest version of a coop can be rolled back"
+        )
     except CreationError as err:
         raise HTTPException(500, err)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error rolling back coop: {str(e)}")
 
 
-@router.get("/location/{location_id}", response_model=List[schema.CoopOutput])
-async def get_coops_by_location(location_id: int, db=Depends(get_db)):
+@router.get("/location/{location_id}", response_model=Page[schema.CoopOutput])
+async def get_coops_by_location(location_id: int, page: PageParams = Depends(), db=Depends(get_async_read_db)):
     try:
-        coop = crud.read_coops_by_location(location_id, db)
-        if not coop:
+        coop = await crud.read_coops_by_location(location_id, db, page)
+        if not coop["items"]:
             raise HTTPException(status_code=404, detail="No coop found for this location")
         return coop
     except NotFoundError:
@@ -1,6 +1,9 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+
+# Largest daily batch accepted in one request
+DAILY_BATCH_MAX_ITEMS = 500
 
 
 class CoopBase(BaseModel):
@@ -64,6 +67,28 @@ class DailyCoopUpdate(BaseModel):
     location_id: int
 
 
+class DailyCoopBatchItem(DailyCoopUpdate):
+    coop_id: int
+
+
+class DailyCoopBatch(BaseModel):
+    items: List[DailyCoopBatchItem] = Field(..., min_length=1, max_length=DAILY_BATCH_MAX_ITEMS)
+
+
+class DailyCoopBatchItemResult(BaseModel):
+    coop_id: int
+    status: str  # "created" or "failed"
+    id: Optional[int] = None  # the new version, when created
+    status_code: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class DailyCoopBatchResult(BaseModel):
+    results: List[DailyCoopBatchItemResult]
+    created: int
+    failed: int
+
+
 class Coop(BaseModel):
     id: int
     parent_id: Optional[int]
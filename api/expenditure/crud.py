@@ -1,5 +1,7 @@
 from api.auth import model
-from sqlalchemy.orm import Session
+from api.pagination import PageParams, build_page, keyset
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class NotFoundError(Exception):
@@ -10,74 +12,90 @@ class CreationError(Exception):
     pass
 
 
-def read_expenditures(db: Session):
-    return db.query(model.DBExpenditure).all()
+async def read_expenditures(db: AsyncSession, page: PageParams):
+    result = await db.execute(keyset(select(model.DBExpenditure), model.DBExpenditure, page))
+    return build_page(result.scalars().all(), page)
 
 
-def read_expenditure_by_id(expenditure_id: int, db: Session):
-    return db.query(model.DBExpenditure).filter(model.DBExpenditure.id == expenditure_id).first()
+async def read_expenditure_by_id(expenditure_id: int, db: AsyncSession):
+    result = await db.execute(select(model.DBExpenditure).filter(model.DBExpenditure.id == expenditure_id))
+    return result.scalars().first()
 
 
-def create_expenditure(db_expenditure: model.DBExpenditure, db: Session):
+async def create_expenditure(db_expenditure: model.DBExpenditure, db: AsyncSession):
     try:
         db.add(db_expenditure)
-        db.commit()
-        db.refresh(db_expenditure)
+        await db.commit()
+        await db.refresh(db_expenditure)
         return db_expenditure
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise CreationError(f"Failed to create expenditure: {str(e)}")
 
 
-def update_expenditure(db_expenditure: model.DBExpenditure, db: Session):
+async def update_expenditure(db_expenditure: model.DBExpenditure, db: AsyncSession):
     try:
-        db.commit()
-        db.refresh(db_expenditure)
+        await db.commit()
+        await db.refresh(db_expenditure)
         return db_expenditure
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise Exception(f"Failed to update expenditure: {str(e)}")
 
 
-def delete_expenditure(expenditure_id: int, db: Session):
-    db_expenditure = read_expenditure_by_id(expenditure_id, db)
+async def delete_expenditure(expenditure_id: int, db: AsyncSession):
+    db_expenditure = await read_expenditure_by_id(expenditure_id, db)
     if db_expenditure is None:
         raise NotFoundError("Expenditure not found")
     
     try:
-        db.delete(db_expenditure)
-        db.commit()
+        await db.delete(db_expenditure)
+        await db.commit()
         return {"message": "Expenditure has been successfully deleted"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise Exception(f"Failed to delete expenditure: {str(e)}")
 
 
-def read_expenditure_by_reference(reference: str, db: Session):
-    expenditure = db.query(model.DBExpenditure).filter(model.DBExpenditure.reference == reference).first()
+async def read_expenditure_by_reference(reference: str, db: AsyncSession):
+    result = await db.execute(select(model.DBExpenditure).filter(model.DBExpenditure.reference == reference))
+    expenditure = result.scalars().first()
     if expenditure is None:
         raise NotFoundError("Expenditure not found")
     return expenditure
 
 
-def find_expenditure_by_id(expenditure_id: int, db: Session):
-    expenditure = db.query(model.DBExpenditure).filter(model.DBExpenditure.id == expenditure_id).first()
+async def find_expenditure_by_id(expenditure_id: int, db: AsyncSession):
+    result = await db.execute(select(model.DBExpenditure).filter(model.DBExpenditure.id == expenditure_id))
+    expenditure = result.scalars().first()
     if expenditure is None:
         raise NotFoundError("Expenditure not found")
     return expenditure
 
 
-def read_expenditures_by_location(location_id: int, db: Session):
-    return db.query(model.DBExpenditure).filter(model.DBExpenditure.location_id == location_id).all()
+async def read_expenditures_by_location(location_id: int, db: AsyncSession, page: PageParams):
+    result = await db.execute(
+        keyset(select(model.DBExpenditure).filter(model.DBExpenditure.location_id == location_id), model.DBExpenditure, page)
+    )
+    return build_page(result.scalars().all(), page)
 
 
-def read_expenditures_by_user(user_id: int, db: Session):
-    return db.query(model.DBExpenditure).filter(model.DBExpenditure.user_id == user_id).all()
+async def read_expenditures_by_user(user_id: int, db: AsyncSession, page: PageParams):
+    result = await db.execute(
+        keyset(select(model.DBExpenditure).filter(model.DBExpenditure.user_id == user_id), model.DBExpenditure, page)
+    )
+    return build_page(result.scalars().all(), page)
 
 
-def read_expenditures_by_category(category: str, db: Session):
-    return db.query(model.DBExpenditure).filter(model.DBExpenditure.category == category).all()
+async def read_expenditures_by_category(category: str, db: AsyncSession, page: PageParams):
+    result = await db.execute(
+        keyset(select(model.DBExpenditure).filter(model.DBExpenditure.category == category), model.DBExpenditure, page)
+    )
+    return build_page(result.scalars().all(), page)
 
 
-def read_expenditures_by_status(status: str, db: Session):
-    return db.query(model.DBExpenditure).filter(model.DBExpenditure.status == status).all()
\ No newline at end of file
+async def read_expenditures_by_status(status: str, db: AsyncSession, page: PageParams):
+    result = await db.execute(
+        keyset(select(model.DBExpenditure).filter(model.DBExpenditure.status == status), model.DBExpenditure, page)
+    )
+    return build_page(result.scalars().all(), page)
\ No newline at end of file
@@ -1,8 +1,10 @@
-from api.auth import model
+from api.auth import model, policy
 from api.expenditure import schema, crud
 from api.expenditure.crud import NotFoundError, CreationError
-from database import get_db
-from fastapi import APIRouter, Depends, HTTPException
+from api.pagination import Page, PageParams
+from api.export import ExportParams, stream_export
+from database import get_async_db, get_async_read_db
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import List
 
 router = APIRouter(prefix="/expenditures", tags=["Expenditures"])
@@ -10,7 +12,7 @@ router = APIRouter(prefix="/expenditures", tags=["Expenditures"])
 
 @router.post("/", response_model=schema.Expenditure)
 async def create_new_expenditure(
-    expenditure_detail: schema.ExpenditureCreate, db=Depends(get_db)
+    expenditure_detail: schema.ExpenditureCreate, db=Depends(get_async_db)
 ) -> schema.Expenditure:
     try:
         new_expenditure = model.DBExpenditure(
@@ -24,7 +26,7 @@ async def create_new_expenditure(
             location_id=expenditure_detail.location_id,
         )
 
-        add_new_expenditure = crud.create_expenditure(new_expenditure, db)
+        add_new_expenditure = await crud.create_expenditure(new_expenditure, db)
 
         return {
             "id": add_new_expenditure.id,
@@ -43,33 +45,55 @@ async def create_new_expenditure(
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 
-@router.get("/", response_model=List[schema.ExpenditureOutput])
-async def get_all_expenditures(db=Depends(get_db)):
+# Declared before the "/{id}" routes so "export" is not taken for an id
+@router.get("/export")
+async def export_expenditures(
+    request: Request,
+    params: ExportParams = Depends(),
+    claims: policy.Claims = Depends(policy.require("data:export")),
+):
+    """Export expenditure records as NDJSON or CSV, streamed from a server-side cursor"""
+    return stream_export(request, model.DBExpenditure, params, filename="expenditures")
+
+
+@router.get("/", response_model=Page[schema.ExpenditureOutput])
+async def get_all_expenditures(
+    page: PageParams = Depends(),
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     try:
-        expenditures = crud.read_expenditures(db)
-        if not expenditures:
-            return []
-        return expenditures
+        return await crud.read_expenditures(db, page)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving expenditures: {str(e)}")
 
 
-@router.get("/user/{user_id}", response_model=List[schema.ExpenditureOutput])
-async def get_expenditures_by_user(user_id: int, db=Depends(get_db)):
+@router.get("/user/{user_id}", response_model=Page[schema.ExpenditureOutput])
+async def get_expenditures_by_user(
+    user_id: int,
+    page: PageParams = Depends(),
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     try:
-        expenditures = crud.read_expenditures_by_user(user_id, db)
-        if not expenditures:
+        expenditures = await crud.read_expenditures_by_user(user_id, db, page)
+        if not expenditures["items"]:
             raise HTTPException(status_code=404, detail="No expenditures found for this user")
         return expenditures
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving expenditures: {str(e)}")
 
 
-@router.get("/location/{location_id}", response_model=List[schema.ExpenditureOutput])
-async def get_expenditures_by_location(location_id: int, db=Depends(get_db)):
+@router.get("/location/{location_id}", response_model=Page[schema.ExpenditureOutput])
+async def get_expenditures_by_location(
+    location_id: int,
+    page: PageParams = Depends(),
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     try:
-        expenditures = crud.read_expenditures_by_location(location_id, db)
-        if not expenditures:
+        expenditures = await crud.read_expenditures_by_location(location_id, db, page)
+        if not expenditures["items"]:
             raise HTTPException(status_code=404, detail="No expenditures found for this location")
         return expenditures
     except NotFoundError:
@@ -78,11 +102,16 @@ async def get_expenditures_by_location(location_id: int, db=Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error retrieving expenditures: {str(e)}")
 
 
-@router.get("/category/{category}", response_model=List[schema.ExpenditureOutput])
-async def get_expenditures_by_category(category: str, db=Depends(get_db)):
+@router.get("/category/{category}", response_model=Page[schema.ExpenditureOutput])
+async def get_expenditures_by_category(
+    category: str,
+    page: PageParams = Depends(),
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     try:
-        expenditures = crud.read_expenditures_by_category(category, db)
-        if not expenditures:
+        expenditures = await crud.read_expenditures_by_category(category, db, page)
+        if not expenditures["items"]:
             raise HTTPException(status_code=404, detail="No expenditures found for this category")
         return expenditures
     except NotFoundError:
@@ -91,11 +120,16 @@ async def get_expenditures_by_category(category: str, db=Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error retrieving expenditures: {str(e)}")
 
 
-@router.get("/status/{status}", response_model=List[schema.ExpenditureOutput])
-async def get_expenditures_by_status(status: str, db=Depends(get_db)):
+@router.get("/status/{status}", response_model=Page[schema.ExpenditureOutput])
+async def get_expenditures_by_status(
+    status: str,
+    page: PageParams = Depends(),
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     try:
-        expenditures = crud.read_expenditures_by_status(status, db)
-        if not expenditures:
+        expenditures = await crud.read_expenditures_by_status(status, db, page)
+        if not expenditures["items"]:
             raise HTTPException(status_code=404, detail="No expenditures found with this status")
         return expenditures
     except NotFoundError as e:
@@ -105,9 +139,13 @@ async def get_expenditures_by_status(status: str, db=Depends(get_db)):
 
 
 @router.get("/{expenditure_id}", response_model=schema.ExpenditureOutput)
-async def get_expenditure_by_id(expenditure_id: int, db=Depends(get_db)):
+async def get_expenditure_by_id(
+    expenditure_id: int,
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     try:
-        expenditure = crud.read_expenditure_by_id(expenditure_id, db)
+        expenditure = await crud.read_expenditure_by_id(expenditure_id, db)
         if expenditure is None:
             raise HTTPException(status_code=404, detail="Expenditure not found")
         return expenditure
@@ -118,9 +156,13 @@ async def get_expenditure_by_id(expenditure_id: int, db=Depends(get_db)):
 
 
 @router.get("/reference/{reference}", response_model=schema.ExpenditureOutput)
-async def get_expenditure_by_reference(reference: str, db=Depends(get_db)):
+async def get_expenditure_by_reference(
+    reference: str,
+    db=Depends(get_async_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
     try:
-        return crud.read_expenditure_by_reference(reference, db)
+        return await crud.read_expenditure_by_reference(reference, db)
     except NotFoundError as e:
         raise HTTPException(status_code=404, detail="Expenditure not found")
     except Exception as e:
@@ -128,11 +170,11 @@ async def get_expenditure_by_reference(reference: str, db=Depends(get_db)):
 
 
 @router.delete("/{expenditure_id}")
-async def delete_expenditure_by_id(expenditure_id: int, db=Depends(get_db)):
+async def delete_expenditure_by_id(expenditure_id: int, db=Depends(get_async_db)):
     try:
-        expenditure = crud.find_expenditure_by_id(expenditure_id, db)
+        expenditure = await crud.find_expenditure_by_id(expenditure_id, db)
         if expenditure:
-            return crud.delete_expenditure(expenditure_id, db)
+            return await crud.delete_expenditure(expenditure_id, db)
     except NotFoundError:
         raise HTTPException(status_code=404, detail="Expenditure with this id does not exist")
     except Exception as e:
@@ -141,10 +183,10 @@ async def delete_expenditure_by_id(expenditure_id: int, db=Depends(get_db)):
 
 @router.patch("/{expenditure_id}", response_model=schema.ExpenditureOutput)
 async def update_expenditure_by_id(
-    expenditure_id: int, update_expenditure: schema.ExpenditureUpdate, db=Depends(get_db)
+    expenditure_id: int, update_expenditure: schema.ExpenditureUpdate, db=Depends(get_async_db)
 ):
     try:
-        expenditure = crud.find_expenditure_by_id(expenditure_id, db)
+        expenditure = await crud.find_expenditure_by_id(expenditure_id, db)
         
         # Update fields only if they are provided in the request
         if update_expenditure.reference:
@@ -158,7 +200,7 @@ async def update_expenditure_by_id(
         if update_expenditure.approved_by:
             expenditure.approved_by = update_expenditure.approved_by
 
-        return crud.update_expenditure(db_expenditure=expenditure, db=db)
+        return await crud.update_expenditure(db_expenditure=expenditure, db=db)
 
     except NotFoundError:
         raise HTTPException(
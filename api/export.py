@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from fastapi import Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from database import read_session
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class ExportParams:
+    """Query parameters shared by the /export routes"""
+
+    def __init__(
+        self,
+        format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+        since: Optional[datetime] = Query(None, description="Only rows created at or after this time"),
+        until: Optional[datetime] = Query(None, description="Only rows created before this time"),
+        location_id: Optional[int] = Query(None, description="Only rows for this location"),
+    ):
+        self.format = format
+        self.since = _naive_utc(since)
+        self.until = _naive_utc(until)
+        self.location_id = location_id
+
+
+def export_filters(entity, params: ExportParams) -> list:
+    """WHERE clauses for the since / until / location_id parameters"""
+    filters = []
+    if params.since is not None:
+        filters.append(entity.created_at >= params.since)
+    if params.until is not None:
+        filters.append(entity.created_at < params.until)
+    if params.location_id is not None:
+        filters.append(entity.location_id == params.location_id)
+    return filters
+
+
+def export_statement(entity, columns: List[str], params: ExportParams):
+    """
+    Select plain column tuples rather than ORM objects, so rows are never
+    tracked in the identity map or validated through Pydantic
+    """
+    return (
+        select(*[getattr(entity, column) for column in columns])
+        .where(*export_filters(entity, params))
+        .order_by(entity.created_at, entity.id)
+    )
+
+
+async def _rows(request: Request, statement, columns: List[str], format: str):
+    async with read_session(request) as db:
+        result = await db.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            async for partition in result.partitions():
+                writer.writerows(partition)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            # Header only, when nothing matched
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            async for partition in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+                    for row in partition
+                )
+
+
+def stream_export(
+    request: Request,
+    entity,
+    params: ExportParams,
+    filename: str,
+    columns: Optional[List[str]] = None,
+    statement=None,
+):
+    """
+    Stream `entity` rows (every column by default) as NDJSON or CSV with
+    constant memory. A caller that must compute some columns passes its own
+    `statement`, selecting `columns` in order.
+    """
+    if columns is None:
+        columns = [column.name for column in entity.__table__.columns]
+    if statement is None:
+        statement = export_statement(entity, columns, params)
+    return StreamingResponse(
+        _rows(request, statement, columns, params.format),
+        media_type=MEDIA_TYPES[params.format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{params.format}"'},
+    )
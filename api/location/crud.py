@@ -1,8 +1,11 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import Integer, any_, case, func, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
 from typing import List, Optional
-from api.auth.model import DBLocation, DBUser, DBCoops  # Import your models
+from api.auth import cache, policy
+from api.auth.model import DBLocation, DBUser, DBCoops, DBBuyer, DBExpenditure, utc_now  # Import your models
 from api.location.schema import LocationCreate, LocationUpdate
+from api.pagination import PageParams, build_page, keyset
 
 
 class LocationCRUD:
@@ -33,19 +36,21 @@ class LocationCRUD:
         return db.query(DBLocation).filter(DBLocation.name == name).first()
     
     @staticmethod
-    def get_locations(db: Session, skip: int = 0, limit: int = 100) -> List[DBLocation]:
+    def get_locations(db: Session, page: PageParams) -> dict:
         """Get all locations with pagination"""
-        return db.query(DBLocation).offset(skip).limit(limit).all()
+        return build_page(db.scalars(keyset(select(DBLocation), DBLocation, page)).all(), page)
     
     @staticmethod
-    def get_locations_by_status(db: Session, status: str, skip: int = 0, limit: int = 100) -> List[DBLocation]:
+    def get_locations_by_status(db: Session, status: str, page: PageParams) -> dict:
         """Get locations by status"""
-        return db.query(DBLocation).filter(DBLocation.status == status).offset(skip).limit(limit).all()
+        statement = select(DBLocation).filter(DBLocation.status == status)
+        return build_page(db.scalars(keyset(statement, DBLocation, page)).all(), page)
     
     @staticmethod
-    def get_locations_by_region(db: Session, region: str, skip: int = 0, limit: int = 100) -> List[DBLocation]:
+    def get_locations_by_region(db: Session, region: str, page: PageParams) -> dict:
         """Get locations by region"""
-        return db.query(DBLocation).filter(DBLocation.region == region).offset(skip).limit(limit).all()
+        statement = select(DBLocation).filter(DBLocation.region == region)
+        return build_page(db.scalars(keyset(statement, DBLocation, page)).all(), page)
     
     @staticmethod
     def update_location(db: Session, location_id: int, location_update: LocationUpdate) -> Optional[DBLocation]:
@@ -92,24 +97,68 @@ class LocationCRUD:
             "manager_name": manager_name
         }
     
+    @staticmethod
+    def summary_statement():
+        """
+        Location columns plus per-location aggregates as correlated
+        subqueries, so any page of locations costs a single round trip and
+        each aggregate is an index range scan on its location_id. LEFT
+        JOINs to GROUP BY subqueries would aggregate every location's rows
+        before the keyset LIMIT picks one page of them.
+        """
+        month_start = utc_now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        coops = select(func.count(DBCoops.id)).where(
+            DBCoops.location_id == DBLocation.id,
+            DBCoops.is_latest_version()
+        )
+        return select(
+            *DBLocation.__table__.columns,
+            coops.scalar_subquery().label("total_coops"),
+            coops.where(DBCoops.status == 'active').scalar_subquery().label("active_coops"),
+            select(func.count(DBUser.id))
+            .where(DBUser.location_id == DBLocation.id)
+            .scalar_subquery().label("user_count"),
+            select(func.count(DBBuyer.id))
+            .where(DBBuyer.location_id == DBLocation.id, DBBuyer.status_of_delivery == 'pending')
+            .scalar_subquery().label("pending_buyer_orders"),
+            select(func.coalesce(func.sum(DBExpenditure.amount), 0))
+            .where(DBExpenditure.location_id == DBLocation.id, DBExpenditure.created_at >= month_start)
+            .scalar_subquery().label("month_to_date_expenditure"),
+        )
+
+    @staticmethod
+    def get_location_summaries(
+        db: Session,
+        page: PageParams,
+        status: Optional[str] = None,
+        region: Optional[str] = None,
+        search: Optional[str] = None
+    ) -> dict:
+        """Get one page of locations with coop, user, buyer and expenditure aggregates"""
+        statement = LocationCRUD.summary_statement()
+        if status:
+            statement = statement.filter(DBLocation.status == status)
+        if region:
+            statement = statement.filter(DBLocation.region == region)
+        if search:
+            search_pattern = f"%{search}%"
+            statement = statement.filter(
+                (DBLocation.name.ilike(search_pattern)) |
+                (DBLocation.address.ilike(search_pattern)) |
+                (DBLocation.region.ilike(search_pattern))
+            )
+        return build_page(db.execute(keyset(statement, DBLocation, page)).all(), page)
+
     @staticmethod
     def get_location_with_coops_count(db: Session, location_id: int) -> Optional[dict]:
         """Get location with coop statistics"""
-        location = db.query(DBLocation).filter(DBLocation.id == location_id).first()
-        if not location:
+        row = db.execute(
+            LocationCRUD.summary_statement().filter(DBLocation.id == location_id)
+        ).first()
+        if not row:
             return None
         
-        total_coops = db.query(func.count(DBCoops.id)).filter(DBCoops.location_id == location_id).scalar()
-        active_coops = db.query(func.count(DBCoops.id)).filter(
-            DBCoops.location_id == location_id,
-            DBCoops.status == 'active'
-        ).scalar()
-        
-        return {
-            "location": location,
-            "total_coops": total_coops or 0,
-            "active_coops": active_coops or 0
-        }
+        return dict(row._mapping)
     
     @staticmethod
     def assign_manager(db: Session, location_id: int, manager_id: int) -> Optional[DBLocation]:
@@ -135,29 +184,24 @@ class LocationCRUD:
         return db.query(DBLocation).filter(DBLocation.manager_id == manager_id).all()
     
     @staticmethod
-    def search_locations(db: Session, search_term: str, skip: int = 0, limit: int = 100) -> List[DBLocation]:
+    def search_locations(db: Session, search_term: str, page: PageParams) -> dict:
         """Search locations by name, address, or region"""
         search_pattern = f"%{search_term}%"
-        return db.query(DBLocation).filter(
+        statement = select(DBLocation).filter(
             (DBLocation.name.ilike(search_pattern)) |
             (DBLocation.address.ilike(search_pattern)) |
             (DBLocation.region.ilike(search_pattern))
-        ).offset(skip).limit(limit).all()
+        )
+        return build_page(db.scalars(keyset(statement, DBLocation, page)).all(), page)
 
     @staticmethod
-    def get_location_with_users(db: Session, location_id: int) -> Optional[dict]:
-        """Get location with all associated users"""
-        location = db.query(DBLocation).filter(DBLocation.id == location_id).first()
-        if not location:
-            return None
-        
-        # Get all users associated with this location
-        users = db.query(DBUser).filter(DBUser.location_id == location_id).all()
-        
-        return {
-            "location": location,
-            "users": users
-        }
+    def get_location_with_users(db: Session, location_id: int) -> Optional[DBLocation]:
+        """Get location with all associated users (one query)"""
+        return db.scalars(
+            select(DBLocation)
+            .options(joinedload(DBLocation.users))
+            .filter(DBLocation.id == location_id)
+        ).unique().first()
 
     @staticmethod
     def get_users_by_location(db: Session, location_id: int) -> List[DBUser]:
@@ -193,29 +237,9 @@ class LocationCRUD:
         return user
 
     @staticmethod
-    def assign_multiple_users_to_location(db: Session, location_id: int, user_ids: List[int]) -> List[DBUser]:
-        """Assign multiple users to a location"""
-        # Check if location exists
-        location = db.query(DBLocation).filter(DBLocation.id == location_id).first()
-        if not location:
-            return []
-        
-        # Get all valid users
-        users = db.query(DBUser).filter(DBUser.id.in_(user_ids)).all()
-        if not users:
-            return []
-        
-        # Update all users' location
-        updated_users = []
-        for user in users:
-            user.location_id = location_id
-            updated_users.append(user)
-        
-        db.commit()
-        for user in updated_users:
-            db.refresh(user)
-        
-        return updated_users
+    def assign_multiple_users_to_location(db: Session, location_id: int, user_ids: List[int]) -> Optional[dict]:
+        """Assign multiple users to a location; None if the location does not exist"""
+        return LocationCRUD.bulk_assign(db, location_id, user_ids=user_ids).get("users")
 
     @staticmethod
     def remove_user_from_location(db: Session, user_id: int) -> Optional[DBUser]:
@@ -250,29 +274,62 @@ class LocationCRUD:
         return coop
 
     @staticmethod
-    def assign_multiple_coops_to_location(db: Session, location_id: int, coop_ids: List[int]) -> List[DBCoops]:
-        """Assign multiple coops to a location"""
-        # Check if location exists
-        location = db.query(DBLocation).filter(DBLocation.id == location_id).first()
-        if not location:
-            return []
-        
-        # Get all valid coops
-        coops = db.query(DBCoops).filter(DBCoops.id.in_(coop_ids)).all()
-        if not coops:
-            return []
-        
-        # Update all coops' location
-        updated_coops = []
-        for coop in coops:
-            coop.location_id = location_id
-            updated_coops.append(coop)
-        
+    def assign_multiple_coops_to_location(db: Session, location_id: int, coop_ids: List[int]) -> Optional[dict]:
+        """Assign multiple coops to a location; None if the location does not exist"""
+        return LocationCRUD.bulk_assign(db, location_id, coop_ids=coop_ids).get("coops")
+
+    @staticmethod
+    def bulk_assign(
+        db: Session,
+        location_id: int,
+        user_ids: Optional[List[int]] = None,
+        coop_ids: Optional[List[int]] = None,
+    ) -> dict:
+        """
+        Move users and coops to a location in one transaction, one
+        UPDATE ... RETURNING per table however many ids are given.
+
+        Returns {"users": {"assigned": rows, "missing": ids}, "coops": ...}
+        for each list provided, or {} if the location does not exist.
+        """
+        if db.query(DBLocation.id).filter(DBLocation.id == location_id).first() is None:
+            return {}
+
+        results = {}
+        users = []
+        if user_ids:
+            users = db.execute(
+                update(DBUser)
+                .where(_id_in(db, DBUser.id, user_ids))
+                .values(
+                    location_id=location_id,
+                    # The ORM hook that bumps token_version on a location
+                    # change does not see bulk UPDATEs, so bump it here
+                    token_version=case(
+                        (DBUser.location_id.is_distinct_from(location_id), DBUser.token_version + 1),
+                        else_=DBUser.token_version,
+                    ),
+                )
+                .returning(DBUser.id, DBUser.username, DBUser.email, DBUser.role, DBUser.status, DBUser.token_version)
+                .execution_options(synchronize_session=False)
+            ).all()
+            results["users"] = _assignment(users, user_ids)
+        if coop_ids:
+            coops = db.execute(
+                update(DBCoops)
+                .where(_id_in(db, DBCoops.id, coop_ids))
+                .values(location_id=location_id)
+                .returning(DBCoops.id, DBCoops.coop_name, DBCoops.status, DBCoops.created_at)
+                .execution_options(synchronize_session=False)
+            ).all()
+            results["coops"] = _assignment(coops, coop_ids)
         db.commit()
-        for coop in updated_coops:
-            db.refresh(coop)
-        
-        return updated_coops
+
+        # Cached principals and issued tokens still carry the old location
+        for user in users:
+            cache.invalidate_user(username=user.username)
+            policy.token_versions.bump(user.id, user.token_version)
+        return results
 
     @staticmethod
     def remove_coop_from_location(db: Session, coop_id: int) -> Optional[DBCoops]:
@@ -287,35 +344,49 @@ class LocationCRUD:
         return coop
 
     @staticmethod
-    def get_coops_by_location(db: Session, location_id: int, skip: int = 0, limit: int = 100) -> List[DBCoops]:
-        """Get all coops in a specific location"""
-        return db.query(DBCoops).filter(DBCoops.location_id == location_id).offset(skip).limit(limit).all()
-
-    @staticmethod
-    def get_coops_by_location_and_status(db: Session, location_id: int, status: str, skip: int = 0, limit: int = 100) -> List[DBCoops]:
-        """Get coops in a location filtered by status"""
+    def get_coops_by_location(db: Session, location_id: int) -> List[DBCoops]:
+        """Get the current version of every coop in a specific location"""
         return db.query(DBCoops).filter(
             DBCoops.location_id == location_id,
-            DBCoops.status == status
-        ).offset(skip).limit(limit).all()
+            DBCoops.is_latest_version()
+        ).all()
 
     @staticmethod
-    def get_location_with_full_details(db: Session, location_id: int) -> Optional[dict]:
-        """Get location with all associated users and coops"""
-        location = db.query(DBLocation).filter(DBLocation.id == location_id).first()
-        if not location:
-            return None
-        
-        # Get all users and coops for this location
-        users = db.query(DBUser).filter(DBUser.location_id == location_id).all()
-        coops = db.query(DBCoops).filter(DBCoops.location_id == location_id).all()
-        
-        # Get manager details
-        manager = db.query(DBUser).filter(DBUser.id == location.manager_id).first() if location.manager_id else None
-        
-        return {
-            "location": location,
-            "users": users,
-            "coops": coops,
-            "manager": manager
-        }
\ No newline at end of file
+    def get_coops_page_by_location(db: Session, location_id: int, page: PageParams, status: Optional[str] = None) -> dict:
+        """Get one page of current coop versions in a location, optionally filtered by status"""
+        statement = select(DBCoops).filter(DBCoops.location_id == location_id, DBCoops.is_latest_version())
+        if status:
+            statement = statement.filter(DBCoops.status == status)
+        return build_page(db.scalars(keyset(statement, DBCoops, page)).all(), page)
+
+    @staticmethod
+    def get_location_with_full_details(db: Session, location_id: int) -> Optional[DBLocation]:
+        """
+        Get location with its manager, users and the latest version of each
+        coop: manager and users are joined into the location query and coops
+        follow in one SELECT ... IN, so two round trips in total
+        """
+        return db.scalars(
+            select(DBLocation)
+            .options(
+                joinedload(DBLocation.manager),
+                joinedload(DBLocation.users),
+                selectinload(DBLocation.coops.and_(DBCoops.is_latest_version())),
+            )
+            .filter(DBLocation.id == location_id)
+        ).unique().first()
+
+
+def _id_in(db: Session, column, ids: List[int]):
+    """`column = ANY(:ids)` on PostgreSQL, so the statement binds one array however many ids"""
+    if db.get_bind().dialect.name == "postgresql":
+        return column == any_(literal(list(ids), ARRAY(Integer)))
+    return column.in_(ids)
+
+
+def _assignment(rows, requested_ids: List[int]) -> dict:
+    found = {row.id for row in rows}
+    return {
+        "assigned": rows,
+        "missing": sorted(set(requested_ids) - found),
+    }
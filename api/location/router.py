@@ -1,15 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List
-from database import get_db  # Your database dependency
+from database import get_db, get_read_db  # Your database dependency
 from api.location.schema import (
-    LocationCreate, LocationUpdate, LocationReturn, LocationWithUsers,
+    LocationCreate, LocationUpdate, LocationReturn, LocationWithUsers, LocationSummary,
     LocationList, LocationWithManager, LocationWithCoops, UserInLocation,
     LocationWithCoopsDetailed, LocationFullDetails, CoopInLocation,
     AssignUserRequest, AssignMultipleUsersRequest, AssignCoopRequest, AssignMultipleCoopsRequest,
     UserAssignmentResponse, MultipleUsersAssignmentResponse, CoopAssignmentResponse, MultipleCoopsAssignmentResponse
 )
 from api.location.crud import LocationCRUD
+from api.auth import policy
+from api.pagination import Page, PageParams
 
 router = APIRouter(prefix="/locations", tags=["locations"])
 
@@ -31,28 +33,42 @@ def create_location(
     return LocationCRUD.create_location(db, location)
 
 
-@router.get("/", response_model=List[LocationList])
+@router.get("/", response_model=Page[LocationList])
 def get_locations(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(100, ge=1, le=1000),
+    page: PageParams = Depends(),
     status_filter: str = Query(None, description="Filter by status"),
     region_filter: str = Query(None, description="Filter by region"),
     search: str = Query(None, description="Search by name, address, or region"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all locations with optional filters"""
     if search:
-        return LocationCRUD.search_locations(db, search, skip, limit)
+        return LocationCRUD.search_locations(db, search, page)
     elif status_filter:
-        return LocationCRUD.get_locations_by_status(db, status_filter, skip, limit)
+        return LocationCRUD.get_locations_by_status(db, status_filter, page)
     elif region_filter:
-        return LocationCRUD.get_locations_by_region(db, region_filter, skip, limit)
+        return LocationCRUD.get_locations_by_region(db, region_filter, page)
     else:
-        return LocationCRUD.get_locations(db, skip, limit)
+        return LocationCRUD.get_locations(db, page)
+
+
+@router.get("/summary", response_model=Page[LocationSummary])
+def get_location_summaries(
+    page: PageParams = Depends(),
+    status_filter: str = Query(None, description="Filter by status"),
+    region_filter: str = Query(None, description="Filter by region"),
+    search: str = Query(None, description="Search by name, address, or region"),
+    db: Session = Depends(get_read_db),
+    claims: policy.Claims = Depends(policy.require("revenue:read")),
+):
+    """Get locations with coop, user, pending buyer order and month-to-date expenditure totals"""
+    return LocationCRUD.get_location_summaries(
+        db, page, status=status_filter, region=region_filter, search=search
+    )
 
 
 @router.get("/{location_id}", response_model=LocationReturn)
-def get_location(location_id: int, db: Session = Depends(get_db)):
+def get_location(location_id: int, db: Session = Depends(get_read_db)):
     """Get a specific location by ID"""
     location = LocationCRUD.get_location(db, location_id)
     if not location:
@@ -64,7 +80,7 @@ def get_location(location_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/{location_id}/with-manager", response_model=LocationWithManager)
-def get_location_with_manager(location_id: int, db: Session = Depends(get_db)):
+def get_location_with_manager(location_id: int, db: Session = Depends(get_read_db)):
     """Get location with manager details"""
     result = LocationCRUD.get_location_with_manager(db, location_id)
     if not result:
@@ -79,7 +95,7 @@ def get_location_with_manager(location_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/{location_id}/with-coops", response_model=LocationWithCoops)
-def get_location_with_coops(location_id: int, db: Session = Depends(get_db)):
+def get_location_with_coops(location_id: int, db: Session = Depends(get_read_db)):
     """Get location with coop statistics"""
     result = LocationCRUD.get_location_with_coops_count(db, location_id)
     if not result:
@@ -88,10 +104,7 @@ def get_location_with_coops(location_id: int, db: Session = Depends(get_db)):
             detail="Location not found"
         )
     
-    location_data = LocationWithCoops.model_validate(result["location"])
-    location_data.total_coops = result["total_coops"]
-    location_data.active_coops = result["active_coops"]
-    return location_data
+    return LocationWithCoops.model_validate(result)
 
 
 @router.put("/{location_id}", response_model=LocationReturn)
@@ -138,31 +151,30 @@ def assign_manager_to_location(
 
 
 @router.get("/manager/{manager_id}", response_model=List[LocationList])
-def get_locations_by_manager(manager_id: int, db: Session = Depends(get_db)):
+def get_locations_by_manager(manager_id: int, db: Session = Depends(get_read_db)):
     """Get all locations managed by a specific user"""
     return LocationCRUD.get_locations_managed_by_user(db, manager_id)
 
 
 @router.get("/{location_id}/with-users", response_model=LocationWithUsers)
-def get_location_with_users(location_id: int, db: Session = Depends(get_db)):
+def get_location_with_users(location_id: int, db: Session = Depends(get_read_db)):
     """Get location with all associated users"""
-    result = LocationCRUD.get_location_with_users(db, location_id)
-    if not result:
+    location = LocationCRUD.get_location_with_users(db, location_id)
+    if not location:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Location not found"
         )
     
-    location_data = LocationWithUsers.model_validate(result["location"])
-    location_data.users = [UserInLocation.model_validate(user) for user in result["users"]]
-    return location_data
+    # users are already loaded; validated once, along with the location
+    return LocationWithUsers.model_validate(location)
 
 
 @router.get("/{location_id}/users", response_model=List[UserInLocation])
 def get_users_in_location(
     location_id: int, 
     role: str = Query(None, description="Filter by user role"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all users in a specific location, optionally filtered by role"""
     if role:
@@ -201,17 +213,19 @@ def assign_multiple_users_to_location(
     db: Session = Depends(get_db)
 ):
     """Assign multiple users to a location"""
-    users = LocationCRUD.assign_multiple_users_to_location(db, location_id, request.user_ids)
-    if not users:
+    result = LocationCRUD.assign_multiple_users_to_location(db, location_id, request.user_ids)
+    if not result or not result["assigned"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Location not found or no valid users provided"
         )
     
+    users = result["assigned"]
     return MultipleUsersAssignmentResponse(
         users=[UserInLocation.model_validate(user) for user in users],
         message=f"{len(users)} users successfully assigned to location",
-        total_assigned=len(users)
+        total_assigned=len(users),
+        missing_ids=result["missing"]
     )
 
 
@@ -235,25 +249,19 @@ def remove_user_from_location(
 
 
 # NEW ROUTES FOR COOP ASSIGNMENT
-@router.get("/{location_id}/coops", response_model=List[CoopInLocation])
+@router.get("/{location_id}/coops", response_model=Page[CoopInLocation])
 def get_coops_in_location(
     location_id: int,
-    skip: int = Query(0, ge=0),
-    limit: int = Query(100, ge=1, le=1000),
+    page: PageParams = Depends(),
     status_filter: str = Query(None, description="Filter by coop status"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all coops in a specific location, optionally filtered by status"""
-    if status_filter:
-        coops = LocationCRUD.get_coops_by_location_and_status(db, location_id, status_filter, skip, limit)
-    else:
-        coops = LocationCRUD.get_coops_by_location(db, location_id, skip, limit)
-    
-    return [CoopInLocation.model_validate(coop) for coop in coops]
+    return LocationCRUD.get_coops_page_by_location(db, location_id, page, status=status_filter)
 
 
 @router.get("/{location_id}/with-coops-detailed", response_model=LocationWithCoopsDetailed)
-def get_location_with_coops_detailed(location_id: int, db: Session = Depends(get_db)):
+def get_location_with_coops_detailed(location_id: int, db: Session = Depends(get_read_db)):
     """Get location with detailed coop information"""
     location = LocationCRUD.get_location(db, location_id)
     if not location:
@@ -296,17 +304,19 @@ def assign_multiple_coops_to_location(
     db: Session = Depends(get_db)
 ):
     """Assign multiple coops to a location"""
-    coops = LocationCRUD.assign_multiple_coops_to_location(db, location_id, request.coop_ids)
-    if not coops:
+    result = LocationCRUD.assign_multiple_coops_to_location(db, location_id, request.coop_ids)
+    if not result or not result["assigned"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Location not found or no valid coops provided"
         )
     
+    coops = result["assigned"]
     return MultipleCoopsAssignmentResponse(
         coops=[CoopInLocation.model_validate(coop) for coop in coops],
         message=f"{len(coops)} coops successfully assigned to location",
-        total_assigned=len(coops)
+        total_assigned=len(coops),
+        missing_ids=result["missing"]
     )
 
 
@@ -330,19 +340,17 @@ def remove_coop_from_location(
 
 
 @router.get("/{location_id}/full-details", response_model=LocationFullDetails)
-def get_location_full_details(location_id: int, db: Session = Depends(get_db)):
+def get_location_full_details(location_id: int, db: Session = Depends(get_read_db)):
     """Get location with complete details including users, coops, and manager"""
-    result = LocationCRUD.get_location_with_full_details(db, location_id)
-    if not result:
+    location = LocationCRUD.get_location_with_full_details(db, location_id)
+    if not location:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Location not found"
         )
     
-    location_data = LocationFullDetails.model_validate(result["location"])
-    location_data.users = [UserInLocation.model_validate(user) for user in result["users"]]
-    location_data.coops = [CoopInLocation.model_validate(coop) for coop in result["coops"]]
-    location_data.manager_name = result["manager"].username if result["manager"] else None
+    location_data = LocationFullDetails.model_validate(location)
+    location_data.manager_name = location.manager.username if location.manager else None
     
     return location_data
 
@@ -355,38 +363,29 @@ def bulk_assign_to_location(
     coop_ids: List[int] = Query(None, description="List of coop IDs to assign"),
     db: Session = Depends(get_db)
 ):
-    """Bulk assign users and coops to a location"""
-    # Check if location exists
-    location = LocationCRUD.get_location(db, location_id)
-    if not location:
+    """Bulk assign users and coops to a location in one transaction"""
+    if not user_ids and not coop_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one of user_ids or coop_ids must be provided"
+        )
+    
+    assigned = LocationCRUD.bulk_assign(db, location_id, user_ids=user_ids, coop_ids=coop_ids)
+    if not assigned:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Location not found"
         )
     
-    results = {}
-    
-    # Assign users if provided
-    if user_ids:
-        assigned_users = LocationCRUD.assign_multiple_users_to_location(db, location_id, user_ids)
-        results["users"] = {
-            "assigned": [UserInLocation.model_validate(user) for user in assigned_users],
-            "count": len(assigned_users)
+    schemas = {"users": UserInLocation, "coops": CoopInLocation}
+    results = {
+        kind: {
+            "assigned": [schemas[kind].model_validate(row) for row in result["assigned"]],
+            "count": len(result["assigned"]),
+            "missing": result["missing"]
         }
-    
-    # Assign coops if provided
-    if coop_ids:
-        assigned_coops = LocationCRUD.assign_multiple_coops_to_location(db, location_id, coop_ids)
-        results["coops"] = {
-            "assigned": [CoopInLocation.model_validate(coop) for coop in assigned_coops],
-            "count": len(assigned_coops)
-        }
-    
-    if not user_ids and not coop_ids:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="At least one of user_ids or coop_ids must be provided"
-        )
+        for kind, result in assigned.items()
+    }
     
     return {
         "message": "Bulk assignment completed successfully",
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import AliasChoices, BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -46,6 +46,13 @@ class LocationWithCoops(LocationReturn):
     total_coops: int = 0
     active_coops: int = 0
 
+class LocationSummary(LocationReturn):
+    total_coops: int = 0
+    active_coops: int = 0
+    user_count: int = 0
+    pending_buyer_orders: int = 0
+    month_to_date_expenditure: int = 0
+
 class UserInLocation(BaseModel):
     id: int
     username: str
@@ -62,7 +69,8 @@ class LocationWithUsers(LocationReturn):
 # NEW SCHEMAS FOR ASSIGNMENT FUNCTIONALITY
 class CoopInLocation(BaseModel):
     id: int
-    name: str
+    # DBCoops stores this as coop_name
+    name: str = Field(validation_alias=AliasChoices("coop_name", "name"))
     status: str
     created_at: datetime
     
@@ -99,6 +107,7 @@ class MultipleUsersAssignmentResponse(BaseModel):
     users: List[UserInLocation]
     message: str
     total_assigned: int
+    missing_ids: List[int] = []
 
 class CoopAssignmentResponse(BaseModel):
     coop: CoopInLocation
@@ -107,4 +116,5 @@ class CoopAssignmentResponse(BaseModel):
 class MultipleCoopsAssignmentResponse(BaseModel):
     coops: List[CoopInLocation]
     message: str
-    total_assigned: int
\ No newline at end of file
+    total_assigned: int
+    missing_ids: List[int] = []
\ No newline at end of file
@@ -0,0 +1,67 @@
+import base64
+import json
+from datetime import datetime
+from typing import Generic, List, Optional, Sequence, TypeVar
+
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel
+from sqlalchemy import Select, tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+    limit: int
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    payload = json.dumps([created_at.isoformat() if created_at else None, id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+class PageParams:
+    """Query parameters shared by every paginated list route"""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    ):
+        self.limit = limit
+        self.after = decode_cursor(cursor) if cursor else None
+
+
+def keyset(statement: Select, entity, page: PageParams) -> Select:
+    """
+    Order newest first on (created_at, id) and continue after the cursor.
+    Fetches one extra row so build_page can tell whether another page exists.
+    """
+    if page.after is not None:
+        statement = statement.where(tuple_(entity.created_at, entity.id) < tuple_(*page.after))
+    return statement.order_by(entity.created_at.desc(), entity.id.desc()).limit(page.limit + 1)
+
+
+def build_page(rows: Sequence, page: PageParams) -> dict:
+    items = list(rows[:page.limit])
+    next_cursor = None
+    if len(rows) > page.limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return {"items": items, "next_cursor": next_cursor, "limit": page.limit}
@@ -1,16 +1,17 @@
 from api.auth import model
-from database import get_db
+from database import get_async_db
 from api.buyer.crud import NotFoundError
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException
 
 
-def read_role(user_id: int, db):
-    admin_role = (db.query(
-        model.DBUser
-        ).filter(model.DBUser.id == user_id)
-        .first()
+async def read_role(user_id: int, db: AsyncSession):
+    result = await db.execute(
+        select(model.DBUser)
+        .filter(model.DBUser.id == user_id)
     )
+    admin_role = result.scalars().first()
     if admin_role is None:
         raise NotFoundError(
             404,
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
-from database import get_db
-from api.auth import schema, crud, authutils, otp
+from database import get_async_db, get_async_read_db
+from api.auth import schema, crud, authutils, model, otp, hashing, outbox
 from api.buyer.crud import NotFoundError
+from api.pagination import Page, PageParams
 from typing import Optional, List
 import uuid
 
@@ -12,30 +13,20 @@ router = APIRouter(
 
 
 
-@router.get("/users", response_model=List[schema.UserReturn])
+@router.get("/users", response_model=Page[schema.UserReturn])
 async def get_all_users(
     location_id: Optional[int] = Query(None, description="Filter users by location ID"),
     location_name: Optional[str] = Query(None, description="Filter users by location name"),
-    db=Depends(get_db)
+    page: PageParams = Depends(),
+    db=Depends(get_async_read_db)
 ):
     """
     Get all users with optional location filtering.
     Users will include location_name information.
     """
     try:
-        if location_id:
-            users = crud.get_users_by_location(location_id, db)
-        elif location_name:
-            users = crud.get_users_by_location_name(location_name, db)
-        else:
-            users = crud.read_users(db)
-        
-        # Return empty list instead of raising 404 - this is more RESTful
-        return users if users else []
-        
-    except NotFoundError:
-        # This shouldn't happen with the current CRUD functions since they return []
-        return []
+        # An empty page rather than 404 - this is more RESTful
+        return await crud.read_users(db, page, location_id=location_id, location_name=location_name)
     except Exception as e:
         print(f"Error in get_all_users: {str(e)}")  # Add logging
         raise HTTPException(
@@ -44,12 +35,12 @@ async def get_all_users(
         )
 
 
-@router.get("/admin", response_model=List[schema.UserReturn])
-async def get_all_admin(db=Depends(get_db)):
+@router.get("/admin", response_model=Page[schema.UserReturn])
+async def get_all_admin(page: PageParams = Depends(), db=Depends(get_async_read_db)):
     """Get all admin users with location information"""
     try:
-        admins = crud.read_all_admin(db)
-        if not admins:
+        admins = await crud.read_all_admin(db, page)
+        if not admins["items"]:
             raise HTTPException(
                 status_code=404,
                 detail="There are no admins to display"
@@ -67,28 +58,24 @@ async def get_all_admin(db=Depends(get_db)):
         )
 
 
-@router.get("/users/by-role/{role}")
+@router.get("/users/by-role/{role}", response_model=Page[schema.UserReturn])
 async def get_users_by_role(
     role: str,
     location_id: Optional[int] = Query(None, description="Filter by location ID"),
-    db=Depends(get_db)
+    page: PageParams = Depends(),
+    db=Depends(get_async_read_db)
 ):
     """Get users by role with optional location filtering"""
     try:
-        if role not in ['admin', 'feeder', 'manager']:
+        if role not in model.role_option:
             raise HTTPException(
                 status_code=400,
-                detail="Invalid role. Must be one of: admin, feeder, counter"
+                detail=f"Invalid role. Must be one of: {', '.join(model.role_option)}"
             )
         
-        if location_id:
-            users = crud.get_users_by_location(location_id, db)
-            users = [user for user in users if user.role == role]
-        else:
-            users = crud.read_users(db)
-            users = [user for user in users if user.role == role]
-        
-        return users
+        return await crud.read_users(db, page, location_id=location_id, role=role)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -100,12 +87,12 @@ async def get_users_by_role(
 async def update_user_by_id(
     user_id: int, 
     user_info: schema.UserUpdate, 
-    db=Depends(get_db)
+    db=Depends(get_async_db)
 ):
     """Update user by ID and return updated user with location information"""
     try:
         # Check if user exists
-        db_user = crud.find_user_by_id(user_id=user_id, db=db)
+        db_user = await crud.find_user_by_id(user_id=user_id, db=db)
         if not db_user:
             raise HTTPException(
                 status_code=404, 
@@ -117,7 +104,7 @@ async def update_user_by_id(
         print(f'New received data: {update_data}')
 
         # Update user
-        updated_user = crud.update_user(user_id=user_id, updated_data=update_data, db=db)
+        updated_user = await crud.update_user(user_id=user_id, updated_data=update_data, db=db)
         
         if not updated_user:
             raise HTTPException(
@@ -140,10 +127,10 @@ async def update_user_by_id(
 
 
 @router.get("/users/{user_id}", response_model=schema.UserReturn)
-async def read_user_by_id(user_id: int, db=Depends(get_db)):
+async def read_user_by_id(user_id: int, db=Depends(get_async_read_db)):
     """Get user by ID with location information"""
     try:
-        user = crud.find_user_by_id(user_id, db)
+        user = await crud.find_user_by_id(user_id, db)
         if user is None:
             raise HTTPException(
                 status_code=404, 
@@ -170,10 +157,10 @@ async def read_current_user(current_user=Depends(authutils.get_current_user)):
 
 
 @router.get("/users/location/{location_id}", response_model=List[schema.UserReturn])
-async def get_users_by_location_id(location_id: int, db=Depends(get_db)):
+async def get_users_by_location_id(location_id: int, db=Depends(get_async_read_db)):
     """Get all users in a specific location by location ID"""
     try:
-        users = crud.get_users_by_location(location_id, db)
+        users = await crud.get_users_by_location(location_id, db)
         if not users:
             raise HTTPException(
                 status_code=404,
@@ -188,10 +175,10 @@ async def get_users_by_location_id(location_id: int, db=Depends(get_db)):
 
 
 @router.get("/users/location/name/{location_name}", response_model=List[schema.UserReturn])
-async def get_users_by_location_name(location_name: str, db=Depends(get_db)):
+async def get_users_by_location_name(location_name: str, db=Depends(get_async_read_db)):
     """Get all users in a specific location by location name"""
     try:
-        users = crud.get_users_by_location_name(location_name, db)
+        users = await crud.get_users_by_location_name(location_name, db)
         # Return empty list instead of 404 - this is more RESTful
         return users if users else []
     except Exception as e:
@@ -211,10 +198,10 @@ async def test_auth(request: Request):
 
 
 @router.post("/forgot_password")
-async def forgot_password(request: schema.ForgotPassword, db=Depends(get_db)):
+async def forgot_password(request: schema.ForgotPassword, db=Depends(get_async_db)):
     """Send password reset email"""
     try:
-        user_reg = crud.find_user_by_email(request.email, db=db)
+        user_reg = await crud.find_user_by_email(request.email, db=db)
         if user_reg is None:
             raise HTTPException(
                 status_code=404,
@@ -223,15 +210,14 @@ async def forgot_password(request: schema.ForgotPassword, db=Depends(get_db)):
             
         # Create reset code and save in database
         reset_code = str(uuid.uuid4())
-        crud.create_reset_code(email=request.email, reset_code=reset_code, db=db)
-
-        print('Reset code generated:', reset_code)
+        await crud.create_reset_code(email=request.email, reset_code=reset_code, db=db)
 
         # Send email
         print(user_reg.username, 'requesting password reset')
 
         if user_reg.email:
-            await otp.send_otp_to_user(
+            await outbox.enqueue_email(
+                db=db,
                 subject=f"Password Reset - {user_reg.username}",
                 body=f"Your password reset code is {reset_code}\nDo not share this code with anyone",
                 recipient_email=user_reg.email,
@@ -269,15 +255,14 @@ async def forgot_password(request: schema.ForgotPassword, db=Depends(get_db)):
 
 
 @router.patch("/reset_password")
-async def reset_password(request: schema.ResetPassword, db=Depends(get_db)):
+async def reset_password(request: schema.ResetPassword, db=Depends(get_async_db)):
     """Reset user password using reset token"""
     try:
         # Check valid reset password token
-        reset_token = crud.check_reset_password_token(
+        reset_token = await crud.check_reset_password_token(
             reset_password_token=request.reset_password_token, 
             db=db
         )
-        print('Reset token found:', reset_token)
 
         # Check if new and confirm passwords match
         if request.new_password != request.confirm_password:
@@ -288,7 +273,7 @@ async def reset_password(request: schema.ResetPassword, db=Depends(get_db)):
         
         # Reset new password
         forgot_password_object = schema.ForgotPassword(email=reset_token.email)
-        new_hashed_password = authutils.get_password_hash(request.new_password)
+        new_hashed_password = await hashing.hash_password(request.new_password)
         
         # Note: You'll need to implement these functions in crud
         await crud.reset_password(new_hashed_password, forgot_password_object.email, db)
@@ -312,16 +297,16 @@ async def reset_password(request: schema.ResetPassword, db=Depends(get_db)):
 
 
 @router.delete("/users/{user_id}")
-async def delete_user_by_id(user_id: int, db=Depends(get_db)):
+async def delete_user_by_id(user_id: int, db=Depends(get_async_db)):
     """Delete user by ID"""
     try:
-        user = crud.find_user_by_id(user_id=user_id, db=db)
+        user = await crud.find_user_by_id(user_id=user_id, db=db)
         if user is None:
             raise HTTPException(
                 status_code=404,
                 detail='User not found'
             )
-        return crud.delete_user(user_id=user_id, db=db)
+        return await crud.delete_user(user_id=user_id, db=db)
     except crud.NotFoundError:
         raise HTTPException(
             status_code=404,
@@ -2,7 +2,7 @@
 # from sqlalchemy import create_engine, inspect, text
 # from sqlalchemy.orm import sessionmaker, Session
 # from sqlalchemy.ext.declarative import declarative_base
-# from sqlalchemy.exc import OperationalError
+# from sqlalchemy.exc import OperationalError, SQLAlchemyError
 # from dotenv import load_dotenv
 
 # # from api.auth.model import DBUser
@@ -64,17 +64,38 @@
 # #     print(result)
 
 
+import logging
 import os
-from sqlalchemy import create_engine, inspect
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import OperationalError
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import Request
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 
+import pool_metrics
+
 # Import Base from the new base module
 from base import Base
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 # Database connection setup
 database_name = os.getenv("DATABASE_NAME")
 database_username = os.getenv("DATABASE_USERNAME")
@@ -86,49 +107,265 @@ database_url: str = os.getenv("DATABASE_URL")  # Use Render's default DATABASE_U
 if not database_url:
     database_url = f"postgresql://{database_username}:{database_password}@{database_host}/{database_name}"
 
-# Create engine with additional parameters for better connection handling
-engine = create_engine(
-    database_url, 
-    pool_pre_ping=True,  # Test connections before using them
-    pool_recycle=3600,   # Recycle connections after 1 hour
-)
 
-# Session configuration
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def engine_options(url: str, metrics: pool_metrics.PoolMetrics, use_async: bool = False) -> dict:
+    """Pool settings from the environment; SQLite keeps its dialect default pool"""
+    options = {
+        # Pre-ping costs a round trip per checkout, so it can be turned off
+        # when pool_recycle is below the server's idle timeout
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", True),
+    }
+    if url.startswith("sqlite"):
+        return options
+
+    base_pool = AsyncAdaptedQueuePool if use_async else QueuePool
+    options.update({
+        "poolclass": pool_metrics.timed_pool_class(base_pool, metrics),
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "3600")),
+    })
+    return options
+
+
+def to_async_url(url: str) -> str:
+    """Map a sync database URL onto its asyncio driver"""
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+
+async_database_url = to_async_url(database_url)
+
+# Optional read replica; GET routes read from it unless the caller wrote recently
+read_database_url: str = os.getenv("DATABASE_READ_URL")
+
+# Built by create_engines(), which the app lifespan calls, so importing
+# the app neither builds pools nor connects
+engine = None
+async_engine = None
+read_engine = None
+async_read_engine = None
+
+# Session configuration; create_engines() binds these
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+# expire_on_commit=False: attributes stay loaded after commit, since lazy
+# refreshes are not allowed outside the greenlet in asyncio mode
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+AsyncReadSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+
+def _build_engines(url: str, name: str) -> tuple:
+    """A sync and an async engine for `url`, with pool metrics registered under `name`"""
+    metrics = pool_metrics.register(name)
+    sync_engine = create_engine(url, **engine_options(url, metrics))
+    metrics.instrument(sync_engine)
+
+    async_url = to_async_url(url)
+    async_metrics = pool_metrics.register(f"{name}_async")
+    # Async engine used by the `async def` routes so a slow query doesn't block the event loop
+    asyncio_engine = create_async_engine(async_url, **engine_options(async_url, async_metrics, use_async=True))
+    async_metrics.instrument(asyncio_engine.sync_engine)
+    return sync_engine, asyncio_engine
+
+
+def create_engines(url: Optional[str] = None, read_url: Optional[str] = None):
+    """
+    Build the primary and replica engines and bind the session factories
+    to them. Creating an engine opens no connection; the first checkout
+    does. Does nothing if the engines already exist.
+    """
+    global engine, async_engine, read_engine, async_read_engine
+    if engine is not None:
+        return
+    engine, async_engine = _build_engines(url or database_url, "primary")
+    read_url = read_url or read_database_url
+    if read_url:
+        read_engine, async_read_engine = _build_engines(read_url, "replica")
+    else:
+        read_engine, async_read_engine = engine, async_engine
+
+    SessionLocal.configure(bind=engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+    ReadSessionLocal.configure(bind=read_engine)
+    AsyncReadSessionLocal.configure(bind=async_read_engine)
+
+
+class ReadYourWritesTracker:
+    """
+    Remembers which clients wrote recently so their reads stay on the primary
+    until the replica has had time to catch up. Per process and bounded.
+    """
+
+    def __init__(self, window_seconds: float, max_clients: int = 10000):
+        self.window_seconds = window_seconds
+        self.max_clients = max_clients
+        self._until = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mark(self, client_key: str):
+        if self.window_seconds <= 0:
+            return
+        with self._lock:
+            self._until[client_key] = time.monotonic() + self.window_seconds
+            self._until.move_to_end(client_key)
+            while len(self._until) > self.max_clients:
+                self._until.popitem(last=False)
+
+    def wrote_recently(self, client_key: str) -> bool:
+        with self._lock:
+            until = self._until.get(client_key)
+            if until is None:
+                return False
+            if until < time.monotonic():
+                del self._until[client_key]
+                return False
+            return True
+
+
+read_your_writes = ReadYourWritesTracker(float(os.getenv("READ_YOUR_WRITES_SECONDS", "5")))
+
+# After the replica fails a connection attempt, skip it for this long
+REPLICA_RETRY_SECONDS = float(os.getenv("DATABASE_READ_RETRY_SECONDS", "30"))
+_replica_down_until = 0.0
+
 
-def get_db():
+def client_key(request: Request) -> str:
+    """Identify the caller by bearer token, refresh cookie or address"""
+    return (
+        request.headers.get("authorization")
+        or request.cookies.get("refresh_token")
+        or (request.client.host if request.client else "anonymous")
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _flag_flush_writes(session, flush_context):
+    session.info["has_writes"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_statement_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["has_writes"] = True
+
+
+def _use_replica(request: Request) -> bool:
+    return (
+        read_engine is not engine
+        and _replica_down_until < time.monotonic()
+        and not read_your_writes.wrote_recently(client_key(request))
+    )
+
+
+def _replica_failed(error: Exception):
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+    logger.warning(f"Read replica unavailable, falling back to primary: {error}")
+
+
+def get_db(request: Request):
     database = SessionLocal()
+    try:
+        yield database
+    finally:
+        if database.info.get("has_writes"):
+            read_your_writes.mark(client_key(request))
+        database.close()
+
+
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal() as database:
+        try:
+            yield database
+        finally:
+            if database.info.get("has_writes"):
+                read_your_writes.mark(client_key(request))
+
+
+def get_read_db(request: Request):
+    database = None
+    if _use_replica(request):
+        database = ReadSessionLocal()
+        try:
+            database.connection()
+        except (OperationalError, OSError) as e:
+            database.close()
+            database = None
+            _replica_failed(e)
+    if database is None:
+        database = SessionLocal()
     try:
         yield database
     finally:
         database.close()
 
-def init_db():
+
+async def get_async_read_db(request: Request):
+    database = None
+    if _use_replica(request):
+        database = AsyncReadSessionLocal()
+        try:
+            await database.connection()
+        except (OperationalError, OSError) as e:
+            await database.close()
+            database = None
+            _replica_failed(e)
+    if database is None:
+        database = AsyncSessionLocal()
+    async with database:
+        yield database
+
+
+# Streaming responses keep reading after the route returns, so they open
+# their own session rather than borrowing the request-scoped dependency
+read_session = asynccontextmanager(get_async_read_db)
+
+async def init_db():
+    """Create any missing tables and report what exists (opt-in via DB_INIT_SCHEMA)"""
+    # Import models here to avoid circular imports
+    import api.auth.model  # noqa: F401
+
+    try:
+        async with async_engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+            tables = await connection.run_sync(
+                lambda sync_connection: inspect(sync_connection).get_table_names()
+            )
+        logger.info(f"Tables created; existing tables: {tables}")
+    except (SQLAlchemyError, OSError):
+        logger.exception("Error creating tables")
+
+
+async def warm_up_pool(connections: int):
+    """Open `connections` pooled connections up front so the first requests skip the handshake"""
+    opened = []
     try:
-        # Import models here to avoid circular imports
-        from api.auth.model import DBUser
-        from api.auth.model import (
-            DBBlacklistedToken, 
-            DBReset, 
-            DBCoops, 
-            DBBuyer, 
-            DBExpenditure
-        )
-        
-        # Create all tables
-        Base.metadata.create_all(bind=engine)
-        print("Tables created successfully")
-
-        # Verify table creation
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
-        print("Existing tables:", tables)
-    except Exception as e:
-        print(f"Error creating tables: {e}")
-        import traceback
-        traceback.print_exc()
-
-# Optionally call init_db during module import or in your main startup
-init_db()
-
-print(f"Database URL: {database_url}")
\ No newline at end of file
+        for _ in range(connections):
+            opened.append(await async_engine.connect())
+    except OperationalError as e:
+        logger.error(f"Error warming up connection pool: {e}")
+    finally:
+        for connection in opened:
+            await connection.close()
+
+
+async def dispose_engines():
+    """Close every pooled connection held by this process; create_engines() builds fresh ones"""
+    global engine, async_engine, read_engine, async_read_engine
+    if engine is None:
+        return
+    await async_engine.dispose()
+    engine.dispose()
+    if read_engine is not engine:
+        await async_read_engine.dispose()
+        read_engine.dispose()
+    engine = async_engine = read_engine = async_read_engine = None
@@ -1,18 +1,55 @@
+import os
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+import database
 from api.auth import router as auth_router
 from api.user.router import router as user_router
 from api.buyer.router import router as buyer_router
 from api.coop.router import router as coop_router
 from api.expenditure.router import router as expenditure_router
 from api.location.router import router as location_router
+from api.admin.router import router as admin_router
+from api.auth import audit, hashing, outbox, revocation, throttle
 from fastapi.middleware.cors import CORSMiddleware
+from query_stats import QueryStatsMiddleware
+import scheduler
 # import NotFoundError
 
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    database.create_engines()
+
+    # Schema creation costs round trips on every worker start, so it is opt-in
+    if database.env_flag("DB_INIT_SCHEMA"):
+        await database.init_db()
+
+    warmup_connections = int(os.getenv("DB_POOL_WARMUP", "0"))
+    if warmup_connections > 0:
+        await database.warm_up_pool(warmup_connections)
+
+    hashing.start()
+    outbox.start_worker()
+    audit.start_writer()
+    # The only state loaded before serving; login throttle state and token
+    # versions load on first use, and partitions on the scheduler
+    await revocation.start()
+    scheduler.start()
+
+    yield
+
+    await scheduler.stop()
+    await throttle.drain()
+    await audit.stop_writer()
+    await outbox.stop_worker()
+    hashing.shutdown()
+    await database.dispose_engines()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     docs_url="/docs",
     redoc_url="/redocs",
     title="My Business Backend",
@@ -33,8 +70,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Query-Budget-Exceeded"],
 )
 
+app.add_middleware(QueryStatsMiddleware)
+
 
 
 # @app.on_event("startup")
@@ -54,6 +94,7 @@ app.include_router(coop_router)
 app.include_router(buyer_router)
 app.include_router(expenditure_router)
 app.include_router(location_router)
+app.include_router(admin_router)
 
 
 @app.get("/")
@@ -5,6 +5,9 @@ from sqlalchemy import pool
 
 from alembic import context
 
+from base import Base
+import api.auth.model  # noqa: F401  registers every table on Base.metadata
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -14,11 +17,18 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Use the application's DATABASE_URL (or DATABASE_* parts) unless
+# alembic.ini / -x sqlalchemy.url was pointed somewhere real
+if config.get_main_option("sqlalchemy.url", "").startswith("driver://"):
+    from database import database_url
+
+    config.set_main_option("sqlalchemy.url", database_url.replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-target_metadata = None
+target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
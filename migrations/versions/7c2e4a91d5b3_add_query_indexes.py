@@ -0,0 +1,87 @@
+"""add indexes for crud query shapes
+
+Revision ID: 7c2e4a91d5b3
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e4a91d5b3'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, partial WHERE clause or None)
+INDEXES = [
+    ("ix_users_username", "users", ["username"], None),
+    ("ix_users_location_id", "users", ["location_id"], None),
+    ("ix_login_attempts_username_attempt_time", "login_attempts", ["username", "attempt_time"], None),
+    (
+        "ix_login_attempts_failed_username_attempt_time",
+        "login_attempts",
+        ["username", "attempt_time"],
+        "success = false",
+    ),
+    (
+        "ix_account_lockouts_username_active_unlock_at",
+        "account_lockouts",
+        ["username", "is_active", "unlock_at"],
+        None,
+    ),
+    ("ix_account_lockouts_active_unlock_at", "account_lockouts", ["unlock_at"], "is_active = true"),
+    ("ix_reset_password_reset_code", "reset_password", ["reset_code"], None),
+    ("ix_coop_location_id", "coop", ["location_id"], None),
+    ("ix_coop_user_id_status", "coop", ["user_id", "status"], None),
+    ("ix_coop_coop_name_created_at", "coop", ["coop_name", sa.text("created_at DESC")], None),
+    ("ix_buyer_location_id", "buyer", ["location_id"], None),
+    ("ix_buyer_name", "buyer", ["name"], None),
+    (
+        "ix_expenditure_location_category_status",
+        "expenditure",
+        ["location_id", "category", "status"],
+        None,
+    ),
+    ("ix_expenditure_category", "expenditure", ["category"], None),
+    ("ix_expenditure_user_id", "expenditure", ["user_id"], None),
+    ("ix_expenditure_reference", "expenditure", ["reference"], None),
+]
+
+# Single-column indexes made redundant by the composites above
+SUPERSEDED = [
+    ("ix_coop_coop_name", "coop", ["coop_name"]),
+    ("ix_login_attempts_username", "login_attempts", ["username"]),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps the tables writable while Postgres builds the
+    # indexes; it cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            partial = sa.text(where) if where else None
+            op.create_index(
+                name,
+                table,
+                columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_where=partial,
+                sqlite_where=partial,
+            )
+        for name, table, _ in SUPERSEDED:
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in SUPERSEDED:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,184 @@
+"""add coop_daily_production and coop.root_id
+
+Revision ID: a3c9e71b5d28
+Revises: e2f6a8c04d71
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e71b5d28'
+down_revision: Union[str, None] = 'e2f6a8c04d71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+FIGURES = ["egg_count", "crates_collected", "broken_eggs", "total_feed", "total_dead_fowls", "total_fowls"]
+# Matches api.coop.production.PRODUCTION_PARTITIONS_AHEAD
+PARTITIONS_AHEAD = 3
+BATCH_SIZE = 5000
+
+production = sa.table(
+    'coop_daily_production',
+    sa.column('coop_id', sa.Integer()),
+    sa.column('collection_date', sa.Date()),
+    sa.column('location_id', sa.Integer()),
+    sa.column('recorded_at', sa.DateTime()),
+    *[sa.column(name, sa.Integer()) for name in FIGURES],
+)
+
+
+def _parse(value):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value.strip()[:10])
+    except ValueError:
+        return None
+
+
+def _month_after(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _create_partitions(months):
+    for month in sorted(months):
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS coop_daily_production_{month:%Y_%m} "
+            f"PARTITION OF coop_daily_production "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_month_after(month).isoformat()}')"
+        )
+
+
+def _set_root_ids(bind):
+    """One server-side statement: walk each history down from its first version"""
+    bind.execute(sa.text(
+        "WITH RECURSIVE chain(id, root) AS ("
+        " SELECT id, id FROM coop WHERE parent_id IS NULL"
+        " UNION ALL"
+        " SELECT coop.id, chain.root FROM coop JOIN chain ON coop.parent_id = chain.id"
+        ") "
+        "UPDATE coop SET root_id = chain.root FROM chain "
+        "WHERE coop.id = chain.id AND chain.root <> coop.id"
+    ))
+
+
+def _insert_facts(bind, facts):
+    dialect = postgresql if bind.dialect.name == "postgresql" else sqlite
+    # Newest versions are inserted first, so an older version of the same day is skipped
+    bind.execute(dialect.insert(production).values(facts).on_conflict_do_nothing(
+        index_elements=['coop_id', 'collection_date'],
+    ))
+
+
+def _backfill():
+    """
+    Set root_id, then record each coop's latest version per day, reading
+    the coop table in keyset batches from the newest version back. A delta
+    version's figures are rebuilt from the version after it, which an
+    earlier batch has already read.
+    """
+    bind = op.get_bind()
+    _set_root_ids(bind)
+
+    months = set()
+    if bind.dialect.name == "postgresql":
+        today = date.today().replace(day=1)
+        months.add(today)
+        for _ in range(PARTITIONS_AHEAD):
+            months.add(_month_after(max(months)))
+        _create_partitions(months)
+
+    # Rebuilt values of versions whose parent is a delta, until the parent is read
+    successors = {}
+    recorded_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    before = None
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT coop.id, coop.parent_id, coop.root_id, coop.is_delta, coop.location_id, "
+            f"coop.collection_date, {', '.join('coop.' + name for name in FIGURES)}, "
+            "parent.is_delta AS parent_is_delta "
+            "FROM coop LEFT JOIN coop AS parent ON parent.id = coop.parent_id "
+            + ("" if before is None else "WHERE coop.id < :before ")
+            + "ORDER BY coop.id DESC LIMIT :limit"
+        ), {"before": before, "limit": BATCH_SIZE}).all()
+        if not rows:
+            break
+        before = rows[-1].id
+
+        facts = []
+        for row in rows:
+            current = {name: getattr(row, name) for name in ["location_id", "collection_date", *FIGURES]}
+            successor = successors.pop(row.id, None)
+            if row.is_delta and successor is not None:
+                for name in ["collection_date", *FIGURES]:
+                    if current[name] is None:
+                        current[name] = successor[name]
+            if row.parent_is_delta:
+                successors[row.parent_id] = current
+
+            collection_date = _parse(current["collection_date"])
+            if collection_date is not None:
+                facts.append({
+                    "coop_id": row.root_id or row.id,
+                    "collection_date": collection_date,
+                    "location_id": current["location_id"],
+                    "recorded_at": recorded_at,
+                    **{name: current[name] or 0 for name in FIGURES},
+                })
+
+        if bind.dialect.name == "postgresql":
+            new_months = {fact["collection_date"].replace(day=1) for fact in facts} - months
+            _create_partitions(new_months)
+            months |= new_months
+        if facts:
+            _insert_facts(bind, facts)
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('coop') as batch_op:
+        batch_op.add_column(sa.Column('root_id', sa.Integer(), nullable=True))
+
+    op.create_table(
+        'coop_daily_production',
+        sa.Column('coop_id', sa.Integer(), nullable=False),
+        sa.Column('collection_date', sa.Date(), nullable=False),
+        sa.Column('location_id', sa.Integer(), nullable=False),
+        *[sa.Column(name, sa.Integer(), nullable=False) for name in FIGURES],
+        sa.Column('recorded_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['coop_id'], ['coop.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['location_id'], ['locations.id']),
+        sa.PrimaryKeyConstraint('coop_id', 'collection_date'),
+        postgresql_partition_by='RANGE (collection_date)',
+    )
+    if op.get_bind().dialect.name == "postgresql":
+        # Catches dates outside every monthly partition (e.g. mistyped years)
+        op.execute("CREATE TABLE IF NOT EXISTS coop_daily_production_default PARTITION OF coop_daily_production DEFAULT")
+
+    # A new, empty table: no need to build this concurrently (and partitioned
+    # indexes cannot be)
+    op.create_index(
+        'ix_coop_daily_production_location_id_collection_date',
+        'coop_daily_production',
+        ['location_id', 'collection_date'],
+    )
+
+    _backfill()
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_coop_daily_production_location_id_collection_date',
+        table_name='coop_daily_production',
+    )
+    # Dropping the partitioned table drops its partitions
+    op.drop_table('coop_daily_production')
+    with op.batch_alter_table('coop') as batch_op:
+        batch_op.drop_column('root_id')
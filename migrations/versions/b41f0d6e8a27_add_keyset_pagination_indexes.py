@@ -0,0 +1,56 @@
+"""add (created_at, id) indexes for keyset pagination
+
+Revision ID: b41f0d6e8a27
+Revises: 7c2e4a91d5b3
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41f0d6e8a27'
+down_revision: Union[str, None] = '7c2e4a91d5b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ("ix_users_created_at_id", "users", ["created_at", "id"]),
+    ("ix_locations_created_at_id", "locations", ["created_at", "id"]),
+    ("ix_coop_created_at_id", "coop", ["created_at", "id"]),
+    ("ix_coop_location_id_created_at_id", "coop", ["location_id", "created_at", "id"]),
+    ("ix_buyer_created_at_id", "buyer", ["created_at", "id"]),
+    ("ix_buyer_location_id_created_at_id", "buyer", ["location_id", "created_at", "id"]),
+    ("ix_expenditure_created_at_id", "expenditure", ["created_at", "id"]),
+    ("ix_expenditure_location_id_created_at_id", "expenditure", ["location_id", "created_at", "id"]),
+    ("ix_expenditure_category_created_at_id", "expenditure", ["category", "created_at", "id"]),
+    ("ix_expenditure_user_id_created_at_id", "expenditure", ["user_id", "created_at", "id"]),
+]
+
+# Single-column indexes now covered by the leading column of a keyset index
+SUPERSEDED = [
+    ("ix_coop_location_id", "coop", ["location_id"]),
+    ("ix_buyer_location_id", "buyer", ["location_id"]),
+    ("ix_expenditure_category", "expenditure", ["category"]),
+    ("ix_expenditure_user_id", "expenditure", ["user_id"]),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+        for name, table, _ in SUPERSEDED:
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in SUPERSEDED:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
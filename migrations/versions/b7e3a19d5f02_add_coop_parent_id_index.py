@@ -0,0 +1,38 @@
+"""add coop parent_id index
+
+Revision ID: b7e3a19d5f02
+Revises: a62d4f8b1c35
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3a19d5f02'
+down_revision: Union[str, None] = 'a62d4f8b1c35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_coop_parent_id',
+            'coop',
+            ['parent_id'],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_coop_parent_id',
+            table_name='coop',
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
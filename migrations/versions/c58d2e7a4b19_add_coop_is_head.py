@@ -0,0 +1,59 @@
+"""add coop.is_head
+
+Revision ID: c58d2e7a4b19
+Revises: b7e3a19d5f02
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c58d2e7a4b19'
+down_revision: Union[str, None] = 'b7e3a19d5f02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, columns); both cover head rows only
+INDEXES = [
+    ("ix_coop_head_created_at_id", ["created_at", "id"]),
+    ("ix_coop_head_location_id_created_at_id", ["location_id", "created_at", "id"]),
+]
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('coop') as batch_op:
+        batch_op.add_column(
+            sa.Column('is_head', sa.Boolean(), nullable=False, server_default=sa.true())
+        )
+
+    # Every version that a later one points back at has been superseded
+    op.execute(
+        "UPDATE coop SET is_head = false "
+        "WHERE EXISTS (SELECT 1 FROM coop AS newer WHERE newer.parent_id = coop.id)"
+    )
+
+    with op.get_context().autocommit_block():
+        partial = sa.text("is_head = true")
+        for name, columns in INDEXES:
+            op.create_index(
+                name,
+                'coop',
+                columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_where=partial,
+                sqlite_where=partial,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='coop', if_exists=True, postgresql_concurrently=True)
+    with op.batch_alter_table('coop') as batch_op:
+        batch_op.drop_column('is_head')
@@ -0,0 +1,75 @@
+"""add delta-encoded coop history
+
+Revision ID: e2f6a8c04d71
+Revises: c58d2e7a4b19
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f6a8c04d71'
+down_revision: Union[str, None] = 'c58d2e7a4b19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Daily figures a delta version may leave NULL, with their column types
+DELTA_COLUMNS = [
+    ("total_fowls", sa.Integer()),
+    ("total_dead_fowls", sa.Integer()),
+    ("total_feed", sa.Integer()),
+    ("collection_date", sa.String()),
+    ("crates_collected", sa.Integer()),
+    ("remainder_eggs", sa.Integer()),
+    ("broken_eggs", sa.Integer()),
+    ("notes", sa.String()),
+    ("efficiency", sa.Float()),
+]
+# Whole versions keep the NOT NULL these columns had; only deltas may skip them
+FIGURES_CHECK = "ck_coop_whole_version_figures"
+FIGURES_CHECK_SQL = "is_delta OR ({})".format(
+    " AND ".join(f"{name} IS NOT NULL" for name, _ in DELTA_COLUMNS)
+)
+
+
+def upgrade() -> None:
+    # Existing rows are all full versions: is_delta false, delta_depth 0
+    with op.batch_alter_table('coop') as batch_op:
+        batch_op.add_column(
+            sa.Column('is_delta', sa.Boolean(), nullable=False, server_default=sa.false())
+        )
+        batch_op.add_column(
+            sa.Column('delta_depth', sa.Integer(), nullable=False, server_default='0')
+        )
+        for name, type_ in DELTA_COLUMNS:
+            batch_op.alter_column(name, existing_type=type_, nullable=True)
+        batch_op.create_check_constraint(FIGURES_CHECK, sa.text(FIGURES_CHECK_SQL))
+
+
+def downgrade() -> None:
+    # Materialize delta versions before the NOT NULLs come back. Each pass
+    # fills the deltas whose next version is full, so runs resolve newest first.
+    fill = ", ".join(
+        f"{name} = COALESCE({name}, (SELECT newer.{name} FROM coop AS newer "
+        f"WHERE newer.parent_id = coop.id))"
+        for name, _ in DELTA_COLUMNS
+    )
+    bind = op.get_bind()
+    while bind.execute(sa.text(
+        f"UPDATE coop SET {fill}, is_delta = false "
+        "WHERE is_delta AND EXISTS (SELECT 1 FROM coop AS newer "
+        "WHERE newer.parent_id = coop.id AND NOT newer.is_delta)"
+    )).rowcount:
+        pass
+
+    with op.batch_alter_table('coop') as batch_op:
+        batch_op.drop_constraint(FIGURES_CHECK, type_='check')
+        for name, type_ in DELTA_COLUMNS:
+            batch_op.alter_column(name, existing_type=type_, nullable=False)
+        batch_op.drop_column('delta_depth')
+        batch_op.drop_column('is_delta')
@@ -0,0 +1,57 @@
+"""add blacklisted_tokens.expires_at
+
+Revision ID: e5a8c3d71f92
+Revises: d93a5c1f7e40
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a8c3d71f92'
+down_revision: Union[str, None] = 'd93a5c1f7e40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Matches authutils.REFRESH_TOKEN_EXPIRES_DAYS: no refresh token revoked
+# before this migration can still be valid after that long
+REFRESH_TOKEN_EXPIRES_DAYS = 7
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('blacklisted_tokens') as batch_op:
+        batch_op.add_column(sa.Column('expires_at', sa.DateTime(), nullable=True))
+
+    # Existing rows never recorded their exp; give them the longest possible
+    # remaining lifetime so the pruning job can eventually remove them
+    backfill = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=REFRESH_TOKEN_EXPIRES_DAYS)
+    op.execute(
+        sa.text("UPDATE blacklisted_tokens SET expires_at = :expires_at WHERE expires_at IS NULL")
+        .bindparams(expires_at=backfill)
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_blacklisted_tokens_expires_at',
+            'blacklisted_tokens',
+            ['expires_at'],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_blacklisted_tokens_expires_at',
+            table_name='blacklisted_tokens',
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
+    with op.batch_alter_table('blacklisted_tokens') as batch_op:
+        batch_op.drop_column('expires_at')
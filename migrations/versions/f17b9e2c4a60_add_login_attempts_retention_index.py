@@ -0,0 +1,38 @@
+"""add login_attempts attempt_time index for retention
+
+Revision ID: f17b9e2c4a60
+Revises: e5a8c3d71f92
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f17b9e2c4a60'
+down_revision: Union[str, None] = 'e5a8c3d71f92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_login_attempts_attempt_time',
+            'login_attempts',
+            ['attempt_time'],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_login_attempts_attempt_time',
+            table_name='login_attempts',
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,52 @@
+"""make email_outbox.body nullable and index finished rows for retention
+
+Revision ID: f4b2d8a61c93
+Revises: a3c9e71b5d28
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b2d8a61c93'
+down_revision: Union[str, None] = 'a3c9e71b5d28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('email_outbox') as batch_op:
+        batch_op.alter_column('body', existing_type=sa.String(), nullable=True)
+
+    # Rows already delivered or given up on no longer need their OTP or reset code
+    op.execute("UPDATE email_outbox SET body = NULL WHERE status IN ('sent', 'failed')")
+
+    with op.get_context().autocommit_block():
+        finished = sa.text("status IN ('sent', 'failed')")
+        op.create_index(
+            'ix_email_outbox_finished_created_at',
+            'email_outbox',
+            ['created_at'],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+            postgresql_where=finished,
+            sqlite_where=finished,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_email_outbox_finished_created_at',
+            table_name='email_outbox',
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
+
+    op.execute("UPDATE email_outbox SET body = '' WHERE body IS NULL")
+    with op.batch_alter_table('email_outbox') as batch_op:
+        batch_op.alter_column('body', existing_type=sa.String(), nullable=False)
@@ -0,0 +1,119 @@
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+# Upper bounds (ms) of the checkout wait-time histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolMetrics:
+    """Checkout counters and wait-time histogram for one engine's pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_sum_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def observe_wait(self, seconds: float):
+        elapsed_ms = seconds * 1000
+        index = len(WAIT_BUCKETS_MS)
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                index = i
+                break
+        with self._lock:
+            self.wait_buckets[index] += 1
+            self.wait_count += 1
+            self.wait_sum_ms += elapsed_ms
+            self.wait_max_ms = max(self.wait_max_ms, elapsed_ms)
+
+    def _increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def instrument(self, engine):
+        """Attach pool event listeners; `engine` is a sync Engine (use `.sync_engine` for async)"""
+        self.engine = engine
+        event.listen(engine, "connect", lambda *args: self._increment("connects"))
+        event.listen(engine, "checkout", lambda *args: self._increment("checkouts"))
+        event.listen(engine, "checkin", lambda *args: self._increment("checkins"))
+        event.listen(engine, "invalidate", lambda *args: self._increment("invalidations"))
+
+    def snapshot(self) -> dict:
+        # engine.pool is re-read every time because dispose() swaps in a new pool
+        pool = self.engine.pool if self.engine is not None else None
+        state = {
+            "name": self.name,
+            "pool_class": type(pool).__name__ if pool is not None else None,
+        }
+        if pool is not None and hasattr(pool, "checkedout"):
+            state.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "timeout": pool.timeout(),
+            })
+
+        with self._lock:
+            buckets = {f"le_{bound}ms": count for bound, count in zip(WAIT_BUCKETS_MS, self.wait_buckets)}
+            buckets["le_inf"] = self.wait_buckets[-1]
+            state.update({
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "checkout_wait_ms": {
+                    "count": self.wait_count,
+                    "avg": round(self.wait_sum_ms / self.wait_count, 3) if self.wait_count else 0.0,
+                    "max": round(self.wait_max_ms, 3),
+                    "buckets": buckets,
+                },
+            })
+        return state
+
+
+_registry: Dict[str, PoolMetrics] = {}
+
+
+def register(name: str) -> PoolMetrics:
+    if name not in _registry:
+        _registry[name] = PoolMetrics(name)
+    return _registry[name]
+
+
+def snapshot_all() -> list:
+    return [metrics.snapshot() for metrics in _registry.values()]
+
+
+def timed_pool_class(base, metrics: PoolMetrics):
+    """
+    Subclass a QueuePool so each checkout records how long it waited.
+    The metrics are bound on the class so they survive engine.dispose(),
+    which recreates the pool from its class.
+    """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return base._do_get(self)
+        except PoolTimeoutError:
+            metrics._increment("timeouts")
+            raise
+        finally:
+            metrics.observe_wait(time.perf_counter() - started)
+
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
@@ -0,0 +1,138 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Requests issuing more statements than this are logged and flagged
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "25"))
+
+
+class QueryStats:
+    """Statements and database time accumulated for one request (or one capture)"""
+
+    def __init__(self, scope: Optional[dict] = None, keep_statements: bool = False):
+        self.scope = scope
+        self.count = 0
+        self.duration_ms = 0.0
+        self.statements: Optional[List[str]] = [] if keep_statements else None
+
+    @property
+    def route(self) -> Optional[str]:
+        if self.scope is None:
+            return None
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope.get("path")
+
+    def record(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.duration_ms += elapsed_ms
+        if self.statements is not None:
+            self.statements.append(statement)
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_captures: List[QueryStats] = []
+_captures_lock = threading.Lock()
+_observers: List[Callable] = []
+
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def add_observer(observer: Callable):
+    """
+    Call `observer(conn, cursor, statement, parameters, context, executemany, elapsed_ms)`
+    after every statement
+    """
+    _observers.append(observer)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started_at"].pop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+    if _captures:
+        with _captures_lock:
+            for capture in _captures:
+                capture.record(statement, elapsed_ms)
+    for observer in _observers:
+        observer(conn, cursor, statement, parameters, context, executemany, elapsed_ms)
+
+
+class QueryStatsMiddleware:
+    """
+    Count statements and DB time per request and report them as a
+    Server-Timing header; requests over QUERY_BUDGET are logged and
+    flagged with X-Query-Budget-Exceeded.
+    """
+
+    def __init__(self, app, budget: int = QUERY_BUDGET):
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope=scope)
+        token = _current.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                timing = f'db;dur={stats.duration_ms:.2f};desc="{stats.count} queries"'
+                headers.append((b"server-timing", timing.encode()))
+                if stats.count > self.budget:
+                    headers.append((b"x-query-budget-exceeded", str(stats.count).encode()))
+                    logger.warning(
+                        f"Query budget exceeded: {scope.get('method')} {stats.route} "
+                        f"issued {stats.count} statements (budget {self.budget})"
+                    )
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """
+    Test helper: fail if the block issues more than `limit` statements.
+    Counts process-wide, so it also sees requests made through TestClient.
+
+        with assert_max_queries(2):
+            client.get("/locations/1/full-details")
+    """
+    capture = QueryStats(keep_statements=True)
+    with _captures_lock:
+        _captures.append(capture)
+    try:
+        yield capture
+    finally:
+        with _captures_lock:
+            _captures.remove(capture)
+    if capture.count > limit:
+        listing = "\n".join(f"  {i + 1}. {sql}" for i, sql in enumerate(capture.statements))
+        raise AssertionError(f"expected at most {limit} queries, got {capture.count}:\n{listing}")
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """Run `func` every `interval` seconds on the event loop until stopped"""
+
+    def __init__(self, name: str, interval: float, func: Callable[[], Awaitable], run_at_start: bool = False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.run_at_start = run_at_start
+        self.runs = 0
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _loop(self):
+        # Spread the first run so several workers started together don't all fire at once
+        delay = 0 if self.run_at_start else self.interval * random.uniform(0.5, 1.0)
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.func()
+                self.runs += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Periodic job {self.name} failed: {e}")
+            delay = self.interval
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(), name=self.name)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_jobs: List[PeriodicJob] = []
+
+
+def every(seconds: float, name: Optional[str] = None, run_at_start: bool = False):
+    """
+    Register a coroutine function as a periodic job; jobs run between
+    start() and stop(), which the app lifespan calls. A non-positive
+    interval disables the job.
+    """
+    def register(func):
+        _jobs.append(PeriodicJob(name or func.__qualname__, seconds, func, run_at_start))
+        return func
+    return register
+
+
+def start():
+    for job in _jobs:
+        job.start()
+
+
+async def stop():
+    for job in _jobs:
+        await job.stop()
+
+
+def snapshot() -> list:
+    return [
+        {"name": job.name, "interval": job.interval, "runs": job.runs, "failures": job.failures}
+        for job in _jobs
+    ]
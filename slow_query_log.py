@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+import greenlet
+
+import query_stats
+from database import env_flag
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# EXPLAIN ANALYZE re-runs the statement, so it is opt-in, sampled and SELECT-only
+SLOW_QUERY_EXPLAIN = env_flag("SLOW_QUERY_EXPLAIN")
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0.1"))
+SLOW_QUERY_LOG_PATH = os.getenv("SLOW_QUERY_LOG_PATH", "slow_queries.log")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+# Distinct statement shapes kept in memory for the top-offenders view
+MAX_TRACKED_STATEMENTS = 500
+
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|\$\d+|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|\$\d+|%\(\w+\)s|%s|:\w+)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_file_logger: Optional[logging.Logger] = None
+_stats = {}
+_lock = threading.Lock()
+
+
+def normalize(statement: str) -> str:
+    """Collapse whitespace and expanded IN (...) lists so one query shape maps to one key"""
+    statement = _PLACEHOLDER_LIST.sub("(...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def parameter_shape(parameters, executemany: bool):
+    if executemany:
+        return {"executemany": len(parameters)}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _crud_function(code) -> Optional[str]:
+    filename = code.co_filename
+    if f"{os.sep}api{os.sep}" in filename and filename.endswith("crud.py"):
+        package = os.path.basename(os.path.dirname(filename))
+        return f"{package}.crud.{code.co_name}"
+    return None
+
+
+def _find_crud_frame(frame) -> Optional[str]:
+    while frame is not None:
+        name = _crud_function(frame.f_code)
+        if name:
+            return name
+        frame = frame.f_back
+    return None
+
+
+def calling_crud_function() -> Optional[str]:
+    """Find the innermost crud function that issued the statement"""
+    # Sync sessions (threadpool routes) keep the caller on the frame stack
+    name = _find_crud_frame(sys._getframe())
+    if name:
+        return name
+
+    # Async sessions run the driver in a child greenlet; the awaiting
+    # coroutines are on the parent greenlet's suspended stack
+    parent = greenlet.getcurrent().parent
+    if parent is not None:
+        return _find_crud_frame(parent.gr_frame)
+    return None
+
+
+def _store() -> logging.Logger:
+    global _file_logger
+    if _file_logger is None:
+        store = logging.getLogger("slow_queries.store")
+        store.propagate = False
+        store.setLevel(logging.INFO)
+        handler = RotatingFileHandler(
+            SLOW_QUERY_LOG_PATH,
+            maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=SLOW_QUERY_LOG_BACKUPS,
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        store.addHandler(handler)
+        _file_logger = store
+    return _file_logger
+
+
+def _explain(conn, statement: str, parameters, context) -> Optional[list]:
+    if conn.dialect.name != "postgresql":
+        return None
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return None
+    if context is not None and context.execution_options.get("stream_results"):
+        return None
+
+    # Savepoint so a failing EXPLAIN cannot abort the caller's transaction
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters)
+            plan = cursor.fetchone()[0]
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            raise
+        return json.loads(plan) if isinstance(plan, str) else plan
+    except Exception as e:
+        logger.warning(f"EXPLAIN capture failed: {e}")
+        return None
+    finally:
+        cursor.close()
+
+
+def record(conn, cursor, statement, parameters, context, executemany, elapsed_ms):
+    if elapsed_ms < SLOW_QUERY_MS:
+        return
+
+    request_stats = query_stats.current()
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(elapsed_ms, 3),
+        "statement": normalize(statement),
+        "parameters": parameter_shape(parameters, executemany),
+        "route": request_stats.route if request_stats else None,
+        "crud_function": calling_crud_function(),
+        "plan": None,
+    }
+    if SLOW_QUERY_EXPLAIN and not executemany and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE_RATE:
+        entry["plan"] = _explain(conn, statement, parameters, context)
+
+    with _lock:
+        aggregate = _stats.get(entry["statement"])
+        if aggregate is None:
+            if len(_stats) >= MAX_TRACKED_STATEMENTS:
+                cheapest = min(_stats, key=lambda key: _stats[key]["total_ms"])
+                del _stats[cheapest]
+            aggregate = _stats[entry["statement"]] = {
+                "statement": entry["statement"],
+                "parameters": entry["parameters"],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "routes": set(),
+                "crud_functions": set(),
+                "last_plan": None,
+                "last_seen": None,
+            }
+        aggregate["count"] += 1
+        aggregate["total_ms"] += elapsed_ms
+        aggregate["max_ms"] = max(aggregate["max_ms"], elapsed_ms)
+        aggregate["last_seen"] = entry["at"]
+        if entry["route"]:
+            aggregate["routes"].add(entry["route"])
+        if entry["crud_function"]:
+            aggregate["crud_functions"].add(entry["crud_function"])
+        if entry["plan"] is not None:
+            aggregate["last_plan"] = entry["plan"]
+
+    try:
+        _store().info(json.dumps(entry, default=str))
+    except OSError as e:
+        logger.warning(f"Could not write slow query log: {e}")
+
+
+def top_offenders(limit: int = 20) -> list:
+    """Slow statement shapes ordered by total time spent in them"""
+    with _lock:
+        ranked = sorted(_stats.values(), key=lambda item: item["total_ms"], reverse=True)[:limit]
+        return [
+            {
+                **item,
+                "total_ms": round(item["total_ms"], 3),
+                "max_ms": round(item["max_ms"], 3),
+                "avg_ms": round(item["total_ms"] / item["count"], 3),
+                "routes": sorted(item["routes"]),
+                "crud_functions": sorted(item["crud_functions"]),
+            }
+            for item in ranked
+        ]
+
+
+query_stats.add_observer(record)
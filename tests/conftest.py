@@ -0,0 +1,180 @@
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Settings are read at import time, so they are fixed before the app loads.
+# TEST_DATABASE_URL runs the suite against another server (e.g. PostgreSQL).
+os.environ["DATABASE_URL"] = os.getenv(
+    "TEST_DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db"
+)
+os.environ.pop("DATABASE_READ_URL", None)
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("OTP_HMAC_KEY", "test-otp-key")
+os.environ.setdefault("HASH_WORKERS", "0")
+os.environ.setdefault("EMAIL_OUTBOX_WORKER", "0")
+
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+
+import database  # noqa: E402
+from base import Base  # noqa: E402
+from api.auth import authutils, model, policy  # noqa: E402
+
+# The app lifespan builds the engines, and the tests run without it.
+# TestClient and asyncio.run give every request or call its own event loop,
+# and a pooled async connection only works on the loop that opened it
+database.create_engines()
+database.async_engine = database.async_read_engine = create_async_engine(
+    database.async_database_url, poolclass=NullPool
+)
+database.AsyncSessionLocal.configure(bind=database.async_engine)
+database.AsyncReadSessionLocal.configure(bind=database.async_engine)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark", action="store_true", default=False,
+        help="also run the tests marked benchmark",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: timing comparison, skipped unless --benchmark is given")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmark; run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    """A fresh, empty schema for every test"""
+    if database.engine.dialect.name == "postgresql":
+        # users and locations reference each other, which drop_all cannot order
+        with database.engine.begin() as conn:
+            conn.exec_driver_sql("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+    else:
+        Base.metadata.drop_all(database.engine)
+    Base.metadata.create_all(database.engine)
+
+
+@pytest.fixture(autouse=True)
+def token_versions(monkeypatch):
+    """The schema starts empty, so no user's tokens have been revoked yet"""
+    monkeypatch.setattr(policy, "token_versions", policy.TokenVersions())
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    # No lifespan: the background workers and scheduler stay off
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def make_user(db):
+    def make(username="ann", role="admin", location_id=None, **fields):
+        user = model.DBUser(
+            username=username,
+            email=f"{username}@example.com",
+            password="",
+            role=role,
+            status="active",
+            **fields,
+        )
+        user.location_id = location_id
+        db.add(user)
+        db.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def auth_headers():
+    def headers(role="admin", user_id=1, location_id=None, username="ann"):
+        user = SimpleNamespace(
+            id=user_id, username=username, role=role, status="active",
+            location_id=location_id, token_version=0,
+        )
+        token = authutils.create_access_token(policy.token_claims(user))
+        return {"Authorization": f"Bearer {token}"}
+    return headers
+
+
+@pytest.fixture
+def location(db):
+    location = model.DBLocation(name="North farm", address="1 Road", region="North")
+    db.add(location)
+    db.commit()
+    return location
+
+
+@pytest.fixture
+def coop_payload(location):
+    """Body for POST /coops/ and PATCH /coops/{id} at `location`, with overrides applied"""
+    def payload(**overrides) -> dict:
+        fields = dict(
+            status="active",
+            coop_name="A1",
+            user_id=1,
+            total_fowls=100,
+            total_dead_fowls=0,
+            total_feed=10,
+            egg_count=80,
+            collection_date="2026-10-01",
+            crates_collected=2,
+            remainder_eggs=20,
+            broken_eggs=1,
+            notes="",
+            efficiency=0.8,
+            location_id=location.id,
+        )
+        fields.update(overrides)
+        return fields
+    return payload
+
+
+@pytest.fixture
+def build_history(client, db, auth_headers, coop_payload):
+    """
+    Store a coop, then PATCH one new version per entry in `days` (overrides
+    of coop_payload); returns each version's body, oldest first
+    """
+    def build(days) -> list:
+        headers = auth_headers()
+        bodies = [coop_payload()]
+        first = model.DBCoops(**bodies[0])
+        db.add(first)
+        db.commit()
+        coop_id = first.id
+        for day in days:
+            bodies.append(coop_payload(**day))
+            response = client.patch(f"/coops/{coop_id}", json=bodies[-1], headers=headers)
+            assert response.status_code == 200, response.text
+            db.expire_all()
+            coop_id = db.query(model.DBCoops.id).filter(model.DBCoops.is_head).scalar()
+        return bodies
+    return build
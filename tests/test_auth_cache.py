@@ -0,0 +1,116 @@
+import time
+
+import pytest
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError
+
+from api.auth import authutils, cache, model
+
+
+@pytest.fixture(autouse=True)
+def caches(monkeypatch):
+    monkeypatch.setattr(cache, "principal_cache", cache.PrincipalCache(ttl_seconds=60, max_size=2))
+    monkeypatch.setattr(cache, "token_cache", cache.VerifiedTokenCache(max_size=2))
+
+
+def cached(user) -> cache.UserPrincipal:
+    principal = cache.UserPrincipal(user)
+    cache.principal_cache.put(principal)
+    return principal
+
+
+def token(exp: float, **claims) -> str:
+    return jwt.encode({"sub": "ann", "exp": exp, **claims}, authutils.SECRET_KEY, algorithm=authutils.ALGORITHM)
+
+
+def test_committed_user_change_evicts_the_principal(db, make_user):
+    user = make_user()
+    cached(user)
+
+    user.role = "feeder"
+    db.flush()
+    # Still cached until commit, so a concurrent request cannot re-cache the old row
+    assert cache.principal_cache.get("ann") is not None
+    db.commit()
+    assert cache.principal_cache.get("ann") is None
+
+
+def test_rolled_back_change_keeps_the_principal(db, make_user):
+    user = make_user()
+    cached(user)
+    user.role = "feeder"
+    db.flush()
+    db.rollback()
+    assert cache.principal_cache.get("ann").role == "admin"
+
+
+def test_rename_evicts_the_old_username(db, make_user):
+    user = make_user()
+    cached(user)
+    user.username = "anne"
+    db.commit()
+    assert cache.principal_cache.get("ann") is None
+
+
+def test_location_change_clears_every_principal(db, make_user, location):
+    cached(make_user(location_id=location.id))
+    cached(make_user(username="bob", location_id=location.id))
+    location.name = "Renamed farm"
+    db.commit()
+    assert cache.principal_cache.stats()["size"] == 0
+
+
+def test_principal_expires_and_is_bounded(db, make_user, monkeypatch):
+    ann, bob, cat = (cached(make_user(username=name)) for name in ("ann", "bob", "cat"))
+    # Least recently used first
+    assert cache.principal_cache.get("ann") is None
+    assert cache.principal_cache.get("cat") is cat
+
+    now = time.monotonic()
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now + 61)
+    assert cache.principal_cache.get("cat") is None
+    with pytest.raises(AttributeError):
+        cat.role = "admin"
+
+
+def test_token_entry_lasts_until_exp(monkeypatch):
+    decodes = []
+    decode = authutils.jwt.decode
+    monkeypatch.setattr(authutils.jwt, "decode", lambda *args, **kwargs: decodes.append(1) or decode(*args, **kwargs))
+    exp = int(time.time()) + 60
+    issued = token(exp)
+
+    assert authutils.decode_access_token(issued)["exp"] == exp
+    assert authutils.decode_access_token(issued)["exp"] == exp
+    assert len(decodes) == 1
+
+    # At `exp` the entry is dropped, so jwt.decode runs again and judges the expiry
+    monkeypatch.setattr(cache.time, "time", lambda: exp)
+    authutils.decode_access_token(issued)
+    assert len(decodes) == 2
+    assert cache.token_cache.stats()["expirations"] == 1
+
+
+def test_expired_token_is_refused_not_served_from_cache():
+    with pytest.raises(ExpiredSignatureError):
+        authutils.decode_access_token(token(int(time.time()) - 1))
+    assert cache.token_cache.stats()["size"] == 0
+
+
+def test_token_cache_is_bounded_and_skips_tokens_without_exp():
+    exp = int(time.time()) + 60
+    tokens = [token(exp, uid=n) for n in range(3)]
+    for issued in tokens:
+        authutils.decode_access_token(issued)
+    assert cache.token_cache.get(tokens[0]) is None
+    assert cache.token_cache.stats()["evictions"] == 1
+
+    cache.token_cache.put("no-exp", {"sub": "ann"})
+    assert cache.token_cache.get("no-exp") is None
+
+
+def test_bad_signature_is_never_cached():
+    forged = jwt.encode({"sub": "ann", "exp": int(time.time()) + 60}, "wrong-key", algorithm=authutils.ALGORITHM)
+    with pytest.raises(authutils.JWTError):
+        authutils.decode_access_token(forged)
+    assert cache.token_cache.stats()["size"] == 0
@@ -0,0 +1,79 @@
+import pytest
+
+from api.auth import authutils, cache, model, policy
+from api.location.crud import LocationCRUD
+
+METRICS = "/api/v1/admin/metrics/user-cache"
+
+
+@pytest.fixture
+def south(db):
+    location = model.DBLocation(name="South farm", address="2 Road", region="South")
+    db.add(location)
+    db.commit()
+    return location
+
+
+def test_bulk_assign_reports_missing_ids(client, db, make_user, location, south, coop_payload):
+    ann, bob = make_user(location_id=location.id), make_user(username="bob")
+    coop = model.DBCoops(**coop_payload())
+    db.add(coop)
+    db.commit()
+
+    response = client.post(f"/locations/{south.id}/bulk-assign", params={
+        "user_ids": [ann.id, bob.id, 99],
+        "coop_ids": [coop.id, 77, 78],
+    })
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert (results["users"]["count"], results["users"]["missing"]) == (2, [99])
+    assert (results["coops"]["count"], results["coops"]["missing"]) == (1, [77, 78])
+
+    db.expire_all()
+    assert {user.location_id for user in db.query(model.DBUser)} == {south.id}
+    assert db.get(model.DBCoops, coop.id).location_id == south.id
+
+
+def test_bulk_assign_needs_ids_and_a_location(client, make_user):
+    make_user()
+    assert client.post("/locations/1/bulk-assign").status_code == 400
+    assert client.post("/locations/999/bulk-assign", params={"user_ids": [1]}).status_code == 404
+
+
+def test_only_moved_users_have_their_tokens_revoked(client, db, make_user, auth_headers, south):
+    ann = make_user(location_id=south.id)
+    bob = make_user(username="bob")
+    ann_token = auth_headers(location_id=south.id)
+    bob_token = auth_headers(user_id=bob.id, username="bob")
+
+    response = client.post(f"/locations/{south.id}/bulk-assign", params={"user_ids": [ann.id, bob.id]})
+    assert response.status_code == 200, response.text
+
+    db.expire_all()
+    assert (db.get(model.DBUser, ann.id).token_version, db.get(model.DBUser, bob.id).token_version) == (0, 1)
+    # Applied in this worker at once, without waiting for the sync job
+    assert policy.token_versions.current(bob.id) == 1
+    assert client.get(METRICS, headers=ann_token).status_code == 200
+    assert client.get(METRICS, headers=bob_token).status_code == 401
+    fresh = authutils.create_access_token(policy.token_claims(db.get(model.DBUser, bob.id)))
+    assert client.get(METRICS, headers={"Authorization": f"Bearer {fresh}"}).status_code == 200
+
+
+def test_caches_are_updated_only_after_commit(db, make_user, south):
+    bob = make_user(username="bob")
+    cache.principal_cache.put(cache.UserPrincipal(bob))
+
+    def failing_commit():
+        raise RuntimeError("connection lost")
+    db.commit = failing_commit
+    with pytest.raises(RuntimeError):
+        LocationCRUD.bulk_assign(db, south.id, user_ids=[bob.id])
+    del db.commit
+    db.rollback()
+    assert policy.token_versions.current(bob.id) == 0
+    assert cache.principal_cache.get("bob") is not None
+
+    LocationCRUD.bulk_assign(db, south.id, user_ids=[bob.id])
+    assert policy.token_versions.current(bob.id) == 1
+    assert cache.principal_cache.get("bob") is None
+    cache.principal_cache.clear()
@@ -0,0 +1,81 @@
+from api.auth import model
+from api.coop import crud
+
+
+def store(db, coop_payload, *names):
+    coops = [model.DBCoops(**coop_payload(coop_name=name)) for name in names]
+    db.add_all(coops)
+    db.commit()
+    return [coop.id for coop in coops]
+
+
+def item(coop_payload, coop_id, **overrides):
+    return {**coop_payload(**overrides), "coop_id": coop_id}
+
+
+def test_batch_reports_each_item(client, db, make_user, auth_headers, coop_payload):
+    make_user()
+    first, second, retired = store(db, coop_payload, "A1", "B1", "C1")
+    db.get(model.DBCoops, retired).is_head = False
+    db.commit()
+
+    response = client.post("/coops/daily-batch", headers=auth_headers(), json={"items": [
+        item(coop_payload, first, egg_count=91),
+        item(coop_payload, 999),
+        item(coop_payload, retired),
+        item(coop_payload, second, egg_count=92),
+    ]})
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["created"], body["failed"]) == (2, 2)
+    results = body["results"]
+    assert [result["status"] for result in results] == ["created", "failed", "failed", "created"]
+    assert [result["status_code"] for result in results[1:3]] == [404, 409]
+
+    db.expire_all()
+    for result, parent_id, eggs in ((results[0], first, 91), (results[3], second, 92)):
+        version = db.get(model.DBCoops, result["id"])
+        assert (version.parent_id, version.egg_count, version.is_head) == (parent_id, eggs, True)
+        assert not db.get(model.DBCoops, parent_id).is_head
+
+
+def test_batch_rejects_a_coop_listed_twice(client, db, make_user, auth_headers, coop_payload):
+    make_user()
+    (coop_id,) = store(db, coop_payload, "A1")
+
+    response = client.post("/coops/daily-batch", headers=auth_headers(), json={"items": [
+        item(coop_payload, coop_id, egg_count=91),
+        item(coop_payload, coop_id, egg_count=92),
+    ]})
+
+    assert response.status_code == 200, response.text
+    first, repeated = response.json()["results"]
+    assert first["status"] == "created"
+    assert (repeated["status"], repeated["status_code"]) == ("failed", 400)
+    assert db.query(model.DBCoops).filter(model.DBCoops.parent_id == coop_id).count() == 1
+
+
+def test_batch_item_conflicts_when_the_head_moves(client, db, make_user, auth_headers, coop_payload, monkeypatch):
+    make_user()
+    stale, fresh = store(db, coop_payload, "A1", "B1")
+    read_heads = crud.read_coops_by_ids
+
+    async def read_then_retire(coop_ids, session):
+        # Another writer replaces the head between the batch's read and its update
+        heads = await read_heads(coop_ids, session)
+        db.get(model.DBCoops, stale).is_head = False
+        db.commit()
+        return heads
+
+    monkeypatch.setattr(crud, "read_coops_by_ids", read_then_retire)
+    response = client.post("/coops/daily-batch", headers=auth_headers(), json={"items": [
+        item(coop_payload, stale, egg_count=91),
+        item(coop_payload, fresh, egg_count=92),
+    ]})
+
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert (results[0]["status"], results[0]["status_code"]) == ("failed", 409)
+    assert results[1]["status"] == "created"
+    assert db.query(model.DBCoops).filter(model.DBCoops.parent_id == stale).count() == 0
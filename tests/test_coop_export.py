@@ -0,0 +1,48 @@
+import csv
+import io
+import json
+
+from api.auth import model
+from api.coop import crud
+
+FIGURES = ["egg_count", "total_feed", "total_fowls", "total_dead_fowls", "broken_eggs", "notes"]
+
+
+def test_export_rebuilds_delta_versions(client, db, auth_headers, build_history, make_user, monkeypatch):
+    make_user()
+    monkeypatch.setattr(crud, "COOP_HISTORY_MODE", "delta")
+    monkeypatch.setattr(crud, "COOP_SNAPSHOT_EVERY", 3)
+    # Most days change one or two figures, so superseded versions keep few
+    bodies = build_history([
+        {"egg_count": 85},
+        {"egg_count": 85, "total_dead_fowls": 2},
+        {"egg_count": 90, "total_dead_fowls": 2, "notes": "vet visit"},
+        {"egg_count": 90, "total_dead_fowls": 2, "notes": "vet visit", "total_feed": 12},
+        {"egg_count": 91, "total_dead_fowls": 2, "notes": "vet visit", "total_feed": 12},
+    ])
+
+    stored = db.query(model.DBCoops).order_by(model.DBCoops.id).all()
+    assert any(coop.is_delta for coop in stored)
+    assert any(coop.egg_count is None for coop in stored)
+
+    response = client.get("/coops/export", headers=auth_headers())
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [row["id"] for row in rows] == [coop.id for coop in stored]
+    for row, body in zip(rows, bodies):
+        assert {name: row[name] for name in FIGURES} == {name: body[name] for name in FIGURES}
+    assert "is_delta" not in rows[0] and "delta_depth" not in rows[0]
+
+
+def test_csv_export_rebuilds_delta_versions(client, auth_headers, build_history, make_user, monkeypatch):
+    make_user()
+    monkeypatch.setattr(crud, "COOP_HISTORY_MODE", "delta")
+    bodies = build_history([{"egg_count": 70}, {"egg_count": 75}])
+
+    response = client.get("/coops/export?format=csv", headers=auth_headers())
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+
+    assert [int(row["egg_count"]) for row in rows] == [body["egg_count"] for body in bodies]
+    assert [int(row["total_feed"]) for row in rows] == [body["total_feed"] for body in bodies]
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import database
+from api.auth import model
+from api.coop import crud
+
+FIGURES = crud.DELTA_FIELDS
+
+
+def figures(coop) -> dict:
+    return {name: getattr(coop, name) for name in FIGURES}
+
+
+def test_whole_version_needs_every_figure(db, make_user, coop_payload):
+    make_user()
+    db.add(model.DBCoops(**coop_payload(notes=None)))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+    # A delta version may leave the figures it shares with the next one out
+    delta = model.DBCoops(**coop_payload(notes=None, total_feed=None))
+    delta.is_delta = True
+    delta.is_head = False
+    db.add(delta)
+    db.commit()
+
+
+def test_create_stores_every_figure(client, db, make_user, auth_headers, coop_payload):
+    make_user()
+    response = client.post("/coops/", json=coop_payload(broken_eggs=4, crates_collected=3), headers=auth_headers())
+    assert response.status_code == 200, response.text
+
+    coop = db.get(model.DBCoops, response.json()["id"])
+    assert (coop.broken_eggs, coop.crates_collected) == (4, 3)
+
+
+def test_single_coop_reads_rebuild_delta_versions(db, make_user, build_history, monkeypatch):
+    make_user()
+    monkeypatch.setattr(crud, "COOP_HISTORY_MODE", "delta")
+    bodies = build_history([{"egg_count": 85}, {"egg_count": 85, "total_feed": 12}, {"egg_count": 90}])
+    ids = [coop.id for coop in db.query(model.DBCoops).order_by(model.DBCoops.id)]
+    assert db.get(model.DBCoops, ids[0]).is_delta
+
+    async def read():
+        async with database.AsyncSessionLocal() as session:
+            return (
+                [await crud.read_coop_by_version(coop_id, session) for coop_id in ids],
+                await crud.read_coop_by_user_id(1, session),
+                await crud.find_coop_by_user_id(1, session),
+            )
+
+    versions, by_user, found = asyncio.run(read())
+    for coop, body in zip(versions, bodies):
+        assert figures(coop) == {name: body[name] for name in FIGURES}
+    for coop in (by_user, found):
+        assert figures(coop) == {name: bodies[ids.index(coop.id)][name] for name in FIGURES}
+
+
+def test_in_place_update_only_touches_the_head(client, db, make_user, auth_headers, build_history):
+    make_user()
+    build_history([{"egg_count": 85}])
+    old, head = db.query(model.DBCoops).order_by(model.DBCoops.id).all()
+    old_id, head_id = old.id, head.id
+    body = {name: value for name, value in vars(head).items() if name in (
+        "total_fowls", "total_dead_fowls", "total_feed", "coop_name", "crates_collected",
+        "remainder_eggs", "broken_eggs", "notes", "efficiency", "status", "collection_date",
+    )}
+
+    def patch(coop_id):
+        # The route's path is the literal "{coop_id: int}", so coop_id travels as a query parameter
+        return client.patch(
+            "/coops/{coop_id: int}", params={"coop_id": coop_id},
+            json={**body, "egg_count": 99}, headers=auth_headers(),
+        )
+
+    stale = patch(old_id)
+    assert stale.status_code == 409
+    db.expire_all()
+    assert db.get(model.DBCoops, old_id).egg_count == 80
+
+    current = patch(head_id)
+    assert current.status_code == 200, current.text
+    db.expire_all()
+    assert db.get(model.DBCoops, head_id).egg_count == 99
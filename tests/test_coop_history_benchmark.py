@@ -0,0 +1,120 @@
+import asyncio
+import random
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import insert, text, update
+
+import database
+from api.auth import model
+from api.coop import crud
+
+COOPS = 10
+YEARS = 3
+READS = 50
+
+
+def history(coops: int, days: int) -> tuple:
+    """
+    One version per coop per day; eggs and date move daily, the rest now
+    and then. Returns the whole rows to insert, the delta updates to apply
+    to them afterwards, and each version's figures as written.
+    """
+    rng = random.Random(2026)
+    start = datetime(2026 - YEARS, 1, 1)
+    rows = []
+    deltas = []
+    written = {}
+    next_id = 1
+    for coop in range(coops):
+        fowls, dead, feed, notes = 500, 0, 40, ""
+        previous = None
+        for day in range(days):
+            if rng.random() < 0.05:
+                dead += 1
+                fowls -= 1
+            if rng.random() < 0.1:
+                feed = rng.randint(35, 45)
+            if rng.random() < 0.02:
+                notes = rng.choice(["", "vet visit", "new feed supplier"])
+            eggs = rng.randint(300, 450)
+            row = dict(
+                id=next_id, parent_id=previous["id"] if previous else None,
+                root_id=previous["root_id"] or previous["id"] if previous else None,
+                user_id=1, location_id=1, status="active", coop_name=f"C{coop}",
+                total_fowls=fowls, total_dead_fowls=dead, total_feed=feed, egg_count=eggs,
+                collection_date=(date(2026 - YEARS, 1, 1) + timedelta(days=day)).isoformat(),
+                crates_collected=eggs // 30, remainder_eggs=eggs % 30, broken_eggs=rng.randint(0, 3),
+                notes=notes, efficiency=round(eggs / fowls, 2), is_head=True, is_delta=False, delta_depth=0,
+                created_at=start + timedelta(days=day),
+            )
+            if previous is not None:
+                # The same rules create_coop_version applies to the retired head
+                delta = crud.delta_against(SimpleNamespace(**previous), SimpleNamespace(**row))
+                previous["is_head"] = False
+                if delta:
+                    deltas.append({"id": previous["id"], **delta})
+                    row["delta_depth"] = previous["delta_depth"] + 1
+            rows.append(row)
+            written[row["id"]] = {name: row[name] for name in crud.DELTA_FIELDS}
+            previous = row
+            next_id += 1
+    return rows, deltas, written
+
+
+def table_bytes() -> int:
+    """Size of the coop table once compacted, so the delta UPDATEs leave no dead rows behind"""
+    sqlite = database.engine.dialect.name == "sqlite"
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM" if sqlite else "VACUUM FULL coop"))
+        if sqlite:
+            return conn.execute(text("SELECT SUM(pgsize) FROM dbstat WHERE name = 'coop'")).scalar()
+        return conn.execute(text("SELECT pg_table_size('coop')")).scalar()
+
+
+async def read_latency(old_ids: list, head_ids: list) -> tuple:
+    """Mean ms to read one old version, and one head with a year of lineage"""
+    async with database.AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        for coop_id in old_ids:
+            await crud.read_coop_by_id(coop_id, db)
+        version_ms = (time.perf_counter() - started) * 1000 / len(old_ids)
+        started = time.perf_counter()
+        for coop_id in head_ids:
+            await crud.read_coop_lineage(coop_id, db, depth=365)
+        lineage_ms = (time.perf_counter() - started) * 1000 / len(head_ids)
+    return version_ms, lineage_ms
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("mode", ["full", "delta"])
+def test_history_size_and_read_latency(mode, db, make_user, location, monkeypatch):
+    make_user()
+    monkeypatch.setattr(crud, "COOP_HISTORY_MODE", mode)
+    rows, deltas, written = history(COOPS, YEARS * 365)
+    for start in range(0, len(rows), 1000):
+        db.execute(insert(model.DBCoops), rows[start:start + 1000])
+    # As create_coop_versions does: an INSERT would put the column defaults
+    # in place of the NULLs, an UPDATE by primary key keeps them
+    db.execute(update(model.DBCoops), deltas)
+    db.commit()
+
+    size = table_bytes()
+    rng = random.Random(7)
+    old_ids = [row["id"] for row in rng.sample([row for row in rows if not row["is_head"]], READS)]
+    head_ids = [row["id"] for row in rows if row["is_head"]]
+    version_ms, lineage_ms = asyncio.run(read_latency(old_ids, head_ids))
+
+    # The sampled versions read back the figures they were written with
+    async def read_back():
+        async with database.AsyncSessionLocal() as session:
+            return [await crud.read_coop_by_id(coop_id, session) for coop_id in old_ids]
+    for coop in asyncio.run(read_back()):
+        assert {name: getattr(coop, name) for name in crud.DELTA_FIELDS} == written[coop.id]
+
+    print(
+        f"\n{mode}: {len(rows)} versions ({len(deltas)} deltas), table {size / 1024:.0f} KiB, "
+        f"old version read {version_ms:.2f} ms, year of lineage {lineage_ms:.2f} ms"
+    )
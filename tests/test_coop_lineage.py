@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from api.auth import model
+from api.coop import crud
+
+DAYS = [{"egg_count": 85}, {"egg_count": 85, "total_feed": 12}, {"egg_count": 90, "notes": "vet visit"}]
+
+
+@pytest.fixture(params=["full", "delta"])
+def history(request, db, make_user, build_history, monkeypatch):
+    """Four versions of one coop a day apart, stored whole or as deltas; returns (ids, bodies), oldest first"""
+    make_user()
+    monkeypatch.setattr(crud, "COOP_HISTORY_MODE", request.param)
+    bodies = build_history(DAYS)
+    versions = db.query(model.DBCoops).order_by(model.DBCoops.id).all()
+    for day, version in enumerate(versions):
+        version.created_at = datetime(2026, 10, 1) + timedelta(days=day)
+    db.commit()
+    return [version.id for version in versions], bodies
+
+
+def lineage(client, coop_id, **params):
+    response = client.get(f"/coops/{coop_id}/lineage", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_lineage_walks_back_from_the_head(client, history):
+    ids, bodies = history
+    versions = lineage(client, ids[-1])
+    assert [version["id"] for version in versions] == ids[::-1]
+    assert [version["depth"] for version in versions] == [0, 1, 2, 3]
+    for version, body in zip(versions, bodies[::-1]):
+        assert {name: version[name] for name in crud.DELTA_FIELDS} == {name: body[name] for name in crud.DELTA_FIELDS}
+
+
+def test_lineage_from_an_old_version(client, history):
+    ids, bodies = history
+    versions = lineage(client, ids[1], fields="egg_count,total_feed")
+    assert versions == [
+        {"depth": 0, "egg_count": bodies[1]["egg_count"], "total_feed": bodies[1]["total_feed"]},
+        {"depth": 1, "egg_count": bodies[0]["egg_count"], "total_feed": bodies[0]["total_feed"]},
+    ]
+
+
+def test_lineage_depth_and_since(client, history):
+    ids, _ = history
+    assert [version["id"] for version in lineage(client, ids[-1], depth=1)] == [ids[3], ids[2]]
+    assert [version["id"] for version in lineage(client, ids[-1], depth=0)] == [ids[3]]
+    # Stops at the first version created before `since`
+    since = lineage(client, ids[-1], since="2026-10-02T00:00:00")
+    assert [version["id"] for version in since] == [ids[3], ids[2], ids[1]]
+    # A timezone-aware `since` is compared in UTC
+    since = lineage(client, ids[-1], since="2026-10-03T02:00:00+02:00")
+    assert [version["id"] for version in since] == [ids[3], ids[2]]
+
+
+def test_lineage_rejects_unknown_fields_and_coops(client, history):
+    ids, _ = history
+    assert client.get(f"/coops/{ids[-1]}/lineage", params={"fields": "egg_count,secret"}).status_code == 400
+    assert client.get("/coops/999/lineage").status_code == 404
+
+
+def test_rollback_to_a_non_parent_ancestor(client, db, auth_headers, history):
+    ids, bodies = history
+    response = client.post(f"/coops/{ids[-1]}/rollback", params={"to": ids[0]}, headers=auth_headers())
+    assert response.status_code == 200, response.text
+
+    db.expire_all()
+    restored = db.query(model.DBCoops).filter(model.DBCoops.is_head).one()
+    assert restored.id not in ids
+    assert (restored.parent_id, restored.root_id) == (ids[-1], ids[0])
+    assert {name: getattr(restored, name) for name in crud.DELTA_FIELDS} == {
+        name: bodies[0][name] for name in crud.DELTA_FIELDS
+    }
+    # The rollback is itself a version; its lineage runs through the one it replaced
+    assert [version["id"] for version in lineage(client, restored.id, depth=1)] == [restored.id, ids[-1]]
+
+
+def test_rollback_defaults_to_the_parent(client, db, auth_headers, history):
+    ids, bodies = history
+    response = client.post(f"/coops/{ids[-1]}/rollback", headers=auth_headers())
+    assert response.status_code == 200, response.text
+    db.expire_all()
+    restored = db.query(model.DBCoops).filter(model.DBCoops.is_head).one()
+    assert (restored.parent_id, restored.egg_count, restored.notes) == (ids[-1], bodies[2]["egg_count"], bodies[2]["notes"])
+
+
+def test_rollback_refusals(client, db, auth_headers, coop_payload, history):
+    ids, _ = history
+    other = model.DBCoops(**coop_payload(coop_name="B1"))
+    db.add(other)
+    db.commit()
+
+    def rollback(coop_id, role="admin", **params) -> int:
+        return client.post(f"/coops/{coop_id}/rollback", params=params, headers=auth_headers(role=role)).status_code
+
+    # Only the head, and only to one of its own ancestors
+    assert rollback(ids[1], to=ids[0]) == 409
+    assert rollback(ids[-1], to=other.id) == 404
+    assert rollback(999) == 404
+    assert rollback(ids[-1], role="feeder") == 403
+    db.expire_all()
+    assert db.query(model.DBCoops).filter(model.DBCoops.is_head, model.DBCoops.coop_name == "A1").one().id == ids[-1]
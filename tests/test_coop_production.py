@@ -0,0 +1,103 @@
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+import database
+from api.auth import model
+from api.coop import production
+
+postgresql_only = pytest.mark.skipif(
+    database.engine.dialect.name != "postgresql", reason="partitions exist on PostgreSQL only"
+)
+
+
+def facts(db) -> list:
+    db.expire_all()
+    return [
+        (row.collection_date, row.egg_count)
+        for row in db.query(model.DBCoopDailyProduction).order_by(model.DBCoopDailyProduction.collection_date)
+    ]
+
+
+def run(steps):
+    """Run `steps(session)` in a committed async session"""
+    async def call():
+        async with database.AsyncSessionLocal() as session:
+            await steps(session)
+            await session.commit()
+    asyncio.run(call())
+
+
+def test_later_versions_replace_the_days_figures(db, make_user, build_history):
+    make_user()
+    build_history([{"egg_count": 85}, {"egg_count": 90}, {"egg_count": 70, "collection_date": "2026-10-02"}])
+
+    assert facts(db) == [(date(2026, 10, 1), 90), (date(2026, 10, 2), 70)]
+    first = db.query(model.DBCoops).order_by(model.DBCoops.id).first()
+    assert {row.coop_id for row in db.query(model.DBCoopDailyProduction)} == {first.id}
+
+
+def test_record_production_keeps_the_last_row_per_day(db, make_user, coop_payload):
+    make_user()
+    first = model.DBCoops(**coop_payload())
+    db.add(first)
+    db.commit()
+    later = model.DBCoops(**coop_payload(egg_count=95))
+    later.id, later.root_id = first.id + 1, first.id
+    undated = model.DBCoops(**coop_payload(collection_date="last Tuesday"))
+    undated.id = first.id + 2
+
+    run(lambda session: production.record_production([first, later, undated], session))
+    assert facts(db) == [(date(2026, 10, 1), 95)]
+
+
+def test_parse_collection_date():
+    assert production.parse_collection_date(" 2026-10-01T06:30:00 ") == date(2026, 10, 1)
+    assert production.parse_collection_date("01/10/2026") is None
+    assert production.parse_collection_date(None) is None
+    assert production.add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert production.add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+
+@postgresql_only
+def test_new_partition_takes_its_rows_out_of_default(db, make_user, coop_payload):
+    make_user()
+    coop = model.DBCoops(**coop_payload())
+    db.add(coop)
+    db.commit()
+    for day in (date(2031, 3, 5), date(2031, 3, 20), date(2031, 4, 1)):
+        db.add(model.DBCoopDailyProduction(coop_id=coop.id, collection_date=day, location_id=coop.location_id))
+    db.commit()
+
+    def partitions() -> dict:
+        rows = db.execute(text(
+            "SELECT tableoid::regclass::text, count(*) FROM coop_daily_production GROUP BY 1"
+        )).all()
+        # End the read so its lock does not hold up DETACH PARTITION
+        db.commit()
+        return dict(rows)
+
+    assert partitions() == {model.PRODUCTION_DEFAULT_PARTITION: 3}
+
+    run(lambda session: production.ensure_partitions(session, date(2031, 3, 15), 1))
+    assert partitions() == {"coop_daily_production_2031_03": 2, model.PRODUCTION_DEFAULT_PARTITION: 1}
+
+    # March exists now and is left as is; April is created and takes its row
+    run(lambda session: production.ensure_partitions(session, date(2031, 3, 1), 2))
+    assert partitions() == {"coop_daily_production_2031_03": 2, "coop_daily_production_2031_04": 1}
+
+
+@postgresql_only
+def test_partition_job_covers_the_months_around_now(db):
+    asyncio.run(production._partition_job())
+    this_month = model.utc_now().date().replace(day=1)
+    expected = [
+        production.partition_name(production.add_months(this_month, offset))
+        for offset in range(-production.PRODUCTION_PARTITIONS_BEHIND, production.PRODUCTION_PARTITIONS_AHEAD + 1)
+    ]
+    existing = db.execute(text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'coop_daily_production'::regclass"
+    )).scalars().all()
+    assert set(expected) <= set(existing)
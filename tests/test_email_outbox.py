@@ -0,0 +1,135 @@
+import asyncio
+import socket
+from datetime import timedelta
+from email import message_from_bytes
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import database
+from api.auth import model, otp, outbox
+
+
+class Mailbox:
+    """aiosmtpd handler keeping what it accepts; answers 451 while `refuse` > 0"""
+
+    def __init__(self):
+        self.messages = []
+        self.refuse = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.refuse:
+            self.refuse -= 1
+            return "451 4.3.0 Try again later"
+        self.messages.append(message_from_bytes(envelope.content))
+        return "250 OK"
+
+
+@pytest.fixture
+def mailbox(monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    handler = Mailbox()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setattr(otp, "SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setattr(otp, "SMTP_PORT", str(port))
+    monkeypatch.setattr(otp, "SMTP_EMAIL", "farm@example.com")
+    monkeypatch.setattr(otp, "SMTP_PASSWORD", None)
+    monkeypatch.setattr(outbox, "SMTP_STARTTLS", False)
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture
+def sender():
+    worker = outbox.EmailOutboxWorker()
+    yield worker
+    worker.connection.close()
+
+
+def run(coroutine_function, *args):
+    async def call():
+        async with database.AsyncSessionLocal() as db:
+            return await coroutine_function(db, *args)
+    return asyncio.run(call())
+
+
+def enqueue(subject="Your code", body="Your OTP is 123456"):
+    return run(outbox.enqueue_email, subject, body, "ann@example.com").id
+
+
+def test_enqueued_email_is_claimed_sent_and_scrubbed(db, mailbox, sender):
+    message_id = enqueue()
+    assert db.get(model.DBEmailOutbox, message_id).status == "pending"
+
+    claimed = run(sender._claim)
+    assert [message.id for message in claimed] == [message_id]
+    stored = db.get(model.DBEmailOutbox, message_id)
+    # Leased, so another sender cannot pick it up while this one works
+    assert stored.status == "sending" and stored.next_attempt_at > model.utc_now()
+    assert run(sender._claim) == []
+
+    # Once the lease runs out the row is claimable again, as after a crashed sender
+    stored.next_attempt_at = model.utc_now() - timedelta(seconds=1)
+    db.commit()
+    assert asyncio.run(sender.process_batch()) == 1
+
+    db.expire_all()
+    stored = db.get(model.DBEmailOutbox, message_id)
+    assert (stored.status, stored.attempts, stored.body) == ("sent", 1, None)
+    assert stored.sent_at is not None
+    (received,) = mailbox.messages
+    assert received["Subject"] == "Your code" and received["To"] == "ann@example.com"
+    assert "Your OTP is 123456" in received.get_payload()[0].get_payload()
+
+
+def test_smtp_failure_backs_off_then_retries(db, mailbox, sender, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_BACKOFF_SECONDS", 10)
+    message_id = enqueue()
+    mailbox.refuse = 1
+
+    before = model.utc_now()
+    assert asyncio.run(sender.process_batch()) == 1
+    stored = db.get(model.DBEmailOutbox, message_id)
+    assert (stored.status, stored.attempts) == ("pending", 1)
+    assert "451" in stored.last_error and stored.body is not None
+    # First retry waits the base backoff, give or take the 20% jitter
+    assert before + timedelta(seconds=8) <= stored.next_attempt_at <= model.utc_now() + timedelta(seconds=12)
+
+    # Not due yet
+    assert asyncio.run(sender.process_batch()) == 0
+    stored.next_attempt_at = model.utc_now() - timedelta(seconds=1)
+    db.commit()
+    assert asyncio.run(sender.process_batch()) == 1
+
+    db.expire_all()
+    stored = db.get(model.DBEmailOutbox, message_id)
+    assert (stored.status, stored.attempts, stored.last_error) == ("sent", 2, None)
+    assert len(mailbox.messages) == 1
+
+
+def test_email_fails_for_good_after_the_last_attempt(db, mailbox, sender, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    message_id = enqueue()
+    mailbox.refuse = 2
+
+    for _ in range(2):
+        assert asyncio.run(sender.process_batch()) == 1
+        db.expire_all()
+        stored = db.get(model.DBEmailOutbox, message_id)
+        stored.next_attempt_at = model.utc_now() - timedelta(seconds=1)
+        db.commit()
+
+    stored = db.get(model.DBEmailOutbox, message_id)
+    assert (stored.status, stored.attempts, stored.body) == ("failed", 2, None)
+    assert asyncio.run(sender.process_batch()) == 0
+    assert mailbox.messages == []
+
+
+def test_backoff_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(outbox.random, "uniform", lambda low, high: 1.0)
+    delays = [outbox.backoff_seconds(attempts) for attempts in range(1, 10)]
+    assert delays[:4] == [10, 20, 40, 80]
+    assert max(delays) == outbox.OUTBOX_MAX_BACKOFF_SECONDS
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from api.auth import hashing
+
+CONCURRENT_LOGINS = 16
+PASSWORD = "correct horse battery staple"
+
+
+async def login_inline(hashed: str) -> bool:
+    # What login did before: bcrypt on the event loop, one request at a time
+    return hashing._verify(PASSWORD, hashed)
+
+
+async def measure(check, hashed: str) -> float:
+    """Logins per second for CONCURRENT_LOGINS simultaneous password checks"""
+    started = time.perf_counter()
+    results = await asyncio.gather(*(check(hashed) for _ in range(CONCURRENT_LOGINS)))
+    elapsed = time.perf_counter() - started
+    assert all(results)
+    return CONCURRENT_LOGINS / elapsed
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("workers", [0, min(4, os.cpu_count() or 1)])
+def test_login_throughput(workers, monkeypatch):
+    hashed = hashing._hash(PASSWORD)
+    monkeypatch.setattr(hashing, "HASH_WORKERS", workers)
+    monkeypatch.setattr(hashing, "HASH_MAX_PENDING", max(1, workers) * 4)
+
+    async def run():
+        hashing.start()
+        try:
+            # Warm the pool so process start-up is not timed
+            await hashing.verify_password(PASSWORD, hashed)
+            return (
+                await measure(login_inline, hashed),
+                await measure(lambda value: hashing.verify_password(PASSWORD, value), hashed),
+            )
+        finally:
+            hashing.shutdown()
+
+    inline, offloaded = asyncio.run(run())
+    pool = f"process pool ({workers})" if workers else "threads"
+    print(f"\nlogin throughput, {CONCURRENT_LOGINS} concurrent: inline {inline:.1f}/s, {pool} {offloaded:.1f}/s")
@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from api.auth import model
+from query_stats import assert_max_queries
+
+
+def seed_location(db, location, make_user, coop_payload):
+    """A managed location with three users and two coops, one of them with superseded versions"""
+    manager = make_user("mia", role="manager", location_id=location.id)
+    for username in ("ann", "bob"):
+        make_user(username, role="feeder", location_id=location.id)
+    location.manager_id = manager.id
+
+    old = [model.DBCoops(**coop_payload(coop_name="A1", egg_count=count)) for count in (70, 75)]
+    heads = [
+        model.DBCoops(**coop_payload(coop_name="A1", egg_count=80)),
+        model.DBCoops(**coop_payload(coop_name="B1")),
+    ]
+    for coop in old:
+        coop.is_head = False
+    db.add_all(old + heads)
+    db.commit()
+    return manager, heads
+
+
+def test_full_details_takes_two_round_trips(client, db, location, make_user, coop_payload):
+    manager, heads = seed_location(db, location, make_user, coop_payload)
+    url = f"/locations/{location.id}/full-details"
+    manager_name, head_ids = manager.username, sorted(coop.id for coop in heads)
+
+    with assert_max_queries(2):
+        response = client.get(url)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["manager_name"] == manager_name
+    assert sorted(user["username"] for user in body["users"]) == ["ann", "bob", "mia"]
+    assert sorted(coop["id"] for coop in body["coops"]) == head_ids
+
+
+def test_with_users_takes_one_round_trip(client, db, location, make_user, coop_payload):
+    seed_location(db, location, make_user, coop_payload)
+    url = f"/locations/{location.id}/with-users"
+
+    with assert_max_queries(1):
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(response.json()["users"]) == 3
+
+
+def test_missing_location_is_404(client):
+    with assert_max_queries(1):
+        response = client.get("/locations/999/full-details")
+    assert response.status_code == 404
+
+
+def test_coop_listings_show_only_current_versions(client, db, location, make_user, coop_payload):
+    _, heads = seed_location(db, location, make_user, coop_payload)
+    location_id, head_ids = location.id, sorted(coop.id for coop in heads)
+
+    page = client.get(f"/locations/{location_id}/coops")
+    assert page.status_code == 200
+    assert sorted(coop["id"] for coop in page.json()["items"]) == head_ids
+
+    detailed = client.get(f"/locations/{location_id}/with-coops-detailed")
+    assert detailed.status_code == 200
+    assert sorted(coop["id"] for coop in detailed.json()["coops"]) == head_ids
+
+
+def test_summary_page_takes_one_round_trip(client, db, location, make_user, coop_payload, auth_headers):
+    seed_location(db, location, make_user, coop_payload)
+    empty = model.DBLocation(name="South farm", address="2 Road", region="South")
+    inactive = model.DBCoops(**coop_payload(coop_name="C1", status="inactive"))
+    buyers = [
+        model.DBBuyer(name=name, crates_desired=1, date_of_delivery=model.utc_now(), amount=10,
+                      status_of_delivery=status, by="ann", location_id=location.id)
+        for name, status in (("Kofi", "pending"), ("Ama", "pending"), ("Yaw", "delivered"))
+    ]
+    spent = [
+        model.DBExpenditure(amount=amount, reference="feed", user_id=1, location_id=location.id,
+                            category="feed", payment_method="cash", status="paid", approved_by="mia")
+        for amount in (100, 50, 999)
+    ]
+    db.add_all([empty, inactive, *buyers, *spent])
+    db.commit()
+    # Before the start of this month
+    spent[2].created_at = model.utc_now().replace(day=1) - timedelta(days=1)
+    db.commit()
+
+    headers = auth_headers(user_id=2, username="ann")
+    # The first token check loads token versions; keep that out of the count
+    assert client.get("/locations/summary", headers=headers).status_code == 200
+
+    with assert_max_queries(1):
+        response = client.get("/locations/summary", headers=headers)
+
+    assert response.status_code == 200, response.text
+    summaries = {item["name"]: item for item in response.json()["items"]}
+    counts = ("total_coops", "active_coops", "user_count", "pending_buyer_orders", "month_to_date_expenditure")
+    assert [summaries["North farm"][name] for name in counts] == [3, 2, 3, 2, 150]
+    assert [summaries["South farm"][name] for name in counts] == [0, 0, 0, 0, 0]
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from api.auth import audit, model
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    monkeypatch.setattr(audit, "LOGIN_AUDIT_BATCH_SIZE", 3)
+    monkeypatch.setattr(audit, "LOGIN_AUDIT_FLUSH_MS", 10_000)
+    return audit.LoginAuditWriter()
+
+
+def stored(db) -> int:
+    return db.query(model.LoginAttempt).count()
+
+
+async def record(writer, count: int, start: int = 0):
+    for n in range(start, start + count):
+        await writer.record(username=f"user{n}", success=False, ip_address="10.0.0.1")
+
+
+async def wait_for_batches(writer, batches: int):
+    for _ in range(200):
+        if writer.batches >= batches:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_flushes_when_the_batch_fills(db, writer):
+    async def scenario():
+        writer.start()
+        await record(writer, 4)
+        await wait_for_batches(writer, 1)
+        # The fourth row waits for more rows or the flush interval
+        await asyncio.sleep(0.05)
+        assert (writer.batches, writer.written) == (1, 3)
+        assert stored(db) == 3
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert (writer.batches, writer.written, stored(db)) == (2, 4, 4)
+
+
+def test_flushes_after_the_interval(db, writer, monkeypatch):
+    monkeypatch.setattr(audit, "LOGIN_AUDIT_FLUSH_MS", 50)
+
+    async def scenario():
+        writer.start()
+        await record(writer, 1)
+        await wait_for_batches(writer, 1)
+        assert (writer.batches, stored(db)) == (1, 1)
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stop_drains_the_queue(db, writer, monkeypatch):
+    monkeypatch.setattr(audit, "LOGIN_AUDIT_BATCH_SIZE", 100)
+
+    async def scenario():
+        writer.start()
+        await record(writer, 5)
+        assert stored(db) == 0
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert stored(db) == 5
+    assert writer.stats()["running"] is False
+    rows = db.query(model.LoginAttempt).order_by(model.LoginAttempt.id)
+    assert [row.username for row in rows] == [f"user{n}" for n in range(5)]
+
+
+def test_full_queue_blocks_callers_until_the_writer_catches_up(db, writer, monkeypatch):
+    monkeypatch.setattr(audit, "LOGIN_AUDIT_MAX_QUEUE", 2)
+    monkeypatch.setattr(audit, "LOGIN_AUDIT_BATCH_SIZE", 1)
+    write = writer._write
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def slow_write(rows):
+            await gate.wait()
+            await write(rows)
+        monkeypatch.setattr(writer, "_write", slow_write)
+
+        writer.start()
+        # One row is taken by the blocked writer and two fill the queue
+        await record(writer, 3)
+        await asyncio.sleep(0.01)
+        blocked = asyncio.create_task(record(writer, 1, start=3))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        assert writer.stats()["queue_size"] == 2
+
+        gate.set()
+        await asyncio.wait_for(blocked, 1)
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert (writer.written, writer.dropped, stored(db)) == (4, 0, 4)
+
+
+def test_without_a_running_writer_rows_are_written_at_once(db, writer):
+    asyncio.run(record(writer, 2))
+    assert (writer.batches, stored(db)) == (2, 2)
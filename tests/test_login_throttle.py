@@ -0,0 +1,158 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import database
+from api.auth import authutils, model, throttle
+
+
+@pytest.fixture
+def security(monkeypatch):
+    """A login manager allowing 3 failures per username and 5 per address"""
+    monkeypatch.setattr(throttle, "_throttles", [])
+    monkeypatch.setattr(throttle, "LOGIN_MAX_ATTEMPTS_PER_IP", 5)
+    return authutils.LoginSecurityManager(max_attempts=3, lockout_duration_minutes=15, attempt_window_minutes=60)
+
+
+def request(ip_address="10.0.0.1") -> Request:
+    return Request({"type": "http", "headers": [(b"user-agent", b"pytest")], "client": (ip_address, 1234)})
+
+
+def run(steps):
+    """Run `steps(db)` and wait for the lockout writes it queued behind the response"""
+    async def call():
+        async with database.AsyncSessionLocal() as db:
+            result = await steps(db)
+        await throttle.drain()
+        return result
+    return asyncio.run(call())
+
+
+def test_sliding_window_forgets_old_events():
+    window = throttle.SlidingWindow(window_seconds=60, limit=3)
+    assert [window.hit("ann", now) for now in (0, 10, 20)] == [1, 2, 3]
+    # Only the newest `limit` events are kept
+    assert window.hit("ann", 30) == 3
+    assert window.count("ann", 75) == 2
+    assert window.count("ann", 90) == 0
+    assert len(window) == 0
+
+
+def test_sliding_window_bounds_keys_and_prunes():
+    window = throttle.SlidingWindow(window_seconds=60, limit=3, max_keys=2)
+    for key, now in (("ann", 0), ("bob", 1), ("cat", 2)):
+        window.hit(key, now)
+    assert (window.count("ann", 3), window.count("cat", 3)) == (0, 1)
+    window.hit("bob", 50)
+    assert window.prune(now=70) == 1
+    assert (len(window), window.count("bob", 70)) == (1, 1)
+
+
+def test_lockout_at_the_threshold_is_written_through(db, security):
+    async def fail_three_times(session):
+        for attempt in range(1, 3):
+            status = await security.record_failed_attempt(session, "ann", request())
+            assert status == {"failed_attempts": attempt, "attempts_remaining": 3 - attempt}
+        with pytest.raises(HTTPException) as locked:
+            await security.record_failed_attempt(session, "ann", request())
+        assert locked.value.status_code == 429
+
+    run(fail_three_times)
+
+    lockout = db.query(model.AccountLockout).filter_by(username="ann").one()
+    assert lockout.is_active and lockout.failed_attempts == 3
+    assert lockout.unlock_at > model.utc_now() + timedelta(minutes=14)
+    # Without a running audit writer each attempt is written as it happens
+    assert db.query(model.LoginAttempt).filter_by(username="ann", success=False).count() == 3
+
+    async def try_again(session):
+        with pytest.raises(HTTPException) as refused:
+            await security.validate_can_attempt_login(session, "ann", request())
+        return refused.value
+    refused = run(try_again)
+    assert refused.status_code == 429 and refused.detail.startswith("Account is locked")
+
+
+def test_successful_login_clears_the_lockout_row(db, security):
+    async def lock_then_succeed(session):
+        for _ in range(3):
+            try:
+                await security.record_failed_attempt(session, "ann", request())
+            except HTTPException:
+                pass
+        await throttle.drain()
+        await security.record_successful_attempt(session, "ann", request())
+
+    run(lock_then_succeed)
+    assert not db.query(model.AccountLockout).filter_by(username="ann").one().is_active
+    assert security.throttle.lockout("ann") is None
+    assert security.throttle.by_username.count("ann") == 0
+
+
+def test_lockout_expires():
+    login_throttle = throttle.LoginThrottle(max_attempts=3, lockout_duration_minutes=15, attempt_window_minutes=60)
+    throttle._throttles.remove(login_throttle)
+    login_throttle.lock("ann", 3, unlock_at=time.time() + 60)
+    assert login_throttle.lockout("ann") is not None
+    assert login_throttle.lockout("ann", now=time.time() + 61) is None
+
+
+def test_address_is_blocked_across_usernames(security):
+    async def fail_as_many_users(session):
+        for n in range(5):
+            await security.record_failed_attempt(session, f"user{n}", request())
+        with pytest.raises(HTTPException) as blocked:
+            await security.validate_can_attempt_login(session, "user9", request())
+        assert blocked.value.status_code == 429
+        # Another address is unaffected
+        await security.validate_can_attempt_login(session, "user9", request("10.0.0.2"))
+
+    run(fail_as_many_users)
+
+
+def test_state_reloads_on_first_use_after_a_restart(db, security):
+    now = model.utc_now()
+    db.add_all([
+        model.LoginAttempt(username="ann", ip_address="10.0.0.1", attempt_time=now - timedelta(minutes=minutes),
+                           success=False)
+        for minutes in (5, 10, 90)
+    ])
+    db.add(model.AccountLockout(username="bob", locked_at=now, unlock_at=now + timedelta(minutes=10),
+                                failed_attempts=3, is_active=True))
+    db.commit()
+
+    assert not security.throttle.loaded
+
+    async def check(session):
+        return [await security.check_account_status(session, name) for name in ("ann", "bob")]
+
+    ann, bob = run(check)
+    # The attempt from 90 minutes ago is outside the window
+    assert (ann["failed_attempts"], ann["can_attempt"]) == (2, True)
+    assert (bob["is_locked"], bob["failed_attempts"]) == (True, 3)
+
+    # Loaded once; a second check does not count the same rows again
+    ann, _ = run(check)
+    assert ann["failed_attempts"] == 2
+
+
+def test_sync_applies_other_workers_unlocks(db, security):
+    now = model.utc_now()
+    db.add(model.AccountLockout(username="bob", locked_at=now, unlock_at=now + timedelta(minutes=10),
+                                failed_attempts=3, is_active=True))
+    db.commit()
+    asyncio.run(security.throttle.ensure_loaded())
+    assert security.throttle.lockout("bob") is not None
+
+    # Unlocked by an admin through another worker; a lock this worker took since is kept
+    db.query(model.AccountLockout).filter_by(username="bob").one().is_active = False
+    db.commit()
+    security.throttle.lock("cat", 3)
+    asyncio.run(throttle._cleanup_job())
+
+    assert security.throttle.lockout("bob") is None
+    assert security.throttle.lockout("cat") is not None
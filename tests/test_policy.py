@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+from api.auth import authutils, cache, model, policy
+
+METRICS = "/api/v1/admin/metrics/user-cache"
+
+
+@pytest.fixture(autouse=True)
+def fresh_principals():
+    cache.principal_cache.clear()
+    yield
+    cache.principal_cache.clear()
+
+
+def bearer(user) -> dict:
+    return {"Authorization": f"Bearer {authutils.create_access_token(policy.token_claims(user))}"}
+
+
+def test_policy_allows_and_denies_by_role(client, make_user, auth_headers):
+    make_user()
+    assert client.get(METRICS, headers=auth_headers()).status_code == 200
+    response = client.get(METRICS, headers=auth_headers(role="feeder"))
+    assert (response.status_code, response.json()["detail"]) == (403, "Not enough permissions")
+    # Egg counters update coops but may not create them
+    assert client.post("/coops/", headers=auth_headers(role="counter"), json={}).status_code == 403
+
+
+def test_inactive_claims_are_refused():
+    checker = policy.require("metrics:read")
+    claims = policy.Claims(1, "ann", "admin", "inactive", None, 0)
+    with pytest.raises(policy.HTTPException) as refused:
+        checker(claims)
+    assert refused.value.status_code == 400
+    with pytest.raises(KeyError):
+        policy.require("coop:teleport")
+
+
+@pytest.mark.parametrize("field, value, fresh_status", [
+    ("role", "feeder", 403),
+    ("status", "inactive", 400),
+    ("location_id", "location", 200),
+])
+def test_claim_change_invalidates_issued_tokens(field, value, fresh_status, client, db, make_user, location):
+    user = make_user()
+    issued = bearer(user)
+    assert client.get(METRICS, headers=issued).status_code == 200
+
+    setattr(user, field, location.id if value == "location" else value)
+    db.commit()
+    assert user.token_version == 1
+
+    assert client.get(METRICS, headers=issued).status_code == 401
+    # A token carrying the new claims is judged on them
+    assert client.get(METRICS, headers=bearer(user)).status_code == fresh_status
+
+
+def test_other_changes_leave_tokens_valid(client, db, make_user):
+    user = make_user()
+    issued = bearer(user)
+    user.email = "ann@elsewhere.example.com"
+    db.commit()
+    assert user.token_version == 0
+    assert client.get(METRICS, headers=issued).status_code == 200
+
+
+def test_rolled_back_change_does_not_revoke(client, db, make_user):
+    user = make_user()
+    issued = bearer(user)
+    user.role = "feeder"
+    db.flush()
+    db.rollback()
+    assert policy.token_versions.current(user.id) == 0
+    assert client.get(METRICS, headers=issued).status_code == 200
+
+
+def test_bump_from_another_worker_applies_at_the_next_sync(client, db, make_user):
+    user = make_user()
+    issued = bearer(user)
+    assert client.get(METRICS, headers=issued).status_code == 200
+
+    # Written without ORM events, as by another process
+    db.execute(update(model.DBUser).where(model.DBUser.id == user.id).values(token_version=1))
+    db.commit()
+    assert client.get(METRICS, headers=issued).status_code == 200
+
+    asyncio.run(policy._sync_job())
+    assert client.get(METRICS, headers=issued).status_code == 401
+
+
+def test_token_without_version_falls_back_to_the_user_row(client, db, make_user):
+    user = make_user()
+    legacy = {"Authorization": f"Bearer {authutils.create_access_token({'sub': 'ann', 'roles': 'admin'})}"}
+    assert client.get(METRICS, headers=legacy).status_code == 200
+
+    # The row decides, not the role written in the old token
+    user.role = "feeder"
+    db.commit()
+    cache.principal_cache.clear()
+    assert client.get(METRICS, headers=legacy).status_code == 403
+
+    stranger = {"Authorization": f"Bearer {authutils.create_access_token({'sub': 'nobody'})}"}
+    assert client.get(METRICS, headers=stranger).status_code == 401
+
+
+def test_admin_revokes_a_users_tokens(client, db, make_user, auth_headers):
+    make_user()
+    bob = make_user(username="bob")
+    issued = bearer(bob)
+    assert client.get(METRICS, headers=issued).status_code == 200
+
+    response = client.post("/api/v1/admin/revoke-tokens/bob", headers=auth_headers())
+    assert response.status_code == 200, response.text
+    db.expire_all()
+    assert db.get(model.DBUser, bob.id).token_version == 1
+    assert client.get(METRICS, headers=issued).status_code == 401
+    assert client.get(METRICS, headers=bearer(db.get(model.DBUser, bob.id))).status_code == 200
+
+    assert client.post("/api/v1/admin/revoke-tokens/nobody", headers=auth_headers()).status_code == 404
+    cat = make_user(username="cat", role="feeder")
+    feeder = auth_headers(role="feeder", user_id=cat.id, username="cat")
+    assert client.post("/api/v1/admin/revoke-tokens/ann", headers=feeder).status_code == 403
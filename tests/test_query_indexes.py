@@ -0,0 +1,171 @@
+import asyncio
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert
+from sqlalchemy.engine import Engine
+
+import database
+from api.auth import crud as auth_crud, model
+from api.buyer import crud as buyer_crud
+from api.coop import crud as coop_crud
+from api.expenditure import crud as expenditure_crud
+from api.location.crud import LocationCRUD
+from api.pagination import PageParams
+
+ROWS = 300
+USERNAME = "user7"
+
+
+def seed(db):
+    """ROWS rows per table, spread over ten locations, users and categories"""
+    now = datetime.utcnow()
+    db.execute(insert(model.DBLocation), [
+        {"id": n, "name": f"farm {n}", "address": f"{n} Road", "region": "North"} for n in range(1, 11)
+    ])
+    db.execute(insert(model.DBUser), [
+        {"id": n, "username": f"user{n}", "email": f"user{n}@example.com", "password": "",
+         "role": "feeder", "status": "active", "location_id": n % 10 + 1}
+        for n in range(1, ROWS + 1)
+    ])
+    db.execute(insert(model.DBCoops), [
+        {"coop_name": f"C{n % 50}", "user_id": n % 30 + 1, "location_id": n % 10 + 1,
+         "status": "active" if n % 3 else "inactive", "total_fowls": 100, "total_dead_fowls": 0,
+         "total_feed": 10, "egg_count": 80, "collection_date": now.date(), "crates_collected": 2,
+         "remainder_eggs": 20, "broken_eggs": 1, "notes": "", "efficiency": 0.8,
+         "is_head": n > ROWS - 50, "created_at": now - timedelta(minutes=n)}
+        for n in range(1, ROWS + 1)
+    ])
+    db.execute(insert(model.DBBuyer), [
+        {"name": f"buyer {n % 40}", "crates_desired": 5, "date_of_delivery": now, "amount": 100,
+         "location_id": n % 10 + 1, "by": "ann", "created_at": now - timedelta(minutes=n)}
+        for n in range(1, ROWS + 1)
+    ])
+    db.execute(insert(model.DBExpenditure), [
+        {"amount": 50, "reference": f"ref {n}", "category": f"cat {n % 8}", "payment_method": "cash",
+         "status": "approved", "approved_by": "ann", "user_id": n % 30 + 1, "location_id": n % 10 + 1,
+         "created_at": now - timedelta(minutes=n)}
+        for n in range(1, ROWS + 1)
+    ])
+    db.execute(insert(model.LoginAttempt), [
+        {"username": f"user{n % 30}", "success": n % 4 == 0, "attempt_time": now - timedelta(minutes=n)}
+        for n in range(1, ROWS + 1)
+    ])
+    db.execute(insert(model.AccountLockout), [
+        {"username": f"user{n}", "unlock_at": now + timedelta(minutes=n - ROWS // 2), "is_active": n % 2 == 0}
+        for n in range(1, ROWS + 1)
+    ])
+    db.execute(insert(model.DBReset), [
+        {"email": f"user{n}@example.com", "reset_code": f"code{n}", "status": ""} for n in range(1, ROWS + 1)
+    ])
+    db.commit()
+
+
+@pytest.fixture
+def query_plans():
+    """Plan of every statement executed while the fixture is active, as (statement, plan lines)"""
+    plans = []
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if executemany or statement.lstrip().split(None, 1)[0].upper() not in ("SELECT", "WITH", "UPDATE", "DELETE"):
+            return
+        # Run on the statement's own cursor, before the statement itself, so
+        # every driver gets its own parameter style
+        if conn.dialect.name == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            plan = [row[-1] for row in cursor.fetchall()]
+        else:
+            # Tiny tables make a sequential scan cheapest; disabling it shows
+            # whether an index can serve the query at all
+            cursor.execute("SET enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {statement}", parameters)
+            plan = [row[0] for row in cursor.fetchall()]
+        plans.append((statement, plan))
+
+    event.listen(Engine, "before_cursor_execute", explain)
+    try:
+        yield plans
+    finally:
+        event.remove(Engine, "before_cursor_execute", explain)
+
+
+def full_scans(plan, walk=False):
+    """
+    Plan lines that read a whole table, or a whole index unless `walk`:
+    filtered queries must seek, only unfiltered pages may walk an ordered
+    index
+    """
+    if database.engine.dialect.name == "sqlite":
+        pattern = r"SCAN \w+( AS \w+)?" if walk else r"SCAN \w+( AS \w+)?( USING .*)?"
+        return [line for line in plan if re.fullmatch(pattern, line.strip())]
+    scans = [line for line in plan if "Seq Scan" in line]
+    if not walk and not any("Index Cond" in line or "Recheck Cond" in line for line in plan):
+        scans.append("(no index condition)")
+    return scans
+
+
+def page():
+    return PageParams(cursor=None, limit=20)
+
+
+# Lookups on the filters the indexes were added for. Status and role
+# filters are left out: a handful of values each, so an index would not
+# be selective enough to beat a scan
+ASYNC_QUERIES = {
+    "find_by_username": lambda db: auth_crud.find_by_username(USERNAME, db),
+    "find_user_by_username": lambda db: auth_crud.find_user_by_username(USERNAME, db),
+    "find_user_by_email": lambda db: auth_crud.find_user_by_email(f"{USERNAME}@example.com", db),
+    "find_user_by_id": lambda db: auth_crud.find_user_by_id(7, db),
+    "read_users_by_location": lambda db: auth_crud.read_users(db, page(), location_id=3),
+    "check_reset_password_token": lambda db: auth_crud.check_reset_password_token("code7", db),
+    "get_failed_attempts_count": lambda db: auth_crud.LoginAttemptsCRUD.get_failed_attempts_count(
+        db, USERNAME, datetime.utcnow() - timedelta(hours=1)
+    ),
+    "get_recent_attempts": lambda db: auth_crud.LoginAttemptsCRUD.get_recent_attempts(db, USERNAME),
+    "is_account_locked": lambda db: auth_crud.LoginAttemptsCRUD.is_account_locked(db, USERNAME),
+    "unlock_account": lambda db: auth_crud.LoginAttemptsCRUD.unlock_account(db, USERNAME),
+    "cleanup_expired_lockouts": lambda db: auth_crud.LoginAttemptsCRUD.cleanup_expired_lockouts(db),
+    "read_coops": lambda db: coop_crud.read_coops(db, page()),
+    "read_coop_by_id": lambda db: coop_crud.read_coop_by_id(7, db),
+    "read_coop_by_coop_name": lambda db: coop_crud.read_coop_by_coop_name("C7", db),
+    "read_coops_by_location": lambda db: coop_crud.read_coops_by_location(3, db, page()),
+    "read_coop_by_user_id": lambda db: coop_crud.read_coop_by_user_id(7, db),
+    "find_coop_by_user_id": lambda db: coop_crud.find_coop_by_user_id(7, db),
+    "read_buyers": lambda db: buyer_crud.read_buyers(db, page()),
+    "read_buyer_by_location": lambda db: buyer_crud.read_buyer_by_location(3, db, page()),
+    "read_buyer_by_name": lambda db: buyer_crud.read_buyer_by_name("buyer 7", db),
+    "read_expenditures": lambda db: expenditure_crud.read_expenditures(db, page()),
+    "read_expenditure_by_reference": lambda db: expenditure_crud.read_expenditure_by_reference("ref 7", db),
+    "read_expenditures_by_location": lambda db: expenditure_crud.read_expenditures_by_location(3, db, page()),
+    "read_expenditures_by_user": lambda db: expenditure_crud.read_expenditures_by_user(7, db, page()),
+    "read_expenditures_by_category": lambda db: expenditure_crud.read_expenditures_by_category("cat 3", db, page()),
+}
+
+# Unfiltered pages: walking the (created_at, id) index is the plan
+ORDERED_WALKS = {"read_coops", "read_buyers", "read_expenditures"}
+
+SYNC_QUERIES = {
+    "get_users_by_location": lambda db: LocationCRUD.get_users_by_location(db, 3),
+    "get_coops_page_by_location": lambda db: LocationCRUD.get_coops_page_by_location(db, 3, page()),
+    "get_location_with_users": lambda db: LocationCRUD.get_location_with_users(db, 3),
+    "get_location_with_full_details": lambda db: LocationCRUD.get_location_with_full_details(db, 3),
+}
+
+
+async def run_async(query):
+    async with database.AsyncSessionLocal() as db:
+        await query(db)
+
+
+@pytest.mark.parametrize("name", list(ASYNC_QUERIES) + list(SYNC_QUERIES))
+def test_crud_query_uses_an_index(name, db, query_plans):
+    seed(db)
+    if name in ASYNC_QUERIES:
+        asyncio.run(run_async(ASYNC_QUERIES[name]))
+    else:
+        SYNC_QUERIES[name](db)
+
+    assert query_plans, f"{name} issued no query"
+    for statement, plan in query_plans:
+        assert not full_scans(plan, name in ORDERED_WALKS), f"{name} scans a whole table:\n{statement}\n" + "\n".join(plan)
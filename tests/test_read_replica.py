@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from starlette.requests import Request
+
+import database
+from base import Base
+from api.auth import model
+
+
+@pytest.fixture
+def split_databases(tmp_path, monkeypatch):
+    """
+    Rebuild the engines as a primary and a replica on two SQLite files,
+    each holding one location named after its role. Call with
+    `replica_reachable=False` to point the replica at a path that cannot open.
+    """
+    saved = [database.engine, database.async_engine, database.read_engine, database.async_read_engine]
+    monkeypatch.setattr(database, "read_your_writes", database.ReadYourWritesTracker(5))
+    monkeypatch.setattr(database, "_replica_down_until", 0.0)
+
+    def build(replica_reachable: bool = True):
+        for name in ("engine", "async_engine", "read_engine", "async_read_engine"):
+            monkeypatch.setattr(database, name, None)
+        replica_dir = tmp_path if replica_reachable else tmp_path / "missing"
+        database.create_engines(f"sqlite:///{tmp_path}/primary.db", f"sqlite:///{replica_dir}/replica.db")
+        # One event loop per asyncio.run, as in conftest
+        for name, sync_engine, factory in (
+            ("async_engine", database.engine, database.AsyncSessionLocal),
+            ("async_read_engine", database.read_engine, database.AsyncReadSessionLocal),
+        ):
+            async_engine = create_async_engine(database.to_async_url(str(sync_engine.url)), poolclass=NullPool)
+            monkeypatch.setattr(database, name, async_engine)
+            factory.configure(bind=async_engine)
+
+        targets = [("primary", database.engine)] + [("replica", database.read_engine)] * replica_reachable
+        for role, engine in targets:
+            Base.metadata.create_all(engine)
+            with database.SessionLocal(bind=engine) as session:
+                session.add(model.DBLocation(name=role, address="", region=""))
+                session.commit()
+
+    yield build
+
+    database.engine.dispose()
+    database.read_engine.dispose()
+    engine, async_engine, read_engine, async_read_engine = saved
+    database.SessionLocal.configure(bind=engine)
+    database.AsyncSessionLocal.configure(bind=async_engine)
+    database.ReadSessionLocal.configure(bind=read_engine)
+    database.AsyncReadSessionLocal.configure(bind=async_read_engine)
+
+
+def request(token: str) -> Request:
+    return Request({
+        "type": "http",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+        "client": ("10.0.0.1", 1234),
+    })
+
+
+def served_by(session) -> str:
+    return session.scalar(select(model.DBLocation.name).order_by(model.DBLocation.id))
+
+
+def read_from(token: str) -> str:
+    dependency = database.get_read_db(request(token))
+    try:
+        return served_by(next(dependency))
+    finally:
+        dependency.close()
+
+
+async def async_read_from(token: str) -> str:
+    dependency = database.get_async_read_db(request(token))
+    try:
+        session = await anext(dependency)
+        return await session.scalar(select(model.DBLocation.name).order_by(model.DBLocation.id))
+    finally:
+        await dependency.aclose()
+
+
+def test_reads_go_to_the_replica(split_databases):
+    split_databases()
+    assert read_from("ann") == "replica"
+    assert asyncio.run(async_read_from("ann")) == "replica"
+
+
+def test_a_read_right_after_a_write_goes_to_the_primary(split_databases, client):
+    split_databases()
+    writer = {"Authorization": "Bearer writer"}
+    response = client.post("/locations/", headers=writer, json={"name": "South farm", "address": "", "region": ""})
+    assert response.status_code == 201, response.text
+
+    def names(headers):
+        return [item["name"] for item in client.get("/locations/", headers=headers).json()["items"]]
+
+    # The replica has not caught up, so only the writer's read finds the new row
+    assert "South farm" in names(writer)
+    assert names({"Authorization": "Bearer reader"}) == ["replica"]
+    assert read_from("writer") == "primary"
+    assert asyncio.run(async_read_from("writer")) == "primary"
+
+
+def test_async_writes_keep_the_writer_on_the_primary(split_databases):
+    split_databases()
+
+    async def write():
+        dependency = database.get_async_db(request("writer"))
+        session = await anext(dependency)
+        session.add(model.DBLocation(name="South farm", address="", region=""))
+        await session.commit()
+        await dependency.aclose()
+
+    async def read_only():
+        dependency = database.get_async_db(request("reader"))
+        session = await anext(dependency)
+        await session.scalar(select(model.DBLocation.id))
+        await dependency.aclose()
+
+    asyncio.run(write())
+    asyncio.run(read_only())
+    assert asyncio.run(async_read_from("writer")) == "primary"
+    assert asyncio.run(async_read_from("reader")) == "replica"
+
+
+def test_unreachable_replica_falls_back_to_the_primary(split_databases):
+    split_databases(replica_reachable=False)
+    assert read_from("ann") == "primary"
+    assert database._replica_down_until > 0
+    # Skipped for a while afterwards, for async reads too
+    assert asyncio.run(async_read_from("bob")) == "primary"
+
+
+def test_without_a_replica_reads_use_the_primary_engine(split_databases, monkeypatch, tmp_path):
+    for name in ("engine", "async_engine", "read_engine", "async_read_engine"):
+        monkeypatch.setattr(database, name, None)
+    database.create_engines(f"sqlite:///{tmp_path}/only.db", None)
+    assert database.read_engine is database.engine
+    assert database.async_read_engine is database.async_engine
+    assert not database._use_replica(request("ann"))
+
+
+def test_tracker_forgets_writers_after_the_window(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(database.time, "monotonic", lambda: now[0])
+    tracker = database.ReadYourWritesTracker(window_seconds=5)
+
+    tracker.mark("ann")
+    assert tracker.wrote_recently("ann") and not tracker.wrote_recently("bob")
+    now[0] += 4.9
+    assert tracker.wrote_recently("ann")
+    now[0] += 0.2
+    assert not tracker.wrote_recently("ann")
+
+
+def test_tracker_is_bounded_and_can_be_disabled():
+    tracker = database.ReadYourWritesTracker(window_seconds=5, max_clients=2)
+    for key in ("ann", "bob", "cat"):
+        tracker.mark(key)
+    # The oldest writer is dropped first
+    assert [tracker.wrote_recently(key) for key in ("ann", "bob", "cat")] == [False, True, True]
+
+    disabled = database.ReadYourWritesTracker(window_seconds=0)
+    disabled.mark("ann")
+    assert not disabled.wrote_recently("ann")
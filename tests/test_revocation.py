@@ -0,0 +1,114 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+import database
+from api.auth import crud, model, revocation
+
+
+@pytest.fixture(autouse=True)
+def revocation_filter(monkeypatch):
+    fresh = revocation.RevocationFilter()
+    monkeypatch.setattr(revocation, "revocation_filter", fresh)
+    return fresh
+
+
+def run(coroutine_function, *args):
+    async def call():
+        async with database.AsyncSessionLocal() as db:
+            return await coroutine_function(*args, db)
+    return asyncio.run(call())
+
+
+def store(db, *jtis, expires_in=timedelta(hours=1)):
+    expires_at = model.utc_now() + expires_in if expires_in is not None else None
+    db.add_all(model.DBBlacklistedToken(jti, expires_at) for jti in jtis)
+    db.commit()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = revocation.BloomFilter(capacity=5000, error_rate=0.01)
+    added = [f"revoked-{n}" for n in range(5000)]
+    for jti in added:
+        bloom.add(jti)
+    assert all(jti in bloom for jti in added)
+
+    false_positives = sum(f"live-{n}" in bloom for n in range(20000))
+    assert false_positives < 20000 * 0.01 * 2
+
+    # An item whose bits are all set already is not counted again
+    count = bloom.count
+    bloom.add(added[0])
+    assert bloom.count == count <= 5000
+
+
+def test_filter_treats_everything_as_revoked_until_built(revocation_filter):
+    assert not revocation_filter.ready
+    assert revocation_filter.might_be_revoked("anything")
+    assert revocation_filter.negatives == 0
+
+
+def test_start_loads_unexpired_revocations(db, revocation_filter):
+    store(db, "old", expires_in=timedelta(hours=-1))
+    store(db, "live-1", "live-2")
+    store(db, "no-expiry", expires_in=None)
+
+    asyncio.run(revocation.start())
+
+    assert revocation_filter.ready
+    assert all(revocation_filter.might_be_revoked(jti) for jti in ("live-1", "live-2", "no-expiry"))
+    assert not revocation_filter.might_be_revoked("old")
+    assert not revocation_filter.might_be_revoked("never-revoked")
+
+
+def test_sync_picks_up_other_workers_revocations(db, revocation_filter):
+    store(db, "first")
+    run(revocation_filter.rebuild)
+    # Committed by another process: nothing added it to this filter
+    store(db, "second")
+    assert not revocation_filter.might_be_revoked("second")
+
+    run(revocation_filter.sync)
+    assert revocation_filter.might_be_revoked("second")
+    assert revocation_filter.might_be_revoked("first")
+
+
+def test_sync_rebuilds_a_filter_past_capacity(db, revocation_filter, monkeypatch):
+    monkeypatch.setattr(revocation, "REVOCATION_BLOOM_CAPACITY", 2)
+    run(revocation_filter.rebuild)
+    assert revocation_filter.stats()["capacity"] == 2
+
+    store(db, "a", "b", "c")
+    run(revocation_filter.sync)
+    assert revocation_filter.stats()["entries"] == 3
+    # Over capacity, so the next sync sizes a new filter to the table
+    run(revocation_filter.sync)
+    assert revocation_filter.stats()["capacity"] == 6
+    assert all(revocation_filter.might_be_revoked(jti) for jti in "abc")
+
+
+def test_prune_deletes_expired_rows_and_rebuilds(db, revocation_filter):
+    store(db, "expired-1", "expired-2", expires_in=timedelta(seconds=-1))
+    store(db, "live")
+    run(revocation_filter.rebuild)
+    # As when they were revoked in this process
+    for jti in ("expired-1", "expired-2"):
+        revocation_filter.add(jti)
+    assert revocation_filter.might_be_revoked("expired-1")
+
+    asyncio.run(revocation._prune_job())
+
+    assert [row.jti for row in db.query(model.DBBlacklistedToken)] == ["live"]
+    assert not revocation_filter.might_be_revoked("expired-1")
+    assert revocation_filter.might_be_revoked("live")
+
+
+def test_revoked_jti_is_blacklisted(db, revocation_filter):
+    run(revocation_filter.rebuild)
+    assert not run(crud.is_jti_blacklisted, "token-1")
+    assert revocation_filter.negatives == 1
+
+    run(crud.revoke_jti, model.DBBlacklistedToken("token-1", model.utc_now() + timedelta(hours=1)))
+    assert run(crud.is_jti_blacklisted, "token-1")
+    assert not run(crud.is_jti_blacklisted, "token-2")
@@ -0,0 +1,35 @@
+import timeit
+
+import pytest
+
+from api.auth import authutils, cache
+
+REQUESTS = 20_000
+
+
+@pytest.mark.benchmark
+def test_decode_cost_per_request(auth_headers):
+    token = auth_headers()["Authorization"].split()[1]
+    cache.token_cache.clear()
+    # Other distinct tokens only ever miss: their cost is the decode plus a put
+    misses = [auth_headers(user_id=n)["Authorization"].split()[1] for n in range(REQUESTS // 10)]
+
+    def raw():
+        authutils.jwt.decode(token, authutils.SECRET_KEY, algorithms=[authutils.ALGORITHM])
+
+    def cached():
+        authutils.decode_access_token(token)
+
+    assert authutils.decode_access_token(token) == authutils.jwt.decode(
+        token, authutils.SECRET_KEY, algorithms=[authutils.ALGORITHM]
+    )
+    raw_us = timeit.timeit(raw, number=REQUESTS) / REQUESTS * 1e6
+    cached_us = timeit.timeit(cached, number=REQUESTS) / REQUESTS * 1e6
+    miss_us = timeit.timeit(lambda: [authutils.decode_access_token(t) for t in misses], number=1) / len(misses) * 1e6
+    cache.token_cache.clear()
+
+    print(
+        f"\ndecode per request: jwt.decode {raw_us:.1f} us, "
+        f"cache hit {cached_us:.1f} us, cache miss {miss_us:.1f} us"
+    )
+    assert cached_us < raw_us